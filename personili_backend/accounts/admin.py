@@ -1,5 +1,5 @@
 from django.contrib import admin
-from accounts.models import Account, AccountProfile, ActionToken, DeliveryAddress, PaymentMethod, Feedback, AccountBlacklist, Wallet, Transaction, Role, Permission
+from accounts.models import Account, AccountProfile, ActionToken, DeliveryAddress, PaymentMethod, Feedback, AccountBlacklist, Wallet, Transaction, Role, Permission, GemLedgerEntry
 
 # Add all usermanagement app models to admin site
 admin.site.register(Account)
@@ -13,5 +13,6 @@ admin.site.register(Feedback)
 admin.site.register(AccountBlacklist)
 admin.site.register(Wallet)
 admin.site.register(Transaction)
+admin.site.register(GemLedgerEntry)
 
 
@@ -20,7 +20,7 @@ def create_main_account_sign_up_response(account: Account, AccountProfile: Accou
                 'phone_number': AccountProfile.phone_number,
                 'age': AccountProfile.age,
                 'gender': AccountProfile.gender,
-                'profile_picture_url': s3_engine.generate_presigned_s3_url(AccountProfile.profile_picture_path),
+                'profile_picture_url': s3_engine.sign(AccountProfile.profile_picture_path),
                 'access_token': create_access_token(str(account.id)),
                 'refresh_token': create_refresh_token(str(account.id))
             }
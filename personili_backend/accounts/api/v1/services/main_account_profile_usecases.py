@@ -1,6 +1,9 @@
 # Typing
 from typing import Optional, Tuple, Union
 
+# Django
+from django.db import transaction
+
 # Models
 from accounts.models import AccountProfile, Account, AccountBlacklist, DeliveryAddress
 
@@ -11,6 +14,8 @@ from rest_framework.response import Response
 
 # AWS
 from utils.aws.storage.s3_engine import s3_engine
+from utils.aws.storage.async_s3_engine import async_s3_engine
+from utils.images.derivatives import derivative_or_original, derivative_paths, PROFILE_PICTURE_SIZE
 
 ################### ACCOUNT AND ACCOUNT PROFILE VERIFICATION #####################
 def verify_account_and_account_profile(account_id: str, account_profile_id: str) -> Union[Tuple[Tuple[Account, AccountProfile],bool], Tuple[Response, bool]]:
@@ -103,7 +108,9 @@ def get_main_account_personal_information(account_id: str, account_profile_id: s
         "gender": account_profile.gender,
         "social_media_links": account_profile.social_media_links,
         "biography": account_profile.biography,
-        "profile_picture_url": s3_engine.generate_presigned_s3_url(account_profile.profile_picture_path) if account_profile.profile_picture_path else None,
+        "profile_picture_url": s3_engine.sign(derivative_or_original(account_profile.profile_picture_path,
+                                                                    account_profile.has_profile_picture_derivatives,
+                                                                    size=PROFILE_PICTURE_SIZE)),
     }
 
     return Response(personal_info, status=status.HTTP_200_OK)
@@ -130,12 +137,15 @@ def update_main_account_personal_information(account_id: str, account_profile_id
     account_profile.biography = updated_personal_info.get("biography")
     account_profile.social_media_links = updated_personal_info.get("social_media_links")
     account_profile.phone_number = updated_personal_info.get("phone_number")
-    # First delete the old profile picture
-    if account_profile.profile_picture_path:
-        s3_engine.delete_file_from_s3(account_profile.profile_picture_path)
-    # Upload the new profile picture
+    # The old profile picture and its derivatives are deleted once the profile pointing at the new one is committed
+    old_picture_paths = [account_profile.profile_picture_path, *derivative_paths(account_profile.profile_picture_path)] if account_profile.profile_picture_path else []
     if updated_personal_info.get("profile_picture"):
-        account_profile.profile_picture_path = s3_engine.upload_file_to_s3(updated_personal_info.get("profile_picture"), "regular_user_profile", {"regular_user_profile_id": account.id, "regular_user_email": account_profile.id})
+        account_profile.profile_picture_path = async_s3_engine.replace_sync(old_picture_paths, updated_personal_info.get("profile_picture"), "regular_user_profile", {"regular_user_profile_id": account.id, "regular_user_email": account_profile.id})
+        # The derivatives of the new picture are generated once the profile is saved, even if it kept the same path
+        account_profile.has_profile_picture_derivatives = False
+    elif old_picture_paths:
+        transaction.on_commit(lambda: s3_engine.delete_files_from_s3(old_picture_paths))
+        account_profile.profile_picture_path = None
     account_profile.save()
 
     return Response({"message": "Personal information updated successfully"}, status=status.HTTP_200_OK)
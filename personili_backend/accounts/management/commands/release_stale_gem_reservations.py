@@ -0,0 +1,15 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from accounts.models import GemLedgerEntry
+
+class Command(BaseCommand):
+    help = 'Release the gem reservations which were never committed nor released, except those of the AI generation jobs still in progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=60,
+                            help='Only release the reservations older than this number of minutes')
+
+    def handle(self, *args, **kwargs):
+        released = GemLedgerEntry.release_stale(timedelta(minutes=kwargs['older_than_minutes']))
+        self.stdout.write(self.style.SUCCESS(f'Successfully released {released} stale gem reservations'))
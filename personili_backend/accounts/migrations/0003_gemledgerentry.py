@@ -0,0 +1,52 @@
+# Generated by Django 5.0 on 2026-10-17 23:40
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0002_accountprofile_personili_gems"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GemLedgerEntry",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("amount", models.IntegerField()),
+                ("reason", models.CharField(choices=[("ai_generation", "AI generation")], max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("reserved", "Reserved"), ("committed", "Committed"), ("released", "Released")],
+                        default="reserved",
+                        max_length=255,
+                    ),
+                ),
+                ("settled_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "account_profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="gem_ledger_entries",
+                        to="accounts.accountprofile",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "gem_ledger_entries",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "reserved")),
+                        fields=["account_profile", "reason"],
+                        name="gem_ledger_reserved_idx",
+                    )
+                ],
+            },
+        ),
+    ]
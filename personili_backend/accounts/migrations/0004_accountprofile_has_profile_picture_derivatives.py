@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_gemledgerentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="accountprofile",
+            name="has_profile_picture_derivatives",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from datetime import UTC, datetime, timedelta
 from typing import Tuple, List, Optional
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from uuid import uuid4
 
@@ -135,6 +138,8 @@ class AccountProfile(TimeStampedModel):
     last_name = models.CharField(max_length=255, null=True, blank=True)
     username = models.CharField(max_length=255, null=True, blank=True)
     profile_picture_path = models.CharField(max_length=255, null=True, blank=True)
+    # The thumbnails and WebP variants of the profile picture were generated (see utils/images/pipeline.py)
+    has_profile_picture_derivatives = models.BooleanField(default=False)
     phone_number = models.CharField(max_length=255, null=True, blank=True)
     gender = models.CharField(max_length=15, choices=GENDER_CHOICES, default='not specified', null=True, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
@@ -151,6 +156,125 @@ class AccountProfile(TimeStampedModel):
         return str(self.id) + " - " + self.account.email
 
 
+#########################################
+#           Gem ledger model            #
+#########################################
+class InsufficientGemsError(ValueError):
+    """
+    The account doesn't have enough personili gems for the operation
+    """
+
+
+class GemReservationLimitError(ValueError):
+    """
+    The account already has the maximum number of operations in flight for this reason
+    """
+
+
+class GemLedgerEntry(TimeStampedModel):
+    """
+    Gem ledger, every spending of personili gems goes through a reservation :
+    - reserve : the gems are taken from the profile balance with a single conditional update and the entry is created as reserved
+    - commit : the operation succeeded, the gems are definitely spent
+    - release : the operation failed, the gems go back to the profile balance
+    The reserved entries of an account are its operations in flight, their number can be capped per reason.
+    """
+    ## Reasons
+    AI_GENERATION = "ai_generation"
+    REASONS = [
+        (AI_GENERATION, 'AI generation'),
+    ]
+
+    ## Status choices
+    RESERVED = "reserved"
+    COMMITTED = "committed"
+    RELEASED = "released"
+    STATUS = [
+        (RESERVED, 'Reserved'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    account_profile = models.ForeignKey(AccountProfile, on_delete=models.CASCADE, related_name='gem_ledger_entries')
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=255, choices=REASONS)
+    status = models.CharField(max_length=255, choices=STATUS, default=RESERVED)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'gem_ledger_entries'
+        indexes = [
+            # Operations in flight of an account
+            models.Index(fields=['account_profile', 'reason'], name='gem_ledger_reserved_idx',
+                         condition=models.Q(status='reserved')),
+        ]
+
+    def __str__(self) -> str:
+        return str(self.account_profile_id) + " - " + self.reason + " - " + str(self.amount) + " - " + self.status
+
+    @classmethod
+    def reserve(cls, account_profile_id: str, amount: int, reason: str, max_in_flight: Optional[int] = None) -> "GemLedgerEntry":
+        """
+        Reserve gems of an account profile and return the reserved ledger entry.
+        The balance is checked and decremented by the same UPDATE, which also locks the profile row until the transaction ends,
+        so the concurrent reservations of an account are serialized and can't spend the same gems or exceed max_in_flight.
+        Raises an InsufficientGemsError if the balance is too low and a GemReservationLimitError if the account already has
+        max_in_flight reservations for this reason
+        """
+        with transaction.atomic():
+            reserved = (AccountProfile.objects.filter(id=account_profile_id, personili_gems__gte=amount)
+                        .update(personili_gems=F('personili_gems') - amount))
+            if not reserved:
+                raise InsufficientGemsError("Insufficient personili_gems balance")
+
+            # Raising rolls back the balance update
+            if max_in_flight is not None and cls.objects.filter(account_profile_id=account_profile_id,
+                                                                reason=reason,
+                                                                status=cls.RESERVED).count() >= max_in_flight:
+                raise GemReservationLimitError("Too many operations in flight")
+
+            return cls.objects.create(account_profile_id=account_profile_id, amount=amount, reason=reason)
+
+    @classmethod
+    def commit(cls, entry_id: str) -> bool:
+        """
+        Definitely spend the gems of a reservation, returns False if the entry isn't reserved anymore
+        """
+        return bool(cls.objects.filter(id=entry_id, status=cls.RESERVED)
+                    .update(status=cls.COMMITTED, settled_at=timezone.now(), updated_at=timezone.now()))
+
+    @classmethod
+    def release(cls, entry_id: str) -> bool:
+        """
+        Give the gems of a reservation back to the account profile, returns False if the entry isn't reserved anymore.
+        The status transition guards the refund, a reservation can only be refunded once
+        """
+        with transaction.atomic():
+            entry = cls.objects.filter(id=entry_id, status=cls.RESERVED).values('account_profile_id', 'amount').first()
+            if entry is None:
+                return False
+            released = (cls.objects.filter(id=entry_id, status=cls.RESERVED)
+                        .update(status=cls.RELEASED, settled_at=timezone.now(), updated_at=timezone.now()))
+            if not released:
+                return False
+            AccountProfile.objects.filter(id=entry['account_profile_id']).update(personili_gems=F('personili_gems') + entry['amount'])
+            return True
+
+    @classmethod
+    def release_stale(cls, older_than: timedelta) -> int:
+        """
+        Release the reservations older than older_than, left behind by operations which never settled, and return their number.
+        The reservations of the AI generation jobs which are still pending or running are kept : a slow job can still succeed
+        and spend them. The jobs lost by a killed worker are failed (and their gems released) by the fail_stuck_ai_generation_jobs command
+        """
+        AiGenerationJob = apps.get_model('designs', 'AiGenerationJob')
+        stale_ids = (cls.objects.filter(status=cls.RESERVED, created_at__lt=timezone.now() - older_than)
+                     .exclude(ai_generation_job__status__in=[AiGenerationJob.PENDING, AiGenerationJob.RUNNING])
+                     .values_list('id', flat=True))
+        return sum(cls.release(entry_id) for entry_id in list(stale_ids))
+
+
 class ActionToken(TimeStampedModel):
     """
     This model will store tokens that are used for password reset, email verification, etc.
@@ -0,0 +1,11 @@
+# Models
+from accounts.models import AccountProfile
+
+# Utils
+from utils.images.pipeline import track_image_derivatives
+
+
+#########################################
+#     Image derivatives generation      #
+#########################################
+track_image_derivatives(AccountProfile, 'profile_picture_path', 'has_profile_picture_derivatives')
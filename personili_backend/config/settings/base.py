@@ -26,10 +26,42 @@ AWS_ACCESS_KEY_ID = env.str("AWS_ACCESS_KEY_ID", None)
 AWS_SECRET_ACCESS_KEY = env.str("AWS_SECRET_ACCESS_KEY", None)
 AWS_S3_SIGNATURE_VERSION = env.str("AWS_S3_SIGNATURE_VERSION", None)
 AWS_S3_REGION_NAME = env.str("AWS_S3_REGION_NAME", None)
+# Time (in seconds) before the expiry of the STS credentials at which they are refreshed in the background
+AWS_STS_REFRESH_MARGIN = env.int("AWS_STS_REFRESH_MARGIN", default=5 * 60)
+# Duration (in seconds) of the time buckets of the presigned URLs, the same URL is returned for an object until the bucket rolls over.
+# The URLs are signed with the STS credentials : it's clamped to STS_SESSION_VALIDITY_DURATION
+AWS_S3_SIGNED_URL_BUCKET_DURATION = env.int("AWS_S3_SIGNED_URL_BUCKET_DURATION", default=60 * 60)
+# Base URL (CDN or bucket) of the public assets (platform images, organizations profiles, previews), served without signature.
+# The public prefixes have to be readable through this URL, when it's not set every object is signed
+AWS_S3_PUBLIC_BASE_URL = env.str("AWS_S3_PUBLIC_BASE_URL", None)
+# S3 uploads : size (in bytes) from which a file is sent with a multipart upload, size of the parts (at least 5MB)
+# and number of parts uploaded concurrently for a file
+AWS_S3_MULTIPART_THRESHOLD = env.int("AWS_S3_MULTIPART_THRESHOLD", default=8 * 1024 * 1024)
+AWS_S3_MULTIPART_CHUNKSIZE = env.int("AWS_S3_MULTIPART_CHUNKSIZE", default=8 * 1024 * 1024)
+AWS_S3_MAX_CONCURRENCY = env.int("AWS_S3_MAX_CONCURRENCY", default=4)
+# Number of files uploaded in parallel by S3Engine.put_many
+AWS_S3_PUT_MANY_WORKERS = env.int("AWS_S3_PUT_MANY_WORKERS", default=8)
+# Number of threads running the S3 calls awaited by the async code (utils/aws/storage/async_s3_engine.py)
+AWS_S3_ASYNC_WORKERS = env.int("AWS_S3_ASYNC_WORKERS", default=16)
+# Number of processes of each web worker resizing and encoding the images derivatives (thumbnails, WebP variants)
+IMAGE_DERIVATIVES_PROCESSES = env.int("IMAGE_DERIVATIVES_PROCESSES", default=2)
 
 
 # stability api key
 STABILITY_API_KEY = env.str("STABILITY_API_KEY", None)
+# Number of background workers running the AI generation jobs in each process
+AI_GENERATION_WORKERS = env.int("AI_GENERATION_WORKERS", default=4)
+# Maximum number of AI generations an account can have in flight (gems reserved and not settled yet)
+AI_GENERATION_MAX_IN_FLIGHT_PER_ACCOUNT = env.int("AI_GENERATION_MAX_IN_FLIGHT_PER_ACCOUNT", default=2)
+# Number of days the fixed seed AI generations are served from the cache, the bucket lifecycle deletes the cached images a day later
+# (manage.py purge_ai_generation_cache --configure-lifecycle)
+AI_GENERATION_CACHE_TTL_DAYS = env.int("AI_GENERATION_CACHE_TTL_DAYS", default=30)
+# Outbound HTTP client (utils/http/client.py) : timeouts in seconds, retries of the refused / failed calls and keep-alive pool size per host
+HTTP_CLIENT_CONNECT_TIMEOUT = env.float("HTTP_CLIENT_CONNECT_TIMEOUT", default=5)
+HTTP_CLIENT_READ_TIMEOUT = env.float("HTTP_CLIENT_READ_TIMEOUT", default=60)
+HTTP_CLIENT_MAX_RETRIES = env.int("HTTP_CLIENT_MAX_RETRIES", default=2)
+HTTP_CLIENT_BACKOFF_FACTOR = env.float("HTTP_CLIENT_BACKOFF_FACTOR", default=0.5)
+HTTP_CLIENT_POOL_MAXSIZE = env.int("HTTP_CLIENT_POOL_MAXSIZE", default=10)
 
 # Local time zone. Choices are
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
@@ -74,6 +106,7 @@ DJANGO_APPS = [
     "django.contrib.staticfiles",
     # "django.contrib.humanize", # Handy template tags
     "django.contrib.admin",
+    "django.contrib.postgres",
     "django.forms",
 ]
 THIRD_PARTY_APPS = [
@@ -349,3 +382,8 @@ WEBPACK_LOADER = {
 APPEND_SLASH=True
 
 
+
+# CATALOG CACHE
+# ------------------------------------------------------------------------------
+# Time to live (in seconds) of the cached catalog pages, pages are also evicted as soon as an object they touch changes
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", default=120)
@@ -1,13 +1,83 @@
+# Standard imports
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs
+
+# Django
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Authentication
+from security.authentication.jwt_authentication_class import jwt_authentication
+
+
+#########################################
+#     Connected accounts registry       #
+#########################################
+# Websockets of the accounts connected to this process, by account id : (event loop, send) of each connection
+_connections: dict[str, set] = {}
+_connections_lock = threading.Lock()
+
+
+def register_connection(account_id, loop, send):
+    with _connections_lock:
+        _connections.setdefault(str(account_id), set()).add((loop, send))
+
+
+def unregister_connection(account_id, loop, send):
+    with _connections_lock:
+        connections = _connections.get(str(account_id), set())
+        connections.discard((loop, send))
+        if not connections:
+            _connections.pop(str(account_id), None)
+
+
+def notify_account(account_id, event: dict):
+    """
+    Push an event to the websockets of an account, it can be called from any thread (e.g. the background workers).
+    Only the websockets connected to this process receive the event, the clients connected elsewhere get the result by polling.
+    """
+    with _connections_lock:
+        connections = list(_connections.get(str(account_id), ()))
+    message = {"type": "websocket.send", "text": json.dumps(event, cls=DjangoJSONEncoder)}
+    for loop, send in connections:
+        try:
+            asyncio.run_coroutine_threadsafe(send(message), loop)
+        except RuntimeError:
+            # The event loop of the connection is closed
+            unregister_connection(account_id, loop, send)
+
+
+#########################################
+#     Websocket application             #
+#########################################
 async def websocket_application(scope, receive, send):
-    while True:
-        event = await receive()
+    loop = asyncio.get_running_loop()
+    account = None
+    try:
+        while True:
+            event = await receive()
 
-        if event["type"] == "websocket.connect":
-            await send({"type": "websocket.accept"})
+            if event["type"] == "websocket.connect":
+                # The browsers can't set headers on websockets, the access token is passed in the query string.
+                # Anonymous websockets are still accepted, they just don't receive any event
+                token = parse_qs(scope.get("query_string", b"").decode("utf-8")).get("token", [None])[0]
+                if token:
+                    try:
+                        account = await sync_to_async(jwt_authentication.authenticate_token)(token)
+                    except Exception:
+                        account = None
+                await send({"type": "websocket.accept"})
+                if account:
+                    register_connection(account.id, loop, send)
 
-        if event["type"] == "websocket.disconnect":
-            break
+            if event["type"] == "websocket.disconnect":
+                break
 
-        if event["type"] == "websocket.receive":
-            if event["text"] == "ping":
-                await send({"type": "websocket.send", "text": "pong!"})
+            if event["type"] == "websocket.receive":
+                if event["text"] == "ping":
+                    await send({"type": "websocket.send", "text": "pong!"})
+    finally:
+        if account:
+            unregister_connection(account.id, loop, send)
@@ -1,12 +1,22 @@
-from designs.models import Design
-from accounts.models import AccountProfile, Account
+from designs.models import Design, AiGenerationJob, AiGenerationCacheEntry
+from accounts.models import Account, GemLedgerEntry
 
 # Settings
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
 from utils.aws.storage.s3_engine import s3_engine
+from config.websocket import notify_account
+from utils.http.client import http_client
+from utils.images.pipeline import schedule_image_derivatives
 
 # Standard Library
-import requests
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from uuid import uuid4 
 #######################  DESIGNS MANAGEMENT  #######################
 
@@ -73,33 +83,33 @@ def send_generation_request(
         "Authorization": f"Bearer {settings.STABILITY_API_KEY}"
     }
 
-    # Encode parameters
-    files = {}
+    # Encode parameters, the opened files are closed once the request is sent
     image = params.pop("image", None)
     mask = params.pop("mask", None)
-    if image is not None and image != '':
-        files["image"] = open(image, 'rb')
-    if mask is not None and mask != '':
-        files["mask"] = open(mask, 'rb')
-    if len(files)==0:
-        files["none"] = ''
-
-    # Send request
-    print(f"Sending REST request to {host}...")
-    response = requests.post(
-        host,
-        headers=headers,
-        files=files,
-        data=params
-    )
+    with ExitStack() as stack:
+        files = {}
+        if image is not None and image != '':
+            files["image"] = stack.enter_context(open(image, 'rb'))
+        if mask is not None and mask != '':
+            files["mask"] = stack.enter_context(open(mask, 'rb'))
+        if len(files)==0:
+            files["none"] = ''
+
+        # Send request through the pooled client (keep-alive connections, timeouts and retries)
+        logging.info(f"Sending REST request to {host}...")
+        response = http_client.post(
+            host,
+            headers=headers,
+            files=files,
+            data=params
+        )
     if not response.ok:
         raise Exception(f"HTTP {response.status_code}: {response.text}")
 
     return response
 
 
-def generate_ai_design_with_stability(account_profile_id: str, 
-                                      for_store: bool = False, 
+def validate_ai_generation_parameters(for_store: bool = False, 
                                       for_user: bool = False, 
                                       for_workshop: bool = False,
                                       prompt: str=None,
@@ -110,15 +120,13 @@ def generate_ai_design_with_stability(account_profile_id: str,
                                       output_format: str="jpeg",
                                       mode: str="text-to-image",
                                       sd3_model: str="",
-                                      style_preset: str="3d-model") -> str:
+                                      style_preset: str="3d-model") -> dict:
     """
-    This function generates an AI design with the specified stability model
+    This function validates the parameters of an AI generation and returns the parameters of the stability request,
+    it raises a ValueError if they're not valid
     """
-    # First validate the parameters
-    if not account_profile_id:
-        raise ValueError("Account Profile ID is required")
-    
-    if stability_model not in STABILITY_MODELS_CREDIT_MAPPING:
+    # Only the models with a gems cost and a list of parameters can be used
+    if stability_model not in STABILITY_MODELS_CREDIT_MAPPING or not {"gems_cost", "params"} <= STABILITY_MODELS_CREDIT_MAPPING[stability_model].keys():
         raise ValueError("Invalid stability model")
     
     # With XOR test that only one of the flags is set
@@ -140,7 +148,6 @@ def generate_ai_design_with_stability(account_profile_id: str,
     
     # Construct arguments dict
     args = {
-        "account_profile_id": account_profile_id,
         "for_store": for_store,
         "for_user": for_user,
         "for_workshop": for_workshop,
@@ -154,18 +161,6 @@ def generate_ai_design_with_stability(account_profile_id: str,
         "sd3_model": sd3_model,
         "style_preset": style_preset
     }
-    
-    # Get the account personili_gems balance
-    available_gems: int = AccountProfile.objects.get(id=account_profile_id).personili_gems
-
-    # Get the credit cost of the stability model
-    credit_cost = STABILITY_MODELS_CREDIT_MAPPING[stability_model]["credit_per_image"]
-    # Get the gems cost of the stability model
-    gems_cost = STABILITY_MODELS_CREDIT_MAPPING[stability_model]["gems_cost"]
-
-    # Check if the user has enough personili_gems
-    if available_gems < gems_cost:
-        raise ValueError("Insufficient personili_gems balance")
 
     # Get the list of parameters for the stability model
     params_list = STABILITY_MODELS_CREDIT_MAPPING[stability_model]["params"]
@@ -174,41 +169,177 @@ def generate_ai_design_with_stability(account_profile_id: str,
     for param in params_list:
         if args[param]:
             params[param] = args[param]
-    
+    return params
+
+
+def enqueue_ai_design_generation(account_profile_id: str, stability_model: str = "SDXL 1.0", **kwargs) -> AiGenerationJob:
+    """
+    This function validates an AI generation, reserves its gems and creates the generation job.
+    The job is handed to the background workers once the transaction is committed, the request returns right away.
+    Raises a ValueError if the parameters are not valid, an InsufficientGemsError if the account can't afford the generation
+    and a GemReservationLimitError if the account already has the maximum number of generations in flight
+    """
+    if not account_profile_id:
+        raise ValueError("Account Profile ID is required")
+    params = validate_ai_generation_parameters(stability_model=stability_model, **kwargs)
+
+    # Get the gems cost of the stability model
+    gems_cost = STABILITY_MODELS_CREDIT_MAPPING[stability_model]["gems_cost"]
+
+    with transaction.atomic():
+        # The gems stay reserved in the ledger until the generation settles, the reserved generations of an account are capped
+        # so a single user can't take all the workers and outbound connections
+        ledger_entry = GemLedgerEntry.reserve(account_profile_id,
+                                              gems_cost,
+                                              GemLedgerEntry.AI_GENERATION,
+                                              max_in_flight=getattr(settings, "AI_GENERATION_MAX_IN_FLIGHT_PER_ACCOUNT", 2))
+
+        job = AiGenerationJob.objects.create(account_profile_id=account_profile_id,
+                                             stability_model=stability_model,
+                                             parameters=params,
+                                             gems_cost=gems_cost,
+                                             gem_ledger_entry=ledger_entry)
+        transaction.on_commit(lambda: get_ai_generation_executor().submit(run_ai_generation_job, job.id))
+    return job
+
+
+#########################################
+#     AI generation workers             #
+#########################################
+_ai_generation_executor: ThreadPoolExecutor = None
+_ai_generation_executor_lock = threading.Lock()
+
+
+def get_ai_generation_executor() -> ThreadPoolExecutor:
+    """
+    Pool of the background workers running the AI generations of this process
+    """
+    global _ai_generation_executor
+    if _ai_generation_executor is None:
+        with _ai_generation_executor_lock:
+            if _ai_generation_executor is None:
+                _ai_generation_executor = ThreadPoolExecutor(max_workers=getattr(settings, "AI_GENERATION_WORKERS", 4),
+                                                             thread_name_prefix="ai-generation")
+    return _ai_generation_executor
+
+
+def run_ai_generation_job(job_id: str):
+    """
+    Run a pending AI generation job : send the stability request and store the image in the s3 bucket.
+    The reserved gems are spent if the generation succeeds and released if it fails, the owner of the job is notified on its websockets either way.
+    """
+    # The workers threads have their own database connections
+    close_old_connections()
+    try:
+        # Only one worker can pick the job
+        started = (AiGenerationJob.objects.filter(id=job_id, status=AiGenerationJob.PENDING)
+                   .update(status=AiGenerationJob.RUNNING, started_at=timezone.now()))
+        if not started:
+            return
+        job = AiGenerationJob.objects.select_related('account_profile__account').get(id=job_id)
+
+        try:
+            s3_path = generate_ai_design_with_stability(job)
+            # The job may have been failed meanwhile by the stuck jobs sweep, which released its gems : the result is dropped
+            if not settle_ai_generation_job(job, AiGenerationJob.SUCCEEDED, s3_path=s3_path):
+                logging.error(f"run_ai_generation_job error :job {job_id} was failed before the generation finished ")
+                return
+        except Exception as e:
+            logging.error(f"run_ai_generation_job error :{e.args} ")
+            if not settle_ai_generation_job(job, AiGenerationJob.FAILED, error=str(e)[:1024]):
+                return
+
+        notify_account(job.account_profile.account_id, {"type": "ai_generation_job", **job.to_dict()})
+    finally:
+        close_old_connections()
+
+
+def settle_ai_generation_job(job: AiGenerationJob, status: str, s3_path: str = None, error: str = None) -> bool:
+    """
+    Finish a running job : a succeeded job spends its reserved gems and a failed one gets them back.
+    The status transition guards the settlement, returns False if the job isn't running anymore (nothing is changed then)
+    """
+    with transaction.atomic():
+        finished_at = timezone.now()
+        settled = (AiGenerationJob.objects.filter(id=job.id, status=AiGenerationJob.RUNNING)
+                   .update(status=status, s3_path=s3_path, error=error, finished_at=finished_at, updated_at=finished_at))
+        if not settled:
+            return False
+        job.status, job.s3_path, job.error, job.finished_at = status, s3_path, error, finished_at
+        if job.gem_ledger_entry_id:
+            if status == AiGenerationJob.SUCCEEDED:
+                GemLedgerEntry.commit(job.gem_ledger_entry_id)
+            else:
+                GemLedgerEntry.release(job.gem_ledger_entry_id)
+    if s3_path:
+        # The update doesn't send the signals, the derivatives of the image are scheduled here
+        schedule_image_derivatives(AiGenerationJob, job.id, 's3_path', 'has_image_derivatives')
+    return True
+
+
+def fail_stuck_ai_generation_jobs(older_than: timedelta) -> int:
+    """
+    Fail the jobs lost by the workers (e.g. a process restarted during a deploy) and return their number :
+    the pending jobs created and the running jobs started more than older_than ago.
+    Their gems are released and their owners are notified, a worker finishing one of them afterwards drops its result
+    """
+    limit = timezone.now() - older_than
+    stuck_jobs = (AiGenerationJob.objects.filter(Q(status=AiGenerationJob.PENDING, created_at__lt=limit) |
+                                                 Q(status=AiGenerationJob.RUNNING, started_at__lt=limit))
+                  .select_related('account_profile__account'))
+    nb_failed = 0
+    for job in stuck_jobs:
+        with transaction.atomic():
+            # A pending job is marked running first, so that no worker can pick it while it's failed
+            AiGenerationJob.objects.filter(id=job.id, status=AiGenerationJob.PENDING).update(status=AiGenerationJob.RUNNING)
+            if not settle_ai_generation_job(job, AiGenerationJob.FAILED, error="The generation was interrupted, the gems were refunded"):
+                continue
+        nb_failed += 1
+        notify_account(job.account_profile.account_id, {"type": "ai_generation_job", **job.to_dict()})
+    return nb_failed
+
+
+def generate_ai_design_with_stability(job: AiGenerationJob) -> str:
+    """
+    This function generates the AI design of a job with its stability model and returns the s3 path of the image.
+    The generations with a fixed seed are looked up in the AI generations cache first, a hit is copied in the bucket
+    without calling stability
+    """
+    design_placeholders = {'regular_user_profile_id': job.account_profile_id,
+                           'regular_user_email': job.account_profile.account.email,
+                           'design_id': str(uuid4()),
+                           'design_title': job.parameters.get("prompt")}
+
+    cache_key = AiGenerationCacheEntry.build_cache_key(job.stability_model, job.parameters)
+    if cache_key:
+        cached_s3_path = AiGenerationCacheEntry.lookup(cache_key)
+        if cached_s3_path:
+            return s3_engine.copy_file_in_s3(cached_s3_path, 'regular_user_designs', design_placeholders)
+
     # Send the generation request
     response = send_generation_request(
-        host=STABILITY_MODELS_CREDIT_MAPPING[stability_model]["base_url"] + STABILITY_MODELS_CREDIT_MAPPING[stability_model]["url_extension"],
-        params=params
+        host=STABILITY_MODELS_CREDIT_MAPPING[job.stability_model]["base_url"] + STABILITY_MODELS_CREDIT_MAPPING[job.stability_model]["url_extension"],
+        params=dict(job.parameters)
     )
     # Decode response
     output_image = response.content
     finish_reason = response.headers.get("finish-reason")
-    seed = response.headers.get("seed")
 
     # Check for NSFW classification
     if finish_reason == 'CONTENT_FILTERED':
         raise Warning("Generation failed NSFW classifier")
     
-    # Store the generated image in the s3 bucket
-    account_email = AccountProfile.objects.get(id=account_profile_id).account.email
-    s3_path = s3_engine.upload_file_to_s3(output_image, 
-                'regular_user_designs', 
-                {'regular_user_profile_id': account_profile_id,
-                 'regular_user_email': account_email,
-                 'design_id': str(uuid4()),
-                 'design_title': prompt})
-    
-    # Deduct the personili_gems from the account
-    #account_profile = AccountProfile.objects.get(id=account_profile_id)
-    #account_profile.personili_gems -= gems_cost
-    #account_profile.save()
+    # Store the generated image in the s3 bucket, with a copy in the AI generations cache uploaded at the same time
+    # (the design of the user doesn't depend on the cache expiry)
+    if not cache_key:
+        return s3_engine.upload_file_to_s3(output_image, 'regular_user_designs', design_placeholders)
+    s3_path, cached_s3_path = s3_engine.put_many([(output_image, 'regular_user_designs', design_placeholders),
+                                                  (output_image, 'ai_generations', {'cache_key': cache_key})])
+    try:
+        AiGenerationCacheEntry.store(cache_key, job.stability_model, job.parameters, cached_s3_path)
+    except Exception as e:
+        logging.error(f"generate_ai_design_with_stability cache error :{e.args} ")
 
     # TODO: Store the design in the database
 
-    # generate a signed url for the image
-    signed_url = s3_engine.generate_presigned_s3_url(s3_path)
-
-    return signed_url
-
-    
-
+    return s3_path
@@ -5,15 +5,19 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
 # Local imports
-from designs.models import Store, Design, Collection, Theme
-from accounts.models import AccountProfile
+from designs.models import Store, Design, Collection, Theme, AiGenerationJob
+from accounts.models import AccountProfile, InsufficientGemsError, GemReservationLimitError
 from designs.api.v1.serializers import DesignSerializerBase, ThemeSerializerGet
 from utils.validators import is_all_valid_uuid4
+from utils.pagination import parse_cursor_pagination, parse_count_mode
+from utils.catalog_cache import cached_catalog_page, tags_of_ids
+from utils.images.hashing import MAX_DUPLICATE_DISTANCE, dhash_of_bytes
+from utils.images.colors import hex_to_rgb
 
-from security.authentication.jwt_authentication_class import JWTAuthentication
+from security.authentication.jwt_authentication_class import JWTAuthentication, jwt_authentication
 
 # Services
-from designs.api.v1.services import generate_ai_design_with_stability
+from designs.api.v1.services import enqueue_ai_design_generation
 
 # boto3 imports
 import boto3
@@ -25,6 +29,13 @@ import logging
 # set the logging on the debug level
 logger = logging.getLogger(__name__)
 
+# Maximum number of designs in a single liked status lookup
+MAX_LIKED_STATUS_DESIGNS = 50
+# Maximum number of colors of the designs catalog color filter
+MAX_CATALOG_COLORS = 3
+# Maximum size (in bytes) of an image checked for duplicates
+MAX_DUPLICATE_CHECK_IMAGE_SIZE = 10 * 1024 * 1024
+
 
 #################################
 #                               #
@@ -41,6 +52,16 @@ class DesignsViewSet(viewsets.ViewSet):
         user_profile = get_object_or_404(AccountProfile, user=self.request.user)
         return user_profile
 
+    def get_optional_account(self, request):
+        """
+        Returns the account of the access token of the request if there's a valid one, None otherwise (public endpoints)
+        """
+        try:
+            authentication = jwt_authentication.authenticate(request)
+        except Exception:
+            return None
+        return authentication[0] if authentication else None
+
     ################################### GET/POST APIS, PUBLIC #####################################
     
     ##### Get the designs based on criteria : theme, store, workshop, nb of likes, sponsored stores, sponsored workshops
@@ -54,11 +75,16 @@ class DesignsViewSet(viewsets.ViewSet):
         - sponsored stores
         - sponsored organizations
         - search term
+        - sort_by : "relevance" to order the results by relevance to the search term
         - offset
         - limit
+        - pagination : "offset" (default) or "cursor", in cursor mode the page_size and cursor are used instead of offset and limit
+        - count_mode : "total" (default) to get the number of matching items, "has_more" to only know if there are more items
         - free
         - Latest publication date
         - promotion ids
+        - colors : comma separated hex colors (at most MAX_CATALOG_COLORS), the designs have a dominant color close to each of them
+        - include_liked_by_me : flag each design with liked_by_me when the request carries a valid access token
         """
         self.permission_classes = [permissions.AllowAny]
         self.authentication_classes = []
@@ -86,8 +112,11 @@ class DesignsViewSet(viewsets.ViewSet):
         sponsored_workshops = request.data.get('sponsored_workshops', None)
 
         search_term = request.data.get('search_term', None)
+        sort_by = request.data.get('sort_by', None)
         free = request.data.get('free', None)
         tags = request.data.get('tags', None)
+        colors = request.data.get('colors', None)
+        include_liked_by_me = request.data.get('include_liked_by_me', None)
 
         ####################### Query parameters validation ########################
         if offset and limit:
@@ -103,6 +132,23 @@ class DesignsViewSet(viewsets.ViewSet):
         else:
             offset = 0
             limit = 20
+
+        try:
+            cursor, page_size = parse_cursor_pagination(request.data)
+        except ValueError:
+            logger.debug("cursor should be a valid cursor and page_size a positive integer less than 50")
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            count_mode = parse_count_mode(request.data)
+        except ValueError:
+            logger.debug("count_mode should be total or has_more")
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        ##### sort_by can only be the relevance to the search term
+        if sort_by and (sort_by != "relevance" or not search_term):
+            logger.debug("sort_by should be relevance and can only be used with a search term")
+            return Response({"error": "BAD_REQUEST"}, status=400)
         
         if max_price and min_price:
             if not (max_price.isdigit() and min_price.isdigit()):
@@ -209,35 +255,70 @@ class DesignsViewSet(viewsets.ViewSet):
             if not isinstance(tags, str):
                 logger.debug("tags should be a string")
                 return Response({"error": "BAD_REQUEST"}, status=400)
+
+        if colors:
+            # colors should be a comma separated list of hex colors
+            if not isinstance(colors, str):
+                logger.debug("colors should be a string")
+                return Response({"error": "BAD_REQUEST"}, status=400)
+            colors = [color.lower().lstrip('#') for color in colors.replace(" ", "").split(",")]
+            try:
+                if len(colors) > MAX_CATALOG_COLORS:
+                    raise ValueError("Too many colors")
+                for color in colors:
+                    hex_to_rgb(color)
+            except ValueError:
+                logger.debug(f"colors should be at most {MAX_CATALOG_COLORS} hex colors")
+                return Response({"error": "BAD_REQUEST"}, status=400)
+
+        if include_liked_by_me:
+            # include_liked_by_me should ba valid boolean value
+            if include_liked_by_me not in ["true","True", "false", "False"]:
+                logger.debug("include_liked_by_me should be a boolean value")
+                return Response({"error": "BAD_REQUEST"}, status=400)
+            include_liked_by_me = include_liked_by_me in ["true", "True"]
         try :
 
-            popular_designs = Design.get_designs(   latest_publication_date_max=latest_publication_date_max,
-                                                    latest_publication_date_min=latest_publication_date_min,
-                                                    
-                                                    offset=offset, 
-                                                    limit=limit,
-                                                    
-                                                    min_price = min_price,
-                                                    max_price = max_price,
-                                                    
-                                                    theme_ids=theme_ids,
-                                                    
-                                                    store_ids=store_ids,
-                                                    workshop_ids=workshop_ids,
-                                                    organization_ids=organization_ids,
-                                                    
-                                                    promotion_ids=promotion_ids,
-                                                    events_ids=events_ids,
-
-                                                    sponsored_stores=sponsored_stores,
-                                                    sponsored_organizations=sponsored_organizations,
-                                                    sponsored_workshops=sponsored_workshops,
-                                                    sponsored_designs=sponsored_designs,
-                                                    
-                                                    search_term=search_term,
-                                                    tags=tags,
-                                                    free=free
-                                                )
+            params = dict(latest_publication_date_max=latest_publication_date_max,
+                          latest_publication_date_min=latest_publication_date_min,
+                          offset=offset,
+                          limit=limit,
+                          cursor=cursor,
+                          page_size=page_size,
+                          min_price=min_price,
+                          max_price=max_price,
+                          theme_ids=theme_ids,
+                          store_ids=store_ids,
+                          workshop_ids=workshop_ids,
+                          organization_ids=organization_ids,
+                          promotion_ids=promotion_ids,
+                          events_ids=events_ids,
+                          sponsored_stores=sponsored_stores,
+                          sponsored_organizations=sponsored_organizations,
+                          sponsored_workshops=sponsored_workshops,
+                          sponsored_designs=sponsored_designs,
+                          search_term=search_term,
+                          sort_by_relevance=sort_by == "relevance",
+                          count_mode=count_mode,
+                          tags=tags,
+                          colors=colors,
+                          free=free)
+            # Anonymous catalog pages are served from the cache, they are evicted when an object they touch changes
+            popular_designs = cached_catalog_page("designs", params,
+                                                  compute=lambda: Design.get_designs(**params),
+                                                  tags_of=Design.get_designs_cache_tags,
+                                                  filter_tags=(tags_of_ids('theme', theme_ids) |
+                                                               tags_of_ids('store', store_ids) |
+                                                               tags_of_ids('workshop', workshop_ids) |
+                                                               tags_of_ids('organization', organization_ids)))
+
+            # The liked flags are personal, they are added to the cached page and never cached themselves
+            account = self.get_optional_account(request) if include_liked_by_me else None
+            if account:
+                liked_design_ids = Design.get_liked_design_ids(account.id, [design["design_id"] for design in popular_designs["designs_list"]])
+                popular_designs = {**popular_designs,
+                                   "designs_list": [{**design, "liked_by_me": str(design["design_id"]) in liked_design_ids}
+                                                    for design in popular_designs["designs_list"]]}
         except Exception as e:
             logging.error(e)
             logging.error(f"get_popular_designs_light action method error :{e.args} ")
@@ -300,20 +381,16 @@ class DesignsViewSet(viewsets.ViewSet):
         self.permission_classes = [permissions.IsAuthenticated]
         
         account = request.user
-        account_profile = AccountProfile.objects.get(account=account)
-        
-        # Check the design exists
-        design = get_object_or_404(Design, pk=pk)
-        if not design:
-            return Response({"error": "NOT_FOUND"}, status=404)
-        
-        # Check if the user has already liked the design
-        if design.is_liked_by(account_profile):
-            return Response({"error": "ALREADY_LIKED"}, status=400)
+        if not is_all_valid_uuid4([pk]):
+            return Response({"error": "BAD_REQUEST"}, status=400)
         
         try:
-            design.like(account_profile)
+            # The like is inserted only if the user hasn't already liked the design, the design and the profile have to exist
+            if not Design.like(pk, account.id):
+                return Response({"error": "ALREADY_LIKED"}, status=400)
             return Response({"message": "LIKED"}, status=status.HTTP_200_OK)
+        except (Design.DoesNotExist, AccountProfile.DoesNotExist):
+            return Response({"error": "NOT_FOUND"}, status=404)
         except Exception as e:
             logging.error(f"like_design action method error :{e.args} ")
             return Response({"error": "UNKNOWN_ERROR"}, status=400)
@@ -328,24 +405,92 @@ class DesignsViewSet(viewsets.ViewSet):
         self.permission_classes = [permissions.IsAuthenticated]
         
         account = request.user
-        account_profile = AccountProfile.objects.get(account=account)
-        
-        # Check the design exists
-        design = get_object_or_404(Design, pk=pk)
-        if not design:
-            return Response({"error": "NOT_FOUND"}, status=404)
-        
-        # Check if the user has already liked the design
-        if not design.is_liked_by(account_profile):
-            return Response({"error": "NOT_LIKED"}, status=400)
+        if not is_all_valid_uuid4([pk]):
+            return Response({"error": "BAD_REQUEST"}, status=400)
         
         try:
-            design.unlike(account_profile)
+            # The like is deleted only if the user has liked the design
+            if not Design.unlike(pk, account.id):
+                return Response({"error": "NOT_LIKED"}, status=400)
             return Response({"message": "UNLIKED"}, status=status.HTTP_200_OK)
         except Exception as e:
             logging.error(f"unlike_design action method error :{e.args} ")
             return Response({"error": "UNKNOWN_ERROR"}, status=400)
     
+    ##### Which designs of a list are liked by the user
+    @action(detail=False, methods=['POST'], url_path='liked-status', permission_classes=[permissions.IsAuthenticated])
+    def get_liked_status(self, request):
+        """
+        Returns the designs liked by the user among the given designs :
+        - design_ids : list or comma separated uuids, at most MAX_LIKED_STATUS_DESIGNS
+        """
+        self.authentication_classes = [JWTAuthentication]
+        self.permission_classes = [permissions.IsAuthenticated]
+
+        account = request.user
+        design_ids = request.data.get('design_ids', None)
+        if isinstance(design_ids, str):
+            design_ids = design_ids.replace(" ", "").split(",")
+        if not design_ids or not isinstance(design_ids, list) or len(design_ids) > MAX_LIKED_STATUS_DESIGNS:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        if not all(isinstance(design_id, str) for design_id in design_ids) or not is_all_valid_uuid4(design_ids):
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            liked_design_ids = Design.get_liked_design_ids(account.id, design_ids)
+            return Response({"liked_design_ids": [design_id for design_id in dict.fromkeys(design_ids) if design_id.strip().lower() in liked_design_ids]},
+                            status=status.HTTP_200_OK)
+        except Exception as e:
+            logging.error(f"get_liked_status action method error :{e.args} ")
+            return Response({"error": "UNKNOWN_ERROR"}, status=400)
+
+    ##### Designs which are near duplicates of an image
+    @action(detail=False, methods=['POST'], url_path='duplicates', permission_classes=[permissions.IsAuthenticated])
+    def get_possible_duplicates(self, request):
+        """
+        Returns the designs whose image is a near duplicate of an uploaded image or of the image of a design, closest first :
+        - image : the image to upload (png, jpeg or webp, at most MAX_DUPLICATE_CHECK_IMAGE_SIZE bytes), or
+        - design_id : a design with a hashed image, published or owned by the user
+        - max_distance : number of different bits of the perceptual hashes, from 0 to MAX_DUPLICATE_DISTANCE (default)
+        """
+        self.authentication_classes = [JWTAuthentication]
+        self.permission_classes = [permissions.IsAuthenticated]
+
+        image = request.FILES.get('image', None)
+        design_id = request.data.get('design_id', None)
+        max_distance = request.data.get('max_distance', MAX_DUPLICATE_DISTANCE)
+        if (image is None) == (design_id is None):
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        if not str(max_distance).isdigit() or int(max_distance) > MAX_DUPLICATE_DISTANCE:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        if image is not None and (image.size > MAX_DUPLICATE_CHECK_IMAGE_SIZE or not image.name.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))):
+            logger.debug(f"get_possible_duplicates invalid image : {image.name} ({image.size} bytes)")
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        if design_id is not None and (not isinstance(design_id, str) or not is_all_valid_uuid4([design_id])):
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            if image is not None:
+                try:
+                    image_dhash = dhash_of_bytes(image.read())
+                except Exception as e:
+                    logger.debug(f"get_possible_duplicates undecodable image :{e.args} ")
+                    return Response({"error": "INVALID_IMAGE"}, status=400)
+            else:
+                design = Design.objects.filter(Design.visible_to(request.user.id), id=design_id).values('image_dhash').first()
+                if design is None:
+                    return Response({"error": "NOT_FOUND"}, status=404)
+                if design['image_dhash'] is None:
+                    return Response({"error": "IMAGE_NOT_HASHED"}, status=409)
+                image_dhash = design['image_dhash']
+
+            duplicates = Design.find_possible_duplicates(image_dhash, request.user.id, max_distance=int(max_distance),
+                                                         exclude_design_id=design_id)
+            return Response({"possible_duplicates": duplicates}, status=status.HTTP_200_OK)
+        except Exception as e:
+            logging.error(f"get_possible_duplicates action method error :{e.args} ")
+            return Response({"error": "UNKNOWN_ERROR"}, status=400)
+
     ##### Is the design liked by the user
     @action(detail=True, methods=['GET'], url_path='is-liked-by', permission_classes=[permissions.IsAuthenticated])
     def is_liked_by(self, request, pk=None):
@@ -375,7 +520,9 @@ class DesignsViewSet(viewsets.ViewSet):
     def generate_image(self, request):
         """
         Generate an image using the stability ai api, user must be authenticated and have a valid token
-        - each AI image generation consums a number of personili gems
+        - each AI image generation consums a number of personili gems, they are reserved when the generation is requested
+        - the generation runs in the background, the job id is returned right away and the job status is given by ai/jobs/{job_id},
+          the user is also notified on its websockets when the job is done
         """
         self.authentication_classes = [JWTAuthentication]
         self.permission_classes = [permissions.IsAuthenticated]
@@ -405,28 +552,60 @@ class DesignsViewSet(viewsets.ViewSet):
             for_user = True
 
         
+        if not str(seed).isdigit():
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
         try:
-            # Generate the image
-            signed_url = generate_ai_design_with_stability(account_profile_id=request.user.profile.id,
-                                                           for_store=for_store,
-                                                           for_user=for_user,
-                                                           for_workshop=for_workshop,
-                                                           prompt=prompt,
-                                                           negative_prompt=negative_prompt,
-                                                           seed=int(seed),
-                                                           stability_model=stability_model,
-                                                           aspect_ratio=aspect_ratio,
-                                                           output_format=output_format,
-                                                           mode=mode,
-                                                           sd3_model=sd3_model,
-                                                           style_preset=style_preset
-                                                           )
-            response = {"signed_url": signed_url}
-            return Response(response, status=status.HTTP_200_OK)
+            # Enqueue the generation of the image
+            job = enqueue_ai_design_generation(account_profile_id=request.user.profile.id,
+                                               for_store=for_store,
+                                               for_user=for_user,
+                                               for_workshop=for_workshop,
+                                               prompt=prompt,
+                                               negative_prompt=negative_prompt,
+                                               seed=int(seed),
+                                               stability_model=stability_model,
+                                               aspect_ratio=aspect_ratio,
+                                               output_format=output_format,
+                                               mode=mode,
+                                               sd3_model=sd3_model,
+                                               style_preset=style_preset
+                                               )
+            response = {"job_id": job.id, "status": job.status}
+            return Response(response, status=status.HTTP_202_ACCEPTED)
+        except InsufficientGemsError:
+            return Response({"error": "INSUFFICIENT_GEMS"}, status=400)
+        except GemReservationLimitError:
+            return Response({"error": "TOO_MANY_GENERATIONS_IN_PROGRESS"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        except ValueError as e:
+            logging.debug(f"generate_image action method validation error :{e.args} ")
+            return Response({"error": "BAD_REQUEST"}, status=400)
         except Exception as e:
             logging.error(f"generate_image action method error :{e.args} ")
             return Response({"error": "UNKNOWN_ERROR"}, status=400)
     
+    #### Get the status of an AI generation job #######
+    @action(detail=False, methods=['GET'], url_path='ai/jobs/(?P<job_id>[^/.]+)', permission_classes=[permissions.IsAuthenticated])
+    def get_ai_generation_job(self, request, job_id=None):
+        """
+        Get the status of an AI generation job of the user, with the URL of the image once the generation succeeded
+        """
+        self.authentication_classes = [JWTAuthentication]
+        self.permission_classes = [permissions.IsAuthenticated]
+
+        if not job_id or not is_all_valid_uuid4([job_id]):
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            # Only the owner of the job can see it
+            job = AiGenerationJob.objects.filter(id=job_id, account_profile__account_id=request.user.id).first()
+            if not job:
+                return Response({"error": "NOT_FOUND"}, status=404)
+            return Response(job.to_dict(), status=status.HTTP_200_OK)
+        except Exception as e:
+            logging.error(f"get_ai_generation_job action method error :{e.args} ")
+            return Response({"error": "UNKNOWN_ERROR"}, status=400)
+
     #### Get user ai generated designs and uploaded designs #######
     @action(detail=False, methods=['GET'], url_path='ai/designs', permission_classes=[permissions.IsAuthenticated])
     def get_user_designs(self, request):
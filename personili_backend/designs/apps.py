@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DesignsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'designs'
+
+    def ready(self):
+        # Connect the signal handlers keeping the design search documents up to date
+        import designs.signals  # noqa F401
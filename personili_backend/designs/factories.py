@@ -73,7 +73,8 @@ class CollectionFactory(DjangoModelFactory):
     class Meta:
         model = Collection
     name = Faker('word')
-    store = factory.SubFactory(StoreFactory)
+    # A collection belongs to a store or to a workshop, not both
+    store = None
     workshop = factory.SubFactory(WorkshopFactory)
    
 
@@ -112,7 +113,7 @@ class DesignFactory(DjangoModelFactory):
 
     latest_publication_date = Faker('date')
     to_be_published = Faker('boolean', chance_of_getting_true=90)
-    base_price = Faker('random_float', min=0, max=999999)
+    base_price = Faker('pydecimal', left_digits=6, right_digits=2, min_value=0, max_value=999999)
     sponsored = Faker('boolean', chance_of_getting_true=30)
     free_usage = Faker('boolean', chance_of_getting_true=50)
     exclusive_usage = Faker('boolean', chance_of_getting_true=50)
@@ -0,0 +1,25 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+from designs.models import Design
+from utils.images.pipeline import generate_image_derivatives, generate_image_features, get_derivatives_pools
+
+class Command(BaseCommand):
+    help = 'Extract the dominant colors of the design images which were not analyzed yet, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of designs to analyze')
+
+    def handle(self, *args, **kwargs):
+        drivers_pool = get_derivatives_pools()[1]
+        designs = (Design.objects.filter(color_palette__isnull=True).exclude(image_path__isnull=True).exclude(image_path='')
+                   .values_list('id', 'has_image_derivatives'))
+        if kwargs['limit']:
+            designs = designs[:kwargs['limit']]
+
+        # The designs without derivatives get them with their hash and colors, from a single decoding of the image
+        futures = [drivers_pool.submit(generate_image_features, Design, design_id, 'image_path', palette_field='color_palette') if has_derivatives
+                   else drivers_pool.submit(generate_image_derivatives, Design, design_id, 'image_path', 'has_image_derivatives', 'image_dhash', 'color_palette')
+                   for design_id, has_derivatives in designs]
+        analyzed = sum(future.result() for future in wait(futures).done)
+        self.stdout.write(self.style.SUCCESS(f'Successfully extracted the colors of {analyzed} of {len(futures)} design images'))
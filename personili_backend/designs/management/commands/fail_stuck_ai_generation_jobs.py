@@ -0,0 +1,15 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from designs.api.v1.services import fail_stuck_ai_generation_jobs
+
+class Command(BaseCommand):
+    help = 'Fail the AI generation jobs lost by the workers (e.g. a process restarted during a deploy), refund their gems and notify their owners'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=30,
+                            help='Only fail the jobs pending or running for more than this number of minutes')
+
+    def handle(self, *args, **kwargs):
+        nb_failed = fail_stuck_ai_generation_jobs(timedelta(minutes=kwargs['older_than_minutes']))
+        self.stdout.write(self.style.SUCCESS(f'Successfully failed {nb_failed} stuck AI generation jobs'))
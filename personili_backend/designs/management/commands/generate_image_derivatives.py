@@ -0,0 +1,33 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+from accounts.models import AccountProfile
+from designs.models import Design, DesignPreview, AiGenerationJob
+from products.models import ProductVariantPreview
+from utils.images.pipeline import generate_image_derivatives, get_derivatives_pools
+
+# (model, image field, derivatives flag, dHash field, palette field) of the images with derivatives
+IMAGES_WITH_DERIVATIVES = [
+    (Design, 'image_path', 'has_image_derivatives', 'image_dhash', 'color_palette'),
+    (DesignPreview, 'image_path', 'has_image_derivatives', None, None),
+    (AiGenerationJob, 's3_path', 'has_image_derivatives', None, None),
+    (ProductVariantPreview, 'image_path', 'has_image_derivatives', None, None),
+    (AccountProfile, 'profile_picture_path', 'has_profile_picture_derivatives', None, None),
+]
+
+class Command(BaseCommand):
+    help = 'Generate the thumbnails and WebP variants of the images uploaded before the derivatives pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of images per model')
+
+    def handle(self, *args, **kwargs):
+        drivers_pool = get_derivatives_pools()[1]
+        for model, path_field, flag_field, dhash_field, palette_field in IMAGES_WITH_DERIVATIVES:
+            pks = (model.objects.filter(**{flag_field: False}).exclude(**{f'{path_field}__isnull': True}).exclude(**{path_field: ''})
+                   .values_list('pk', flat=True))
+            if kwargs['limit']:
+                pks = pks[:kwargs['limit']]
+            futures = [drivers_pool.submit(generate_image_derivatives, model, pk, path_field, flag_field, dhash_field, palette_field) for pk in pks]
+            generated = sum(future.result() for future in wait(futures).done)
+            self.stdout.write(self.style.SUCCESS(f'Successfully generated the derivatives of {generated} of {len(futures)} {model.__name__} images'))
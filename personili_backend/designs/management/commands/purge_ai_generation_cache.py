@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from designs.models import AiGenerationCacheEntry
+from utils.aws.storage.s3_engine import s3_engine
+
+class Command(BaseCommand):
+    help = 'Delete the expired entries of the AI generations cache, and configure the bucket lifecycle deleting their images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--configure-lifecycle', action='store_true',
+                            help='Make the bucket lifecycle expire the cached images a day after their entries')
+        parser.add_argument('--delete-objects', action='store_true',
+                            help='Delete the images of the expired entries now instead of waiting for the bucket lifecycle')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['configure_lifecycle']:
+            days = AiGenerationCacheEntry.ttl().days + 1
+            s3_engine.put_expiration_rule('ai_generations', days)
+            self.stdout.write(self.style.SUCCESS(f'Successfully configured the expiration of the cached images after {days} days'))
+
+        s3_paths = AiGenerationCacheEntry.purge_expired()
+        if kwargs['delete_objects']:
+            for s3_path in s3_paths:
+                s3_engine.delete_file_from_s3(s3_path)
+        stats = AiGenerationCacheEntry.get_stats()
+        self.stdout.write(self.style.SUCCESS(f'Successfully purged {len(s3_paths)} expired entries, '
+                                             f'{stats["entries"]} entries left ({stats["hits"]} hits, {stats["misses"]} misses)'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from designs.models import Design
+
+class Command(BaseCommand):
+    help = 'Fix the likes counters of the designs which drifted from the actual number of likes'
+
+    def handle(self, *args, **kwargs):
+        nb_designs = Design.reconcile_likes()
+        self.stdout.write(self.style.SUCCESS(f'Successfully reconciled the likes counters, {nb_designs} designs fixed'))
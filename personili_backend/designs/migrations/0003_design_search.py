@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-17 19:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0002_design_ai_generated"),
+    ]
+
+    operations = [
+        # pg_trgm backs the partial word search of the designs, personalizables and catalog rows
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="design",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="search_document",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_document"], name="designs_search_gin"),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_text"], name="designs_search_trgm", opclasses=["gin_trgm_ops"]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-17 22:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_num_likes(apps, schema_editor):
+    """
+    Count the likes of the existing designs
+    """
+    Design = apps.get_model("designs", "Design")
+    DesignLike = apps.get_model("designs", "DesignLike")
+    Design.objects.update(num_likes=Coalesce(Subquery(DesignLike.objects.filter(design=OuterRef("pk"))
+                                                      .values("design").annotate(total=Count("id")).values("total")), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0003_design_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="design",
+            name="num_likes",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=models.Index(fields=["-num_likes", "id"], name="designs_likes_idx"),
+        ),
+        migrations.RunPython(fill_num_likes, migrations.RunPython.noop),
+    ]
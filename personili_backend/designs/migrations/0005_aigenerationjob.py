@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-17 23:10
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0002_accountprofile_personili_gems"),
+        ("designs", "0004_design_num_likes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AiGenerationJob",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("running", "Running"), ("succeeded", "Succeeded"), ("failed", "Failed")],
+                        default="pending",
+                        max_length=255,
+                    ),
+                ),
+                ("stability_model", models.CharField(max_length=255)),
+                ("parameters", models.JSONField(blank=True, default=dict)),
+                ("gems_cost", models.IntegerField(default=0)),
+                ("s3_path", models.CharField(blank=True, max_length=1024, null=True)),
+                ("error", models.CharField(blank=True, max_length=1024, null=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "account_profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ai_generation_jobs",
+                        to="accounts.accountprofile",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "ai_generation_jobs",
+                "indexes": [models.Index(fields=["account_profile", "-created_at"], name="ai_jobs_account_idx")],
+            },
+        ),
+    ]
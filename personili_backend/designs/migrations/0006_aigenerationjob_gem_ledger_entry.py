@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-17 23:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_gemledgerentry"),
+        ("designs", "0005_aigenerationjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aigenerationjob",
+            name="gem_ledger_entry",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="ai_generation_job",
+                to="accounts.gemledgerentry",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0 on 2026-10-17 23:58
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0006_aigenerationjob_gem_ledger_entry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AiGenerationCacheEntry",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("cache_key", models.CharField(max_length=64, unique=True)),
+                ("stability_model", models.CharField(max_length=255)),
+                ("parameters", models.JSONField(blank=True, default=dict)),
+                ("s3_path", models.CharField(max_length=1024)),
+                ("num_hits", models.IntegerField(default=0)),
+                ("last_hit_at", models.DateTimeField(blank=True, null=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "db_table": "ai_generation_cache_entries",
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0007_aigenerationcacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="design",
+            name="has_image_derivatives",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="designpreview",
+            name="has_image_derivatives",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="aigenerationjob",
+            name="has_image_derivatives",
+            field=models.BooleanField(default=False),
+        ),
+    ]
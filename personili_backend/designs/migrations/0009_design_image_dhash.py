@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-18 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0008_image_derivatives_flags"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="design",
+            name="image_dhash",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="image_dhash_band_0",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="image_dhash_band_1",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="image_dhash_band_2",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="image_dhash_band_3",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=models.Index(fields=["image_dhash_band_0"], name="designs_dhash_band_0_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=models.Index(fields=["image_dhash_band_1"], name="designs_dhash_band_1_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=models.Index(fields=["image_dhash_band_2"], name="designs_dhash_band_2_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=models.Index(fields=["image_dhash_band_3"], name="designs_dhash_band_3_idx"),
+        ),
+    ]
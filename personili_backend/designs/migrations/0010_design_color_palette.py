@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 01:10
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0009_design_image_dhash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="design",
+            name="color_palette",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="design",
+            name="color_palette_cells",
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddIndex(
+            model_name="design",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["color_palette_cells"], name="designs_colors_gin"),
+        ),
+    ]
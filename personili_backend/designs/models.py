@@ -1,14 +1,25 @@
 # Standard libraries
+from datetime import timedelta
+from typing import Optional
 from uuid import uuid4
+import hashlib
 import json
 
 # Django
 from django.db import models
+from django.conf import settings
 from django.core import serializers
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q, F, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 
 # Models
-from accounts.models import AccountProfile
+from accounts.models import AccountProfile, GemLedgerEntry
 from accounts.models import TimeStampedModel
 from organizations.models import Workshop
 
@@ -17,6 +28,12 @@ from utils.utilities import add_to_dict
 
 # AWS utilities
 from utils.aws.storage.s3_engine import s3_engine
+from utils.pagination import paginate_catalog, COUNT_MODE_TOTAL
+from utils.search import build_search_vector, search_filter, search_rank
+from utils.catalog_cache import invalidate_tags_on_commit, tags_of_ids
+from utils.images.derivatives import derivative_or_original
+from utils.images.hashing import MAX_DUPLICATE_DISTANCE, dhash_bands, hamming_distance
+from utils.images.colors import hex_to_rgb, rgb_to_lab, neighbour_lab_cells
 
 #########################################
 #          Designer model               #
@@ -200,6 +217,8 @@ class Design(TimeStampedModel):
     title = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     image_path = models.CharField(max_length=255, null=True, blank=True)
+    # The thumbnails and WebP variants of the image were generated (see utils/images/pipeline.py)
+    has_image_derivatives = models.BooleanField(default=False)
     tags = models.CharField(max_length=255, null=True, blank=True)
     design_type = models.CharField(max_length=255, choices=DESIGN_TYPES, default=_2D)
     
@@ -229,6 +248,24 @@ class Design(TimeStampedModel):
     # AI generated 
     ai_generated = models.BooleanField(default=False)
 
+    # Number of likes, maintained with the likes themselves (see like and unlike)
+    num_likes = models.IntegerField(default=0)
+
+    # Perceptual hash (dHash) of the image and its 16 bits bands, to find the near duplicates (see find_possible_duplicates)
+    image_dhash = models.BigIntegerField(null=True, blank=True)
+    image_dhash_band_0 = models.IntegerField(null=True, blank=True)
+    image_dhash_band_1 = models.IntegerField(null=True, blank=True)
+    image_dhash_band_2 = models.IntegerField(null=True, blank=True)
+    image_dhash_band_3 = models.IntegerField(null=True, blank=True)
+
+    # Dominant colors of the image (hex, Lab and share of the pixels) and the Lab cells of the main ones, to filter the designs by color
+    color_palette = models.JSONField(null=True, blank=True)
+    color_palette_cells = ArrayField(models.IntegerField(), default=list, blank=True)
+
+    # Search : lower cased texts of the design and of its theme and owner, and the weighted search document built from them
+    search_text = models.TextField(default="", blank=True)
+    search_document = SearchVectorField(null=True, blank=True)
+
 
     ###### Usage and exclusivity parameters #######
     ## the following two parameters are mutually exclusive, if one is true the other should be false
@@ -297,8 +334,29 @@ class Design(TimeStampedModel):
             self.free_usage = False
         super(Design, self).save(*args, **kwargs)
 
+    # Catalog order, the id makes the sort key unique for the keyset pagination
+    CATALOG_ORDERING = ['-num_likes', 'id']
+
+    # Weights of the columns in the search document
+    SEARCH_WEIGHTS = {
+        'title': 'A',
+        'tags': 'B',
+        'description': 'C',
+        'search_text': 'D',
+    }
+
     class Meta:
         db_table = 'designs'
+        indexes = [
+            models.Index(fields=['-num_likes', 'id'], name='designs_likes_idx'),
+            GinIndex(fields=['search_document'], name='designs_search_gin'),
+            GinIndex(fields=['search_text'], name='designs_search_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['image_dhash_band_0'], name='designs_dhash_band_0_idx'),
+            models.Index(fields=['image_dhash_band_1'], name='designs_dhash_band_1_idx'),
+            models.Index(fields=['image_dhash_band_2'], name='designs_dhash_band_2_idx'),
+            models.Index(fields=['image_dhash_band_3'], name='designs_dhash_band_3_idx'),
+            GinIndex(fields=['color_palette_cells'], name='designs_colors_gin'),
+        ]
 
     def __str__(self):
         return self.title + " - " + str(self.id)
@@ -319,6 +377,7 @@ class Design(TimeStampedModel):
                         sponsored_organizations=False,
                         search_term=None,
                         tags=None,
+                        colors=None,
                         
                         free = None,
                         min_price=None,
@@ -328,7 +387,13 @@ class Design(TimeStampedModel):
                         latest_publication_date_max=None,
 
                         offset=0,
-                        limit=20): 
+                        limit=20,
+                        
+                        cursor=None,
+                        page_size=None,
+                        
+                        sort_by_relevance=False,
+                        count_mode=COUNT_MODE_TOTAL): 
         """
         This method returns the most popular designs (the ones that were approved and not uploaded by a regular user)
         compute the number of likes per design and return the top "limit" designs
@@ -350,6 +415,7 @@ class Design(TimeStampedModel):
         - sponsored_designs : boolean
         - search_term : string
         - tags : list of tags
+        - colors : list of hex colors, the designs have a dominant color close to each of them
         - promotion_ids : list of promotion ids
         - free : boolean
         - price_min : float
@@ -358,6 +424,10 @@ class Design(TimeStampedModel):
         - latest_publication_date_max : datetime
         - offset : int
         - limit : int
+        - cursor : str, the cursor of the previous page when paginating with a cursor
+        - page_size : int, paginate with a cursor (keyset pagination) instead of offset and limit when given
+        - sort_by_relevance : boolean, order the designs matching the search term by relevance first
+        - count_mode : "total" to count the matching designs in the query of the page, "has_more" to only tell if there are designs after the page
         """
         q_objects = Q()
         # First filter the designs which are approved and to be published
@@ -409,27 +479,37 @@ class Design(TimeStampedModel):
         if sponsored_workshops:
             q_objects.add(Q(workshop__is_sponsored=True), Q.AND)
 
-        # search for the search term in the title, the description, the tags of the design, also the theme name and description, the store name and organization name
+        # search for the search term in the search document of the design, it holds the title, the description, the tags of the design,
+        # also the theme name and description, the store name and biography and the workshop and organization names
         if search_term:
-            q_objects.add(Q(title__icontains=search_term) | 
-                          Q(description__icontains=search_term) | 
-                          Q(tags__icontains=search_term) | 
-                          Q(theme__name__icontains=search_term) | 
-                          Q(theme__description__icontains=search_term) | 
-                          Q(store__name__icontains=search_term) |
-                          Q(store__storeprofile__biography__icontains=search_term) |
-                          Q(workshop__organization__business_name__icontains=search_term) |
-                          Q(workshop__organization__description__icontains=search_term) |
-                          Q(workshop__name__icontains=search_term), Q.AND)
+            q_objects.add(search_filter(search_term), Q.AND)
+
+        # The colors are matched against the precomputed Lab cells of the palettes : a dominant color of the design
+        # has to be in the cell of each searched color or in one of the cells around it (GIN index overlap)
+        for color in colors or []:
+            q_objects.add(Q(color_palette_cells__overlap=neighbour_lab_cells(rgb_to_lab(*hex_to_rgb(color)))), Q.AND)
 
         designs = (cls.objects.filter(q_objects)
-               .annotate(num_likes=models.Count('design_likes')) 
                .select_related('store__storeprofile', 'workshop__organization__orgprofile', 'theme')
                .prefetch_related('design_previews')
-               .order_by('-num_likes', 'id')
-               .defer('created_at', 'updated_at'))[offset:limit]
+               .defer('created_at', 'updated_at', 'search_text', 'search_document'))
+        ordering = cls.CATALOG_ORDERING
+        if search_term and sort_by_relevance:
+            designs = designs.annotate(search_rank=search_rank(search_term))
+            ordering = ['-search_rank'] + ordering
+
+        # In cursor mode the page starts right after the (num_likes, id) of the last design of the previous page
+        designs, page_info = paginate_catalog(designs, ordering, offset, limit, cursor, page_size, count_mode)
         # TODO: Exclude the created_at and updated_at fields from the query (all the tables and not just the design table)
     
+        # The cards show the catalog thumbnails of the images once they're generated
+        image_paths = {design.id: derivative_or_original(design.image_path, design.has_image_derivatives) for design in designs}
+        preview_paths = {design.id: [derivative_or_original(preview.image_path, preview.has_image_derivatives) for preview in design.design_previews.all()]
+                         for design in designs}
+        # Sign the images of the whole page at once
+        image_urls = s3_engine.urls_for([image_path for design in designs
+                                         for image_path in [design.theme.icon_1_path, image_paths[design.id], *preview_paths[design.id]]])
+
         result = {"designs_list":[]}
         for design in designs:
             # Root dict to contain design data
@@ -442,11 +522,12 @@ class Design(TimeStampedModel):
                 'design_description': design.description,
                 'design_theme_id': design.theme.id,
                 'design_theme_name': design.theme.name,
-                'design_theme_image_url': s3_engine.generate_presigned_s3_url(design.theme.icon_1_path),
-                'design_image_url': s3_engine.generate_presigned_s3_url(design.image_path),
+                'design_theme_image_url': image_urls.get(design.theme.icon_1_path),
+                'design_image_url': image_urls.get(image_paths[design.id]),
                 'design_nb_likes': design.num_likes,
-                'design_previews': [s3_engine.generate_presigned_s3_url(preview.image_path) for preview in design.design_previews.all()],
+                'design_previews': [image_urls.get(preview_path) for preview_path in preview_paths[design.id]],
                 'design_tags': design.tags,
+                'design_colors': [color['hex'] for color in design.color_palette or []],
                 'design_price': design.base_price,
                 'latest_publication_date': design.latest_publication_date,
             }
@@ -494,10 +575,22 @@ class Design(TimeStampedModel):
             design_data['design_usage_parameters'] = design_usage_parameters
             result['designs_list'].append(design_data)
 
-        result["count"] = cls.objects.filter(q_objects).count()
+        result.update(page_info)
         
         return result
     
+    @staticmethod
+    def get_designs_cache_tags(designs: dict) -> set:
+        """
+        Cache tags of the designs, themes, stores, workshops and organizations displayed in a page of the designs catalog
+        """
+        items = designs["designs_list"]
+        return (tags_of_ids('design', [item['design_id'] for item in items]) |
+                tags_of_ids('theme', [item['design_details'].get('design_theme_id') for item in items]) |
+                tags_of_ids('store', [item['design_owner'].get('store_id') for item in items]) |
+                tags_of_ids('workshop', [item['design_owner'].get('workshop_id') for item in items]) |
+                tags_of_ids('organization', [item['design_owner'].get('organization_id') for item in items]))
+
     @classmethod
     def get_full_design_details(cls, design_id:str):
         """
@@ -516,7 +609,6 @@ class Design(TimeStampedModel):
         design = (cls.objects.filter( Q(workshop__is_active=True) | Q(workshop_id=None),id=design_id, status=cls.APPROVED, to_be_published=True, regular_user=None)
                                     .select_related('store__storeprofile', 'store__designer_profile', 'workshop__organization', 'theme')
                                     .prefetch_related('design_previews')
-                                    .annotate(num_likes=models.Count('design_likes'))
                                     .first())
         
         print(design)
@@ -524,18 +616,22 @@ class Design(TimeStampedModel):
             print('Design not found')
             return None
         design_full_details: dict = {}
+        # Sign all the images of the design at once
+        image_urls = s3_engine.urls_for([design.image_path, *[preview.image_path for preview in design.design_previews.all()]] +
+                                        ([design.store.storeprofile.store_logo_path, design.store.storeprofile.store_banner_path] if design.store else []) +
+                                        ([design.workshop.organization.orgprofile.logo_path, design.workshop.organization.orgprofile.banner_path] if design.workshop else []))
         # Design title, description , image path, tags, price, theme id and name
         design_details = {
             'design_id': design.id,
             'design_title': design.title,
             'design_description': design.description,
-            'design_image_url': s3_engine.generate_presigned_s3_url(design.image_path),
+            'design_image_url': image_urls.get(design.image_path),
             'design_tags': design.tags,
             'design_price': design.base_price,
             'design_theme_id': design.theme.id,
             'design_theme_name': design.theme.name,
             'design_nb_likes': design.num_likes,
-            'design_previews': [s3_engine.generate_presigned_s3_url(preview.image_path) for preview in design.design_previews.all()],
+            'design_previews': [image_urls.get(preview.image_path) for preview in design.design_previews.all()],
         }
         design_owner = {}
         if design.store:
@@ -544,8 +640,8 @@ class Design(TimeStampedModel):
                 'store_name': design.store.name,
                 'store_id': design.store.id,
                 'store_sponsored': design.store.storeprofile.is_sponsored,
-                'store_logo_url': s3_engine.generate_presigned_s3_url(design.store.storeprofile.store_logo_path),
-                'store_banner_url': s3_engine.generate_presigned_s3_url(design.store.storeprofile.store_banner_path),
+                'store_logo_url': image_urls.get(design.store.storeprofile.store_logo_path),
+                'store_banner_url': image_urls.get(design.store.storeprofile.store_banner_path),
             }
         elif design.workshop:
             design_owner = {
@@ -556,8 +652,8 @@ class Design(TimeStampedModel):
                 'organization_business_name': design.workshop.organization.business_name,
                 'organization_id': design.workshop.organization.id,
                 'organization_sponsored': design.workshop.organization.orgprofile.is_sponsored,
-                'organization_logo_url': s3_engine.generate_presigned_s3_url(design.workshop.organization.orgprofile.logo_path),
-                'organization_banner_url': s3_engine.generate_presigned_s3_url(design.workshop.organization.orgprofile.banner_path),
+                'organization_logo_url': image_urls.get(design.workshop.organization.orgprofile.logo_path),
+                'organization_banner_url': image_urls.get(design.workshop.organization.orgprofile.banner_path),
                 'organization_social_media_links': json.loads(design.workshop.organization.orgprofile.social_media_links),
             }
         design_usage_parameters = {}
@@ -584,18 +680,89 @@ class Design(TimeStampedModel):
         design_full_details['design_usage_parameters'] = design_usage_parameters
         return design_full_details
 
-    
-    def like(self, account_profile: AccountProfile):
+    @classmethod
+    def refresh_search_documents(cls, design_ids: list[str]):
         """
-        This method is used to like a design, it creates a design like object
+        Rebuild the search text and the search document of the given designs from the design, its theme and its owner
         """
-        DesignLike.objects.create(design=self, account_profile=account_profile)
-    
-    def unlike(self, account_profile: AccountProfile):
+        designs = list(cls.objects.filter(id__in=design_ids)
+                       .select_related('theme', 'store__storeprofile', 'workshop__organization')
+                       .only('id', 'title', 'description', 'tags',
+                             'theme__name', 'theme__description',
+                             'store__name', 'store__storeprofile__biography',
+                             'workshop__name', 'workshop__organization__business_name', 'workshop__organization__description'))
+        if not designs:
+            return
+
+        for design in designs:
+            store_profile = getattr(design.store, 'storeprofile', None) if design.store else None
+            organization = design.workshop.organization if design.workshop else None
+            search_parts = [
+                design.title, design.description, design.tags,
+                design.theme.name if design.theme else None,
+                design.theme.description if design.theme else None,
+                design.store.name if design.store else None,
+                store_profile.biography if store_profile else None,
+                design.workshop.name if design.workshop else None,
+                organization.business_name if organization else None,
+                organization.description if organization else None,
+            ]
+            design.search_text = " ".join(part for part in search_parts if part).lower()
+
+        with transaction.atomic():
+            cls.objects.bulk_update(designs, ['search_text'])
+            # The search document is computed by the database from the freshly written columns
+            cls.objects.filter(id__in=[design.id for design in designs]).update(search_document=build_search_vector(cls.SEARCH_WEIGHTS))
+
+
+    @classmethod
+    def like(cls, design_id: str, account_id: str) -> bool:
+        """
+        This method is used to like a design for the profile of an account, it creates a design like object and increments
+        the likes counter of the design in the same transaction.
+        Returns False if the design was already liked, raises a Design.DoesNotExist if the design doesn't exist
+        and an AccountProfile.DoesNotExist if the account has no profile
+        """
+        with transaction.atomic():
+            # A single statement inserts the like, the unique constraint makes a second like a no-op.
+            # The design is joined instead of relying on the foreign key : the constraint is deferred until the commit of the request
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {DesignLike._meta.db_table} (id, design_id, account_profile_id, created_at, updated_at) "
+                    f"SELECT %s, design.id, profile.id, NOW(), NOW() FROM {AccountProfile._meta.db_table} profile, {cls._meta.db_table} design "
+                    f"WHERE profile.account_id = %s AND design.id = %s "
+                    f"ON CONFLICT (design_id, account_profile_id) DO NOTHING RETURNING id",
+                    [uuid4(), account_id, design_id])
+                liked = cursor.fetchone() is not None
+            if liked:
+                cls.objects.filter(id=design_id).update(num_likes=F('num_likes') + 1)
+                # The raw SQL and the update send no signal, the cached pages showing the design are invalidated here
+                invalidate_tags_on_commit(tags_of_ids('design', [design_id]))
+            # Nothing is inserted without the design or the profile either, it's not a conflict
+            elif not cls.objects.filter(id=design_id).exists():
+                raise cls.DoesNotExist("The design doesn't exist")
+            elif not AccountProfile.objects.filter(account_id=account_id).exists():
+                raise AccountProfile.DoesNotExist("The account has no profile")
+        return liked
+
+    @classmethod
+    def unlike(cls, design_id: str, account_id: str) -> bool:
         """
-        This method is used to unlike a design, it deletes the design like object
+        This method is used to unlike a design for the profile of an account, it deletes the design like object and decrements
+        the likes counter of the design in the same transaction.
+        Returns False if the design wasn't liked
         """
-        DesignLike.objects.filter(design=self, account_profile=account_profile).delete()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {DesignLike._meta.db_table} WHERE design_id = %s AND account_profile_id = "
+                    f"(SELECT id FROM {AccountProfile._meta.db_table} WHERE account_id = %s) RETURNING id",
+                    [design_id, account_id])
+                unliked = cursor.fetchone() is not None
+            if unliked:
+                cls.objects.filter(id=design_id).update(num_likes=F('num_likes') - 1)
+                invalidate_tags_on_commit(tags_of_ids('design', [design_id]))
+        return unliked
 
     def is_liked_by(self, account_profile: AccountProfile):
         """
@@ -603,6 +770,71 @@ class Design(TimeStampedModel):
         """
         return DesignLike.objects.filter(design=self, account_profile=account_profile).exists()
 
+    @classmethod
+    def get_liked_design_ids(cls, account_id: str, design_ids: list[str]) -> set[str]:
+        """
+        This method returns the ids of the designs liked by the profile of an account among the given designs, in a single query
+        """
+        if not design_ids:
+            return set()
+        return {str(design_id) for design_id in DesignLike.objects.filter(account_profile__account_id=account_id, design_id__in=design_ids)
+                                                                  .values_list('design_id', flat=True)}
+
+    @classmethod
+    def visible_to(cls, account_id: str) -> Q:
+        """
+        This method returns the filter of the designs an account can see : the published designs and its own designs
+        (uploaded or generated by its profile, or belonging to one of its stores)
+        """
+        return (Q(status=cls.APPROVED, to_be_published=True) |
+                Q(regular_user__account_id=account_id) |
+                Q(store__designer_profile__account_profile__account_id=account_id))
+
+    @classmethod
+    def find_possible_duplicates(cls, image_dhash: int, account_id: str, max_distance: int = MAX_DUPLICATE_DISTANCE,
+                                 exclude_design_id: str = None, limit: int = 10) -> list[dict]:
+        """
+        This method returns the designs visible to an account whose image is within max_distance bits (Hamming distance)
+        of a dHash, closest first.
+        Two hashes that close share at least one of their 4 bands, so the candidates are found with exact lookups on the
+        indexed bands and only them are compared bit by bit
+        """
+        max_distance = min(max_distance, MAX_DUPLICATE_DISTANCE)
+        q_objects = Q()
+        for band, band_value in enumerate(dhash_bands(image_dhash)):
+            q_objects |= Q(**{f'image_dhash_band_{band}': band_value})
+        candidates = cls.objects.filter(q_objects).filter(cls.visible_to(account_id)).values('id', 'title', 'image_dhash', 'store_id', 'workshop_id')
+        if exclude_design_id:
+            candidates = candidates.exclude(id=exclude_design_id)
+
+        duplicates = []
+        for candidate in candidates:
+            distance = hamming_distance(image_dhash, candidate['image_dhash'])
+            if distance <= max_distance:
+                duplicates.append({
+                    "design_id": candidate['id'],
+                    "design_title": candidate['title'],
+                    "distance": distance,
+                    "store_id": candidate['store_id'],
+                    "workshop_id": candidate['workshop_id'],
+                })
+        duplicates.sort(key=lambda duplicate: duplicate['distance'])
+        return duplicates[:limit]
+
+    @classmethod
+    def reconcile_likes(cls) -> int:
+        """
+        Recompute the likes counters which drifted from the actual number of likes, returns the number of fixed designs
+        """
+        actual_likes = Coalesce(Subquery(DesignLike.objects.filter(design=OuterRef('pk'))
+                                         .values('design').annotate(total=Count('id')).values('total')), 0)
+        drifted_ids = list(cls.objects.annotate(actual_likes=actual_likes)
+                           .exclude(num_likes=F('actual_likes'))
+                           .values_list('id', flat=True))
+        if drifted_ids:
+            cls.objects.filter(id__in=drifted_ids).update(num_likes=actual_likes)
+        return len(drifted_ids)
+
 
 #########################################
 #        Design likes model             #
@@ -634,9 +866,191 @@ class DesignPreview(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     design = models.ForeignKey(Design, on_delete=models.CASCADE, related_name='design_previews')
     image_path = models.CharField(max_length=255, null=True, blank=True)
+    has_image_derivatives = models.BooleanField(default=False)
 
     class Meta:
         db_table = 'design_previews'
 
     def __str__(self):
-        return self.design.title + " - " + str(self.id)
\ No newline at end of file
+        return self.design.title + " - " + str(self.id)
+
+#########################################
+#     AI design generation jobs         #
+#########################################
+class AiGenerationJob(TimeStampedModel):
+    """
+    An AI design generation requested by a user, the generation runs in the background workers (see designs/api/v1/services.py) :
+    - account profile which requested the generation
+    - status : pending until a worker picks the job, then running, and finally succeeded or failed
+    - parameters of the stability request
+    - gems cost, reserved in the gem ledger when the job is created, spent if the generation succeeds and released if it fails
+    - s3 path of the generated image, or the error of the generation
+    """
+    ## Status choices
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    account_profile = models.ForeignKey(AccountProfile, on_delete=models.CASCADE, related_name='ai_generation_jobs')
+    status = models.CharField(max_length=255, choices=STATUS, default=PENDING)
+
+    stability_model = models.CharField(max_length=255)
+    parameters = models.JSONField(default=dict, blank=True)
+    gems_cost = models.IntegerField(default=0)
+    gem_ledger_entry = models.OneToOneField(GemLedgerEntry, on_delete=models.SET_NULL, null=True, blank=True,
+                                            related_name='ai_generation_job')
+
+    s3_path = models.CharField(max_length=1024, null=True, blank=True)
+    has_image_derivatives = models.BooleanField(default=False)
+    error = models.CharField(max_length=1024, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ai_generation_jobs'
+        indexes = [
+            models.Index(fields=['account_profile', '-created_at'], name='ai_jobs_account_idx'),
+        ]
+
+    def __str__(self):
+        return self.stability_model + " - " + self.status + " - " + str(self.id)
+
+    def to_dict(self) -> dict:
+        """
+        Status of the job as it's returned to its owner, the image URL is only given once the generation succeeded
+        """
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stability_model": self.stability_model,
+            "gems_cost": self.gems_cost,
+            "image_url": s3_engine.url_for(self.s3_path) if self.status == self.SUCCEEDED else None,
+            "thumbnail_url": (s3_engine.url_for(derivative_or_original(self.s3_path, self.has_image_derivatives))
+                              if self.status == self.SUCCEEDED else None),
+            "error": self.error if self.status == self.FAILED else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+#########################################
+#      AI generations cache model       #
+#########################################
+class AiGenerationCacheEntry(TimeStampedModel):
+    """
+    Image already generated for a set of stability parameters. Stability returns the same image for the same parameters when
+    the seed is fixed, so these generations are served from the stored object instead of paying a new request :
+    - cache key : sha256 of the canonical parameters (see build_cache_key)
+    - s3 path of the image, under the ai_generations folder of the bucket
+    - number of hits and date of the last one
+    - expiry date, the bucket lifecycle deletes the objects of the folder a day after the entries expire
+    """
+    # Prefix of the hit / miss counters in the cache
+    STATS_CACHE_PREFIX = "ai_generation_cache"
+    # Parameters which identify a generation, the other ones don't change the image
+    KEY_PARAMETERS = ("prompt", "negative_prompt", "seed", "aspect_ratio", "output_format", "style_preset", "mode", "sd3_model")
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    cache_key = models.CharField(max_length=64, unique=True)
+    stability_model = models.CharField(max_length=255)
+    parameters = models.JSONField(default=dict, blank=True)
+    s3_path = models.CharField(max_length=1024)
+    num_hits = models.IntegerField(default=0)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'ai_generation_cache_entries'
+
+    def __str__(self):
+        return self.stability_model + " - " + self.cache_key
+
+    @classmethod
+    def ttl(cls) -> timedelta:
+        return timedelta(days=getattr(settings, "AI_GENERATION_CACHE_TTL_DAYS", 30))
+
+    @classmethod
+    def build_cache_key(cls, stability_model: str, parameters: dict) -> Optional[str]:
+        """
+        Returns the cache key of a generation, None if it can't be cached : with a random seed (0) every generation is different
+        """
+        if not parameters.get("seed"):
+            return None
+        canonical = {"stability_model": stability_model}
+        for name in cls.KEY_PARAMETERS:
+            value = parameters.get(name)
+            if value in (None, ""):
+                continue
+            canonical[name] = " ".join(value.split()) if isinstance(value, str) else value
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def lookup(cls, cache_key: str) -> Optional[str]:
+        """
+        Returns the s3 path of the image of a cache key, None if it's not cached or expired. The lookup is counted as a hit or a miss
+        """
+        s3_path = cls.objects.filter(cache_key=cache_key, expires_at__gt=timezone.now()).values_list('s3_path', flat=True).first()
+        if s3_path is None:
+            cls._record_lookup("misses")
+            return None
+        cls.objects.filter(cache_key=cache_key).update(num_hits=F('num_hits') + 1, last_hit_at=timezone.now())
+        cls._record_lookup("hits")
+        return s3_path
+
+    @classmethod
+    def store(cls, cache_key: str, stability_model: str, parameters: dict, s3_path: str):
+        """
+        Cache the image of a generation, an expired entry of the same key is replaced.
+        The expiry date isn't extended by the hits : the object is deleted by the bucket lifecycle counting from its upload
+        """
+        cls.objects.update_or_create(cache_key=cache_key,
+                                     defaults={"stability_model": stability_model,
+                                               "parameters": parameters,
+                                               "s3_path": s3_path,
+                                               "num_hits": 0,
+                                               "last_hit_at": None,
+                                               "expires_at": timezone.now() + cls.ttl()})
+
+    @classmethod
+    def purge_expired(cls) -> list[str]:
+        """
+        Delete the expired entries and return the s3 paths of their images
+        """
+        expired = cls.objects.filter(expires_at__lte=timezone.now())
+        s3_paths = list(expired.values_list('s3_path', flat=True))
+        expired.delete()
+        return s3_paths
+
+    @classmethod
+    def _record_lookup(cls, counter: str):
+        cache_key = f"{cls.STATS_CACHE_PREFIX}:{counter}"
+        try:
+            cache.incr(cache_key)
+        except ValueError:
+            # The counter doesn't exist yet, another process may create it meanwhile
+            if not cache.add(cache_key, 1, timeout=None):
+                cache.incr(cache_key)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        """
+        Hits and misses of the cache lookups since the counters were created
+        """
+        counters = cache.get_many([f"{cls.STATS_CACHE_PREFIX}:hits", f"{cls.STATS_CACHE_PREFIX}:misses"])
+        hits = counters.get(f"{cls.STATS_CACHE_PREFIX}:hits", 0)
+        misses = counters.get(f"{cls.STATS_CACHE_PREFIX}:misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else None,
+            "entries": cls.objects.filter(expires_at__gt=timezone.now()).count(),
+        }
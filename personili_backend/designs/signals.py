@@ -0,0 +1,93 @@
+# Django
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Models
+from designs.models import Design, DesignPreview, AiGenerationJob, Theme, Store, StoreProfile
+from organizations.models import Organization, Workshop
+
+# Utils
+from utils.catalog_cache import invalidate_tags_on_commit, tag, track_catalog_changes
+from utils.images.pipeline import track_image_derivatives
+
+
+#########################################
+#       Design search documents sync    #
+#########################################
+def schedule_search_refresh(design_ids):
+    """
+    Refresh the search documents of the given designs once the current transaction is committed
+    """
+    design_ids = {design_id for design_id in design_ids if design_id}
+    if design_ids:
+        transaction.on_commit(lambda: Design.refresh_search_documents(design_ids))
+
+
+@receiver(post_save, sender=Design)
+def refresh_search_on_design_change(sender, instance, **kwargs):
+    schedule_search_refresh([instance.id])
+
+
+@receiver(post_save, sender=Theme)
+def refresh_search_on_theme_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Design.objects.filter(theme_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Store)
+def refresh_search_on_store_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Design.objects.filter(store_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=StoreProfile)
+def refresh_search_on_store_profile_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Design.objects.filter(store_id=instance.store_id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Workshop)
+def refresh_search_on_workshop_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Design.objects.filter(workshop_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Organization)
+def refresh_search_on_organization_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Design.objects.filter(workshop__organization_id=instance.id).values_list('id', flat=True)))
+
+
+#########################################
+#     Catalog cache invalidation        #
+#########################################
+# Fields filtering and ordering the designs catalog (see Design.get_designs), the other saves only evict the pages showing the design.
+# The palette written by the images pipeline isn't one of them : the pages filtered by color get the design when they expire
+track_catalog_changes(Design, 'designs', 'design', ['status', 'to_be_published', 'regular_user', 'workshop', 'store', 'theme',
+                                                    'base_price', 'latest_publication_date', 'tags', 'sponsored',
+                                                    'title', 'description', 'num_likes'])
+
+
+@receiver([post_save, post_delete], sender=Theme)
+def invalidate_catalog_on_theme_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('theme', instance.id)])
+
+
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_catalog_on_store_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('store', instance.id)])
+
+
+@receiver([post_save, post_delete], sender=StoreProfile)
+def invalidate_catalog_on_store_profile_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('store', instance.store_id)])
+
+
+@receiver([post_save, post_delete], sender=DesignPreview)
+def invalidate_catalog_on_design_preview_change(sender, instance, **kwargs):
+    # The previews (and their thumbnails) are shown in the cards of their design
+    invalidate_tags_on_commit([tag('design', instance.design_id)])
+
+
+#########################################
+#     Image derivatives generation      #
+#########################################
+track_image_derivatives(Design, 'image_path', 'has_image_derivatives', dhash_field='image_dhash', palette_field='color_palette')
+track_image_derivatives(DesignPreview, 'image_path', 'has_image_derivatives')
+track_image_derivatives(AiGenerationJob, 's3_path', 'has_image_derivatives')
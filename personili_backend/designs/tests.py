@@ -1,3 +1,121 @@
+from uuid import uuid4
+
 from django.test import TestCase
 
-# Create your tests here.
+# Models
+from accounts.models import AccountProfile
+from designs.models import Design, DesignLike
+
+# Factories
+from accounts.factories import AccountFactory, AccountProfileFactory
+from designs.factories import DesignFactory
+
+# Utils
+from utils.catalog_cache import get_tag_versions, tag
+from utils.images.hashing import dhash_bands
+
+
+class DesignLikesTestCase(TestCase):
+    """
+    Liking and unliking a design keeps its likes counter in sync with the design likes
+    """
+    def setUp(self):
+        self.design = DesignFactory()
+        self.account_profile = AccountProfileFactory()
+        self.account_id = self.account_profile.account_id
+
+    def assertLikes(self, num_likes: int):
+        self.assertEqual(Design.objects.get(id=self.design.id).num_likes, num_likes)
+        self.assertEqual(DesignLike.objects.filter(design=self.design).count(), num_likes)
+
+    def test_like_and_unlike(self):
+        self.assertTrue(Design.like(self.design.id, self.account_id))
+        self.assertLikes(1)
+        self.assertTrue(self.design.is_liked_by(self.account_profile))
+
+        self.assertTrue(Design.unlike(self.design.id, self.account_id))
+        self.assertLikes(0)
+        self.assertFalse(self.design.is_liked_by(self.account_profile))
+
+    def test_second_like_is_ignored(self):
+        Design.like(self.design.id, self.account_id)
+
+        self.assertFalse(Design.like(self.design.id, self.account_id))
+        self.assertLikes(1)
+
+    def test_unlike_without_like_is_ignored(self):
+        self.assertFalse(Design.unlike(self.design.id, self.account_id))
+        self.assertLikes(0)
+
+    def test_likes_of_several_accounts(self):
+        other_account_id = AccountProfileFactory().account_id
+
+        Design.like(self.design.id, self.account_id)
+        Design.like(self.design.id, other_account_id)
+        self.assertLikes(2)
+        self.assertEqual(Design.get_liked_design_ids(other_account_id, [self.design.id]), {str(self.design.id)})
+
+        Design.unlike(self.design.id, self.account_id)
+        self.assertLikes(1)
+
+    def test_likes_invalidate_the_cached_pages_of_the_design(self):
+        design_tag = tag('design', self.design.id)
+        version = get_tag_versions([design_tag])[design_tag]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Design.like(self.design.id, self.account_id)
+        self.assertEqual(get_tag_versions([design_tag])[design_tag], version + 1)
+
+        # Nothing changed, the pages stay cached
+        other_account_id = AccountProfileFactory().account_id
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Design.like(self.design.id, self.account_id)
+            Design.unlike(self.design.id, other_account_id)
+        self.assertEqual(len(callbacks), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Design.unlike(self.design.id, self.account_id)
+        self.assertEqual(get_tag_versions([design_tag])[design_tag], version + 2)
+
+    def test_like_of_a_missing_design(self):
+        with self.assertRaises(Design.DoesNotExist):
+            Design.like(uuid4(), self.account_id)
+
+    def test_like_of_an_account_without_profile(self):
+        account = AccountFactory()
+
+        with self.assertRaises(AccountProfile.DoesNotExist):
+            Design.like(self.design.id, account.id)
+        self.assertLikes(0)
+
+
+class DesignDuplicatesTestCase(TestCase):
+    """
+    The near duplicates of an image are looked up among the designs the account can see
+    """
+    IMAGE_DHASH = 0x0123456789ABCDEF
+
+    def setUp(self):
+        self.account_profile = AccountProfileFactory()
+        self.account_id = self.account_profile.account_id
+
+    def create_hashed_design(self, **kwargs) -> Design:
+        design = DesignFactory(**kwargs)
+        bands = {f'image_dhash_band_{band}': band_value for band, band_value in enumerate(dhash_bands(self.IMAGE_DHASH))}
+        Design.objects.filter(id=design.id).update(image_dhash=self.IMAGE_DHASH, **bands)
+        return design
+
+    def test_only_published_and_own_designs_are_returned(self):
+        published_design = self.create_hashed_design(regular_user=None, store=None, status=Design.APPROVED, to_be_published=True)
+        own_design = self.create_hashed_design(regular_user=self.account_profile)
+        # Pending, rejected and unpublished designs, and the private designs of the other accounts
+        self.create_hashed_design(regular_user=None, store=None, status=Design.PENDING, to_be_published=True)
+        self.create_hashed_design(regular_user=None, store=None, status=Design.REJECTED, to_be_published=True)
+        self.create_hashed_design(regular_user=None, store=None, status=Design.APPROVED, to_be_published=False)
+        self.create_hashed_design(regular_user=AccountProfileFactory())
+
+        duplicates = Design.find_possible_duplicates(self.IMAGE_DHASH ^ 1, self.account_id)
+
+        self.assertEqual({duplicate['design_id'] for duplicate in duplicates}, {published_design.id, own_design.id})
+        self.assertTrue(all(duplicate['distance'] == 1 and 'regular_user_id' not in duplicate for duplicate in duplicates))
+        self.assertFalse(Design.objects.filter(Design.visible_to(AccountProfileFactory().account_id), id=own_design.id).exists())
@@ -0,0 +1,27 @@
+# Django
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Models
+from organizations.models import Organization, OrganizationProfile, Workshop
+
+# Utils
+from utils.catalog_cache import invalidate_tags_on_commit, tag
+
+
+#########################################
+#     Catalog cache invalidation        #
+#########################################
+@receiver([post_save, post_delete], sender=Organization)
+def invalidate_catalog_on_organization_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('organization', instance.id)])
+
+
+@receiver([post_save, post_delete], sender=OrganizationProfile)
+def invalidate_catalog_on_organization_profile_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('organization', instance.organization_id)])
+
+
+@receiver([post_save, post_delete], sender=Workshop)
+def invalidate_catalog_on_workshop_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('workshop', instance.id), tag('organization', instance.organization_id)])
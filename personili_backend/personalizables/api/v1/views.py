@@ -8,6 +8,8 @@ from rest_framework.generics import get_object_or_404
 from personalizables.models import Department, Category, Option, PersonalizationType, PersonalizationMethod, Personalizable, PersonalizableVariant, PersonalizableZone
 from accounts.models import AccountProfile
 from utils.validators import is_all_valid_uuid4
+from utils.pagination import parse_cursor_pagination, parse_count_mode
+from utils.catalog_cache import cached_catalog_page, tags_of_ids
 
 # Standard imports
 from typing import List
@@ -104,6 +106,7 @@ class PersonalizableViewSet(viewsets.ViewSet):
         sponsored_personalizables = request.data.get('sponsored_personalizables', None)
 
         search_term = request.data.get('search_term', None)
+        sort_by = request.data.get('sort_by', None)
 
         ####################### Query parameters validation ########################
         if offset and limit:
@@ -119,6 +122,23 @@ class PersonalizableViewSet(viewsets.ViewSet):
         else:
             offset = 0
             limit = 20
+
+        try:
+            cursor, page_size = parse_cursor_pagination(request.data)
+        except ValueError:
+            logger.debug("cursor should be a valid cursor and page_size a positive integer less than 50")
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            count_mode = parse_count_mode(request.data)
+        except ValueError:
+            logger.debug("count_mode should be total or has_more")
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        ##### sort_by can only be the relevance to the search term
+        if sort_by and (sort_by != "relevance" or not search_term):
+            logger.debug("sort_by should be relevance and can only be used with a search term")
+            return Response({"error": "BAD_REQUEST"}, status=400)
         
         if max_price and min_price:
             if not (max_price.isdigit() and min_price.isdigit()):
@@ -227,9 +247,11 @@ class PersonalizableViewSet(viewsets.ViewSet):
                 return Response({"error": "BAD_REQUEST"}, status=400)
         
         try:
-            response_data: List[dict] = Personalizable.get_personalizables(
+            params = dict(
                 offset=offset,
                 limit=limit,
+                cursor=cursor,
+                page_size=page_size,
                 min_price=min_price,
                 max_price=max_price,
                 brands=brands,
@@ -244,8 +266,18 @@ class PersonalizableViewSet(viewsets.ViewSet):
                 sponsored_personalizables=sponsored_personalizables,
                 sponsored_organizations=sponsored_organizations,
                 sponsored_workshops=sponsored_workshops,
-                search_term=search_term
+                search_term=search_term,
+                sort_by_relevance=sort_by == "relevance",
+                count_mode=count_mode
             )
+            # Anonymous catalog pages are served from the cache, they are evicted when an object they touch changes
+            response_data: dict = cached_catalog_page("personalizables", params,
+                                                      compute=lambda: Personalizable.get_personalizables(**params),
+                                                      tags_of=Personalizable.get_personalizables_cache_tags,
+                                                      filter_tags=(tags_of_ids('category', category_ids) |
+                                                                   tags_of_ids('department', departement_ids) |
+                                                                   tags_of_ids('workshop', workshop_ids) |
+                                                                   tags_of_ids('organization', organization_ids)))
             return Response(response_data, status=status.HTTP_200_OK)
         except Exception as e:
             logging.error(f"UNKNOWN_ERROR : {e}")
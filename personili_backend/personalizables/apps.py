@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PersonalizablesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'personalizables'
+
+    def ready(self):
+        # Connect the signal handlers keeping the personalizable search documents up to date
+        import personalizables.signals  # noqa F401
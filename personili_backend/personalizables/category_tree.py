@@ -0,0 +1,119 @@
+# Standard imports
+import threading
+from types import MappingProxyType
+
+# Django
+from django.core.cache import cache
+
+
+#########################################
+#     In memory category tree           #
+#########################################
+# Version of the category tree shared by all the processes, bumped whenever a category changes
+CATEGORY_TREE_VERSION_KEY = "category_tree:version"
+
+# Only these categories are displayed in the category tree
+DISPLAYED_AVAILABILITY_STATUSES = ('Available', 'ComingSoon')
+
+
+class CategoryTree:
+    """
+    Immutable snapshot of the whole category tree, built from a single query.
+    It answers the taxonomy lookups (leaf descendants, displayed tree) without hitting the database.
+    """
+
+    def __init__(self, categories: list[dict], version: int):
+        self.version = version
+
+        children = {}
+        for category in categories:
+            children.setdefault(category["parent_category_id"], []).append(category["id"])
+        self.categories = MappingProxyType({category["id"]: category for category in categories})
+        self.children = MappingProxyType({parent_id: tuple(child_ids) for parent_id, child_ids in children.items()})
+
+        # Leaf descendants of every category, a leaf category is its own single leaf
+        leaves = {}
+
+        def collect_leaves(category_id):
+            if category_id not in leaves:
+                child_ids = self.children.get(category_id, ())
+                leaves[category_id] = tuple(leaf_id for child_id in child_ids for leaf_id in collect_leaves(child_id)) if child_ids else (category_id,)
+            return leaves[category_id]
+
+        for category_id in self.categories:
+            collect_leaves(category_id)
+        self.leaves = MappingProxyType(leaves)
+
+        self.displayed_tree = self._render(None)
+
+    def _render(self, parent_id) -> tuple:
+        """
+        Render the displayed categories under a parent in the format of the categories endpoint
+        """
+        rendered = []
+        for category_id in self.children.get(parent_id, ()):
+            category = self.categories[category_id]
+            if category["availability_status"] not in DISPLAYED_AVAILABILITY_STATUSES:
+                continue
+            rendered.append(MappingProxyType({
+                "id": category["id"],
+                "name": category["name"],
+                "description": category["description"],
+                "image_path_1": category["image_path_1"],
+                "image_path_2": category["image_path_2"],
+                "image_path_3": category["image_path_3"],
+                "sub_categories": self._render(category_id),
+            }))
+        return tuple(rendered)
+
+    def get_leaf_categories(self, category_ids: list) -> list[str]:
+        """
+        Returns the leaf descendants of the given categories, unknown ids are returned as they are
+        """
+        leaf_ids = []
+        for category_id in category_ids:
+            leaf_ids.extend(self.leaves.get(str(category_id), (str(category_id),)))
+        return list(dict.fromkeys(leaf_ids))
+
+    def get_displayed_tree(self, parent_category_id=None) -> tuple:
+        if parent_category_id is None:
+            return self.displayed_tree
+        return self._render(str(parent_category_id))
+
+
+_snapshot: CategoryTree = None
+_snapshot_lock = threading.Lock()
+
+
+def get_category_tree() -> CategoryTree:
+    """
+    Returns the category tree snapshot of the current process, rebuilt when a category changed since it was built
+    """
+    global _snapshot
+    version = cache.get(CATEGORY_TREE_VERSION_KEY, 0)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            # Imported here since the models use the tree
+            from personalizables.models import Category
+            categories = [{**category, "id": str(category["id"]),
+                           "parent_category_id": str(category["parent_category_id"]) if category["parent_category_id"] else None}
+                          for category in Category.objects.order_by('path').values(
+                              'id', 'name', 'description', 'parent_category_id', 'availability_status',
+                              'image_path_1', 'image_path_2', 'image_path_3')]
+            _snapshot = CategoryTree(categories, version)
+        return _snapshot
+
+
+def invalidate_category_tree():
+    """
+    Make every process rebuild its category tree snapshot on its next lookup
+    """
+    if not cache.add(CATEGORY_TREE_VERSION_KEY, 1, timeout=None):
+        try:
+            cache.incr(CATEGORY_TREE_VERSION_KEY)
+        except ValueError:
+            cache.set(CATEGORY_TREE_VERSION_KEY, 1, timeout=None)
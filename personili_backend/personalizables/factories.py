@@ -1,5 +1,6 @@
 from personalizables.models import Department, Category, Personalizable, PersonalizableOption, PersonalizableVariant, PersonalizableVariantValue, PersonalizableZone, DesignedPersonalizableVariant, DesignedPersonalizableZone, Option, OptionValue, PersonalizationType, PersonalizationMethod
 from designs.factories import DesignFactory
+from organizations.factories import WorkshopFactory
 from personalizables.models import DesignedZoneRelatedDesign
 
 # factory boy imports
@@ -343,15 +344,15 @@ class PersonalizableFactory(DjangoModelFactory):
     class Meta:
         model = Personalizable
 
-    workshop = None
+    workshop = factory.SubFactory(WorkshopFactory)
     name = Faker('sentence')
     description = Faker('text')
     
     brand = Faker('name')
     model = Faker('name')
 
-    category = None
-    department = None
+    category = factory.SubFactory(CategoryFactory)
+    department = factory.SubFactory(DepartmentFactory)
 
     @factory.post_generation
     def related_designs(self, create, extracted, **kwargs):
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-17 19:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0003_design_search"),
+        ("personalizables", "0006_alter_personalizablevariantvalue_option_value_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="personalizable",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="personalizable",
+            name="search_document",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="personalizable",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_document"], name="personalizables_search_gin"),
+        ),
+        migrations.AddIndex(
+            model_name="personalizable",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_text"], name="personalizables_search_trgm", opclasses=["gin_trgm_ops"]),
+        ),
+    ]
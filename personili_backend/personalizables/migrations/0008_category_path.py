@@ -0,0 +1,48 @@
+# Generated by Django 5.0 on 2026-10-17 20:30
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    """
+    Compute the materialized path and the depth of the existing categories, from the roots down
+    """
+    Category = apps.get_model("personalizables", "Category")
+    paths = {None: ""}
+    remaining = list(Category.objects.values_list("id", "parent_category_id"))
+    while remaining:
+        pending = []
+        for category_id, parent_id in remaining:
+            if parent_id not in paths:
+                pending.append((category_id, parent_id))
+                continue
+            paths[category_id] = f"{paths[parent_id]}{category_id}/"
+            Category.objects.filter(id=category_id).update(path=paths[category_id], depth=paths[category_id].count("/") - 1)
+        if len(pending) == len(remaining):
+            # The parents of the remaining categories can't be reached (cycle), the first one is handled as a root
+            pending[0] = (pending[0][0], None)
+        remaining = pending
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("personalizables", "0007_personalizable_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="path",
+            field=models.CharField(blank=True, default="", editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(fields=["path"], name="categories_path_idx", opclasses=["varchar_pattern_ops"]),
+        ),
+    ]
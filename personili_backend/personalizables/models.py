@@ -7,7 +7,11 @@ import time
 from django.db import models
 # Django
 from django.db import models
-from django.db.models import Q, Prefetch
+from django.db import transaction
+from django.db.models import Q, F, Value, Prefetch
+from django.db.models.functions import Concat, Substr
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 # Models
 from accounts.models import TimeStampedModel
@@ -17,6 +21,12 @@ from organizations.models import Workshop
 
 # aws
 from utils.aws.storage.s3_engine import s3_engine
+from utils.pagination import paginate_catalog, COUNT_MODE_TOTAL
+from utils.search import build_search_vector, search_filter, search_rank
+from utils.catalog_cache import tags_of_ids
+
+# Category tree snapshot
+from personalizables.category_tree import get_category_tree as get_category_tree_snapshot
 
 
 #######################################################
@@ -104,11 +114,42 @@ class Category(TimeStampedModel):
     image_path_2 = models.CharField(max_length=255, null=True, blank=True)
     image_path_3 = models.CharField(max_length=255, null=True, blank=True)
 
+    # Materialized path : ids of the ancestors and of the category itself, e.g. "<root id>/<parent id>/<id>/"
+    # the descendants of a category are the categories whose path starts with its path
+    path = models.CharField(max_length=1024, default="", blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
     class Meta:
         db_table = 'categories'
+        indexes = [
+            models.Index(fields=['path'], name='categories_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.name + " - " + str(self.id)
+
+    def save(self, *args, **kwargs):
+        """
+        Keep the materialized path of the category and of its descendants in sync with the parent category
+        """
+        parent_path = ""
+        if self.parent_category_id:
+            parent_path = Category.objects.filter(id=self.parent_category_id).values_list('path', flat=True).first() or ""
+            if self.path and parent_path.startswith(self.path):
+                raise ValueError('A category can not be moved under one of its own subcategories')
+        previous_path, previous_depth = self.path, self.depth
+        self.path = f"{parent_path}{self.id}/"
+        self.depth = parent_path.count("/")
+        # The catalog cache invalidation looks at this flag to know if the category moved in the tree
+        self._path_changed = previous_path != self.path
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous_path and self._path_changed:
+                # The category moved, rewrite the paths of its descendants in one statement
+                (Category.objects.filter(path__startswith=previous_path).exclude(id=self.id)
+                 .update(path=Concat(Value(self.path), Substr('path', len(previous_path) + 1)),
+                         depth=F('depth') + (self.depth - previous_depth)))
     
     def get_direct_parent_category(self):
         return self.parent_category
@@ -129,23 +170,10 @@ class Category(TimeStampedModel):
     def get_category_tree(cls, parent_category=None):
         """
         This method returns the entire category tree under a specific parent category, if the parent
-        category is null then the method returns the entire category tree
+        category is null then the method returns the entire category tree.
+        The tree is served from the in memory snapshot (see personalizables/category_tree.py)
         """
-        categories = Category.objects.filter(parent_category=parent_category)
-        category_tree = []
-        for category in categories:
-            if category.availability_status == 'Available' or category.availability_status == 'ComingSoon':
-                category_dict = {}
-                category_dict["id"] = category.id
-                category_dict["name"] = category.name
-                category_dict["description"] = category.description
-                category_dict["image_path_1"] = category.image_path_1
-                category_dict["image_path_2"] = category.image_path_2
-                category_dict["image_path_3"] = category.image_path_3
-                category_dict["sub_categories"] = cls.get_category_tree(category.id)
-                category_tree.append(category_dict)
-        
-        return category_tree
+        return get_category_tree_snapshot().get_displayed_tree(parent_category)
 
 
     @classmethod
@@ -155,16 +183,7 @@ class Category(TimeStampedModel):
         This method takes a list of ids containing categories and returns a list of leaf categories, if a category has subcategories then it is not a leaf category.
         If a category in the category_ids is already a leaf category then it is added to the list of leaf categories
         """
-        leaf_categories = []
-        for category_id in category_ids:
-            # check if the category has subcategories
-            subcategories = Category.objects.filter(parent_category=category_id)
-            if len(subcategories) == 0:
-                leaf_categories.append(category_id)
-            else:
-                leaf_categories.extend(cls.get_leaf_categories_from_list([subcategory.id for subcategory in subcategories]))
-        
-        return leaf_categories
+        return get_category_tree_snapshot().get_leaf_categories(category_ids)
 
 
 ########################################################
@@ -317,10 +336,30 @@ class Personalizable(TimeStampedModel):
     used_with_same_workshop_designs = models.BooleanField(default=False)
     used_with_other_workshop_designs = models.BooleanField(default=False)
     used_with_platform_designs = models.BooleanField(default=False)
+
+    # Search : lower cased texts of the personalizable and of its taxonomy and owner, and the weighted search document built from them
+    search_text = models.TextField(default="", blank=True)
+    search_document = SearchVectorField(null=True, blank=True)
     
 
+    # Catalog order, stable so that the offset and the keyset pagination return the same pages
+    CATALOG_ORDERING = ['id']
+
+    # Weights of the columns in the search document
+    SEARCH_WEIGHTS = {
+        'name': 'A',
+        'brand': 'B',
+        'model': 'B',
+        'description': 'C',
+        'search_text': 'D',
+    }
+
     class Meta:
         db_table = 'personalizables'
+        indexes = [
+            GinIndex(fields=['search_document'], name='personalizables_search_gin'),
+            GinIndex(fields=['search_text'], name='personalizables_search_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
 
     def __str__(self):
@@ -345,7 +384,48 @@ class Personalizable(TimeStampedModel):
             self.is_open_for_personalization = False
 
         super().save()
-    
+
+    @classmethod
+    def refresh_search_documents(cls, personalizable_ids: list[str]):
+        """
+        Rebuild the search text and the search document of the given personalizables from the personalizable, its taxonomy and its owner
+        """
+        personalizables = list(cls.objects.filter(id__in=personalizable_ids)
+                               .select_related('category', 'department', 'workshop__organization')
+                               .only('id', 'name', 'description', 'brand', 'model',
+                                     'category__name', 'department__name',
+                                     'workshop__name', 'workshop__description',
+                                     'workshop__organization__legal_name', 'workshop__organization__business_name'))
+        if not personalizables:
+            return
+
+        for personalizable in personalizables:
+            organization = personalizable.workshop.organization
+            search_parts = [
+                personalizable.name, personalizable.description, personalizable.brand, personalizable.model,
+                personalizable.category.name, personalizable.department.name,
+                personalizable.workshop.name, personalizable.workshop.description,
+                organization.legal_name, organization.business_name,
+            ]
+            personalizable.search_text = " ".join(part for part in search_parts if part).lower()
+
+        with transaction.atomic():
+            cls.objects.bulk_update(personalizables, ['search_text'])
+            # The search document is computed by the database from the freshly written columns
+            cls.objects.filter(id__in=[personalizable.id for personalizable in personalizables]).update(search_document=build_search_vector(cls.SEARCH_WEIGHTS))
+
+    @staticmethod
+    def get_personalizables_cache_tags(personalizables: dict) -> set:
+        """
+        Cache tags of the personalizables, categories, departments, workshops and organizations displayed in a page of the personalizables catalog
+        """
+        items = personalizables["personalizables_list"]
+        return (tags_of_ids('personalizable', [item.get('personalizable_id') for item in items]) |
+                tags_of_ids('category', [item.get('category_id') for item in items]) |
+                tags_of_ids('department', [item.get('department_id') for item in items]) |
+                tags_of_ids('workshop', [item.get('workshop_id') for item in items]) |
+                tags_of_ids('organization', [item.get('organization_id') for item in items]))
+
     @classmethod
     def get_personalizables(cls,
                             search_term: str = None,
@@ -365,7 +445,11 @@ class Personalizable(TimeStampedModel):
                             sponsored_workshops = False,
                             events_ids: List[str] = None,
                             offset = 0,
-                            limit = 5):
+                            limit = 5,
+                            cursor: str = None,
+                            page_size: int = None,
+                            sort_by_relevance: bool = False,
+                            count_mode: str = COUNT_MODE_TOTAL):
                             
         """
         Get a list of personlizables based on a set of filters.
@@ -384,8 +468,10 @@ class Personalizable(TimeStampedModel):
             - sponsored organizations
             - sponsored workshops
             - events
-            - limit and offset
+            - limit and offset, or cursor and page size for the keyset pagination
+            - count_mode : "total" to count the matching personalizables in the query of the page, "has_more" to only tell if there are more
             - most popular (highest sales)
+            - relevance to the search term as first sort key
         - include all the details of each personalizable
         - include infos about the workshop and the organization
         - include all the variants and their options and options values
@@ -396,16 +482,8 @@ class Personalizable(TimeStampedModel):
         q_objects.add(Q(workshop__is_active=True), Q.AND)
         
         if search_term:
-            q_objects.add(Q(name__icontains=search_term) | 
-                            Q(description__icontains=search_term) | 
-                            Q(brand__icontains=search_term) | 
-                            Q(model__icontains=search_term) |
-                            Q(category__name__icontains=search_term) |
-                            Q(department__name__icontains=search_term) |
-                            Q(workshop__name__icontains=search_term) |
-                            Q(workshop__description__icontains=search_term) |
-                            Q(workshop__organization__legal_name__icontains=search_term) |
-                            Q(workshop__organization__business_name__icontains=search_term), Q.AND)
+            # The search document holds the name, description, brand and model, the category and department names and the workshop and organization names
+            q_objects.add(search_filter(search_term), Q.AND)
         if min_price :
             q_objects.add(Q(variants__base_price__gte=min_price), Q.AND)
         if max_price :
@@ -463,7 +541,15 @@ class Personalizable(TimeStampedModel):
                                                 'variants__personalizable_variant_values',
                                                 queryset=variant_value_queryset
                                             )
-                           ))[offset:limit]
+                           )
+                           .defer('search_text', 'search_document'))
+        ordering = cls.CATALOG_ORDERING
+        if search_term and sort_by_relevance:
+            personalizables = personalizables.annotate(search_rank=search_rank(search_term))
+            ordering = ['-search_rank'] + ordering
+
+        # In cursor mode the page starts right after the id of the last personalizable of the previous page
+        personalizables, page_info = paginate_catalog(personalizables, ordering, offset, limit, cursor, page_size, count_mode)
         
 
         result = {"personalizables_list": []}
@@ -513,7 +599,7 @@ class Personalizable(TimeStampedModel):
                     variant_dict["variant_values"].append(variant_value_dict)
                 personalizable_dict["variants"].append(variant_dict)
             result["personalizables_list"].append(personalizable_dict)
-            result["count"] = cls.objects.filter(q_objects).count()
+        result.update(page_info)
         
         return result
 
@@ -539,17 +625,21 @@ class Personalizable(TimeStampedModel):
         personalizable_dict["personalizable_model"] = personalizable.model
         personalizable_dict["personalizable_sponsored"] = personalizable.is_sponsored
         
+        # Sign the category and department images at once
+        image_urls = s3_engine.urls_for([personalizable.category.image_path_1, personalizable.category.image_path_2, personalizable.category.image_path_3,
+                                         personalizable.department.image_path_1, personalizable.department.image_path_2, personalizable.department.image_path_3])
+
         personalizable_dict["category_id"] = personalizable.category.id
         personalizable_dict["category_name"] = personalizable.category.name
-        personalizable_dict["category_image_url_1"] = s3_engine.generate_presigned_s3_url(personalizable.category.image_path_1)
-        personalizable_dict["category_image_url_2"] = s3_engine.generate_presigned_s3_url(personalizable.category.image_path_2)
-        personalizable_dict["category_image_url_3"] = s3_engine.generate_presigned_s3_url(personalizable.category.image_path_3)
+        personalizable_dict["category_image_url_1"] = image_urls.get(personalizable.category.image_path_1)
+        personalizable_dict["category_image_url_2"] = image_urls.get(personalizable.category.image_path_2)
+        personalizable_dict["category_image_url_3"] = image_urls.get(personalizable.category.image_path_3)
         
         personalizable_dict["department_id"] = personalizable.department.id            
         personalizable_dict["department_name"] = personalizable.department.name
-        personalizable_dict["department_image_url_1"] = s3_engine.generate_presigned_s3_url(personalizable.department.image_path_1)
-        personalizable_dict["department_image_url_2"] = s3_engine.generate_presigned_s3_url(personalizable.department.image_path_2)
-        personalizable_dict["department_image_url_3"] = s3_engine.generate_presigned_s3_url(personalizable.department.image_path_3)
+        personalizable_dict["department_image_url_1"] = image_urls.get(personalizable.department.image_path_1)
+        personalizable_dict["department_image_url_2"] = image_urls.get(personalizable.department.image_path_2)
+        personalizable_dict["department_image_url_3"] = image_urls.get(personalizable.department.image_path_3)
         
         personalizable_dict["workshop_name"] = personalizable.workshop.name
         personalizable_dict["workshop_id"] = personalizable.workshop.id
@@ -0,0 +1,80 @@
+# Django
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Models
+from personalizables.models import Personalizable, Category, Department
+from organizations.models import Organization, Workshop
+
+# Utils
+from utils.catalog_cache import invalidate_tags_on_commit, tag, track_catalog_changes
+from personalizables.category_tree import invalidate_category_tree
+
+
+#################################################
+#     Personalizable search documents sync      #
+#################################################
+def schedule_search_refresh(personalizable_ids):
+    """
+    Refresh the search documents of the given personalizables once the current transaction is committed
+    """
+    personalizable_ids = {personalizable_id for personalizable_id in personalizable_ids if personalizable_id}
+    if personalizable_ids:
+        transaction.on_commit(lambda: Personalizable.refresh_search_documents(personalizable_ids))
+
+
+@receiver(post_save, sender=Personalizable)
+def refresh_search_on_personalizable_change(sender, instance, **kwargs):
+    schedule_search_refresh([instance.id])
+
+
+@receiver(post_save, sender=Category)
+def refresh_search_on_category_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Personalizable.objects.filter(category_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Department)
+def refresh_search_on_department_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Personalizable.objects.filter(department_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Workshop)
+def refresh_search_on_workshop_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Personalizable.objects.filter(workshop_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Organization)
+def refresh_search_on_organization_change(sender, instance, **kwargs):
+    schedule_search_refresh(list(Personalizable.objects.filter(workshop__organization_id=instance.id).values_list('id', flat=True)))
+
+
+#########################################
+#     Catalog cache invalidation        #
+#########################################
+# Fields filtering and ordering the personalizables catalog (see Personalizable.get_personalizables), the other saves
+# only evict the pages showing the personalizable
+track_catalog_changes(Personalizable, 'personalizables', 'personalizable', ['workshop', 'name', 'description', 'brand', 'model',
+                                                                            'category', 'department', 'is_sponsored'])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_on_category_change(sender, instance, created=False, **kwargs):
+    tags = [tag('category', instance.id)]
+    if created or getattr(instance, '_path_changed', False) or kwargs.get('signal') is post_delete:
+        # The leaf categories of the ancestors change, the pages filtered on them were tagged with their former leaves
+        tags += [tag('products'), tag('personalizables')]
+    invalidate_tags_on_commit(tags)
+
+
+#########################################
+#     Category tree snapshot            #
+#########################################
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_tree_on_category_change(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_catalog_on_department_change(sender, instance, **kwargs):
+    invalidate_tags_on_commit([tag('department', instance.id)])
@@ -5,12 +5,13 @@ from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
 
 # Local imports
-from products.models import Product, Promotion
+from products.models import Product, ProductCatalogRow, Promotion
 from accounts.models import AccountProfile
-from personalizables.models import Category
 
 # Utils
 from utils.validators import is_all_valid_uuid4
+from utils.pagination import parse_cursor_pagination, parse_count_mode
+from utils.catalog_cache import cached_catalog_page, tags_of_ids
 from datetime import datetime
 
 
@@ -18,6 +19,9 @@ from datetime import datetime
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Maximum number of products in a single details batch
+MAX_BATCH_PRODUCT_DETAILS = 50
+
 
 class ProductViewSet(viewsets.ViewSet):
     """
@@ -28,7 +32,121 @@ class ProductViewSet(viewsets.ViewSet):
     def get_account_profile(self, profile_id: str) -> AccountProfile:
         account_profile = get_object_or_404(AccountProfile, id=profile_id)
         return account_profile
-    
+
+    def get_catalog_filters(self, data) -> dict:
+        """
+        Validate the filters of the catalog payload, shared by the catalog and the facets endpoints :
+        - categories, departments, organizations, workshops, personalization_methods, themes, designs, option_values : comma separated uuids
+        - brands, models : comma separated strings
+        - sponsored_organizations, sponsored_workshops, sponsored_products : boolean values
+        - search_term
+        - min_price, max_price
+        - publication_date
+        Returns the filters as keyword arguments of Product.get_products, or None if the payload is not valid
+        """
+        category_ids = data.get('categories', None)
+        department_ids = data.get('departments', None)
+        organization_ids = data.get('organizations', None)
+        workshop_ids = data.get('workshops', None)
+        sponsored_organizations = data.get('sponsored_organizations', None)
+        sponsored_workshops = data.get('sponsored_workshops', None)
+        sponsored_products = data.get('sponsored_products', None)
+
+        brands = data.get('brands', None)
+        models = data.get('models', None)
+        option_value_ids = data.get('option_values', None)
+
+        personalization_method_ids = data.get('personalization_methods', None)
+
+        theme_ids = data.get('themes', None)
+        design_ids = data.get('designs', None)
+
+        search_term = data.get('search_term', None)
+
+        min_price = data.get('min_price', None)
+        max_price = data.get('max_price', None)
+
+        publication_date = data.get('publication_date', None)
+
+        with_promotion = data.get('with_promotion', None)
+
+        ##### price min and price max are optional, they should be integers and greater than 0
+        if min_price in (None, ""):
+            min_price = None
+        elif not str(min_price).isdigit():
+            return None
+        else:
+            min_price = int(min_price)
+
+        if max_price in (None, ""):
+            max_price = None
+        elif not str(max_price).isdigit():
+            return None
+        else:
+            max_price = int(max_price)
+
+        if min_price is not None and max_price is not None and min_price > max_price:
+            return None
+
+        ##### category_ids, department_ids, personalization_method_ids, theme_ids, design_ids, option_value_ids, organization_ids, workshop_ids should be valid uuid format
+        uuid_lists = {}
+        for name, ids in [('category_ids', category_ids), ('department_ids', department_ids), ('personalization_method_ids', personalization_method_ids),
+                          ('theme_ids', theme_ids), ('design_ids', design_ids), ('option_value_ids', option_value_ids),
+                          ('organization_ids', organization_ids), ('workshop_ids', workshop_ids)]:
+            if ids:
+                # remove the white spaces and split the string into a list
+                ids = ids.replace(" ", "").split(",")
+                if not is_all_valid_uuid4(ids):
+                    return None
+            uuid_lists[name] = ids
+
+        if brands:
+            brands = brands.split(",")
+            if not all(isinstance(brand, str) for brand in brands):
+                return None
+
+        if models:
+            models = models.split(",")
+            if not all(isinstance(model, str) for model in models):
+                return None
+
+        ##### sponsored organizations, workshops and products should be valid boolean values
+        for sponsored in (sponsored_organizations, sponsored_workshops, sponsored_products):
+            if sponsored and sponsored not in ["true","True", "false", "False"]:
+                return None
+
+        if with_promotion:
+            # with_promotion should ba valid boolean value
+            if with_promotion not in ["true","True"]:
+                return None
+
+        if search_term:
+            # search term has to be a string and not longer than 100 characters
+            if not isinstance(search_term, str) or len(search_term) > 100:
+                return None
+
+        if publication_date:
+            # publication date has to be a string and in the format DD-MM-YYYY
+            if not isinstance(publication_date, str) or len(publication_date) != 10:
+                return None
+            try:
+                publication_date = datetime.strptime(publication_date, '%d-%m-%Y')
+            except ValueError:
+                return None
+
+        return {
+            'max_price': max_price,
+            'min_price': min_price,
+            'brands': brands,
+            'models': models,
+            'sponsored_organizations': sponsored_organizations in ["true", "True"],
+            'sponsored_workshops': sponsored_workshops in ["true", "True"],
+            'sponsored_products': sponsored_products in ["true", "True"],
+            'search_term': search_term,
+            'publication_date': publication_date,
+            **uuid_lists,
+        }
+
     #################################### GET APIS, PUBLIC #####################################
     ##### GET PRODUCTS LIGHT #####
     @action(detail=False, methods=['POST'], url_path='catalog', permission_classes=[permissions.AllowAny])
@@ -44,8 +162,11 @@ class ProductViewSet(viewsets.ViewSet):
         - organization_ids
         - sponsored_organization_ids
         - search term 
+        - sort_by : "relevance" to order the results by relevance to the search term
         - limit
         - offset
+        - pagination : "offset" (default) or "cursor", in cursor mode the page_size and cursor are used instead of offset and limit
+        - count_mode : "total" (default) to get the number of matching items, "has_more" to only know if there are more items
         - min_price
         - max_price
         - promotion type : discount, free shipping, etc
@@ -57,34 +178,14 @@ class ProductViewSet(viewsets.ViewSet):
         # Get the query parameters
         offset = request.data.get('offset', None)
         limit = request.data.get('limit', None)
-        
-        category_ids = request.data.get('categories', None)
-        department_ids = request.data.get('departments', None)
-        organization_ids = request.data.get('organizations', None)
-        workshop_ids = request.data.get('workshops', None)
-        sponsored_organizations = request.data.get('sponsored_organizations', None)
-        sponsored_products = request.data.get('sponsored_products', None)
-        
-        
-        brands = request.data.get('brands', None)
-        models = request.data.get('models', None)
-        option_value_ids = request.data.get('option_values', None)
-        
-        personalization_method_ids = request.data.get('personalization_methods', None)
-        
-        theme_ids = request.data.get('themes', None)
-        design_ids = request.data.get('designs', None)
-        
-        search_term = request.data.get('search_term', None)
-        
-        min_price = request.data.get('min_price', None)
-        max_price = request.data.get('max_price', None)
-
-        publication_date = request.data.get('publication_date', None)
-
-        with_promotion = request.data.get('with_promotion', None)
+        sort_by = request.data.get('sort_by', None)
 
         ####################### Query parameters validation ########################
+        ##### The filters are shared with the facets endpoint
+        filters = self.get_catalog_filters(request.data)
+        if filters is None:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
         ##### offset and limit should be integers and greater than 0
         if offset and limit:
             if not (offset.isdigit() and limit.isdigit()):
@@ -99,146 +200,36 @@ class ProductViewSet(viewsets.ViewSet):
             offset = 0
             limit = 20
 
-        ##### price min and price max should be integers and greater than 0
-        if min_price and max_price:
-            if not (min_price.isdigit() and max_price.isdigit()) or (int(min_price) < 0 or int(max_price) < 0) or (int(min_price) > int(max_price)):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        else :
-            min_price = 0
-            max_price = 1000000
-        
-        ##### category_ids, personalization_method_ids, theme_ids, design_id, organization_ids, sponsored_organization_ids should be valid uuid format
-        if category_ids:
-            # remove the white spaces
-            category_ids = category_ids.replace(" ", "")
-            # split the string into a list
-            category_ids = category_ids.split(",")
-            if not is_all_valid_uuid4(category_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-            # Get all the leaf categories
-            category_ids = Category.get_leaf_categories_from_list(category_ids)
-        
-        if department_ids:
-            # remove the white spaces
-            department_ids = department_ids.replace(" ", "")
-            # split the string into a list
-            department_ids = department_ids.split(",")
-            if not is_all_valid_uuid4(department_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if personalization_method_ids:
-            # remove the white spaces
-            personalization_method_ids = personalization_method_ids.replace(" ", "")
-            # split the string into a list
-            personalization_method_ids = personalization_method_ids.split(",")
-            if not is_all_valid_uuid4(personalization_method_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if theme_ids:
-            # remove the white spaces
-            theme_ids = theme_ids.replace(" ", "")
-            # split the string into a list
-            theme_ids = theme_ids.split(",")
-            if not is_all_valid_uuid4(theme_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if design_ids:
-            # remove the white spaces
-            design_ids = design_ids.replace(" ", "")
-            # split the string into a list
-            design_ids = design_ids.split(",")
-            if not is_all_valid_uuid4(design_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if brands:
-            brands = brands.split(",")
-            if not all(isinstance(brand, str) for brand in brands):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if models:
-            models = models.split(",")
-            if not all(isinstance(model, str) for model in models):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if option_value_ids:
-            # remove the white spaces
-            option_value_ids = option_value_ids.replace(" ", "")
-            # split the string into a list
-            option_value_ids = option_value_ids.split(",")
-            if not is_all_valid_uuid4(option_value_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if organization_ids:
-            # remove the white spaces
-            organization_ids = organization_ids.replace(" ", "")
-            # split the string into a list
-            organization_ids = organization_ids.split(",")
-            if not is_all_valid_uuid4(organization_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if workshop_ids:
-            # remove the white spaces
-            workshop_ids = workshop_ids.replace(" ", "")
-            # split the string into a list
-            workshop_ids = workshop_ids.split(",")
-            if not is_all_valid_uuid4(workshop_ids):
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if sponsored_organizations:
-            # sponsored_organizations should ba valid boolean value
-            if sponsored_organizations not in ["true","True", "false", "False"]:
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if sponsored_products:
-            # sponsored_products should ba valid boolean value
-            if sponsored_products not in ["true","True", "false", "False"]:
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if with_promotion:
-            # with_promotion should ba valid boolean value
-            if with_promotion not in ["true","True"]:
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            
-        if search_term:
-            # search term has to be a string and not longer than 100 characters
-            if not isinstance(search_term, str) or len(search_term) > 100:
-                return Response({"error": "BAD_REQUEST"}, status=400)
-        
-        if publication_date:
-            # publication date has to be a string and in the format YYYY-MM-DD
-            if not isinstance(publication_date, str) or len(publication_date) != 10:
-                return Response({"error": "BAD_REQUEST"}, status=400)
-            if datetime.strptime(publication_date, '%d-%m-%Y'):
-                publication_date = datetime.strptime(publication_date, '%d-%m-%Y')
+        ##### cursor and page size should be valid in cursor pagination mode
+        try:
+            cursor, page_size = parse_cursor_pagination(request.data)
+            count_mode = parse_count_mode(request.data)
+        except ValueError:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        ##### sort_by can only be the relevance to the search term
+        if sort_by and (sort_by != "relevance" or not filters["search_term"]):
+            return Response({"error": "BAD_REQUEST"}, status=400)
 
         ###########################################################################
 
         try :
             # Get the products based on the query parameters
-            products = Product.get_products(
-                                            offset=offset,
-                                            limit=limit,
-                                            
-                                            max_price=max_price,
-                                            min_price=min_price,
-                                            
-                                            category_ids=category_ids, 
-                                            department_ids=department_ids,
-                                            organization_ids=organization_ids, 
-                                            workshop_ids=workshop_ids,
-                                            
-                                            personalization_method_ids=personalization_method_ids, 
-                                            design_ids=design_ids, 
-                                            theme_ids=theme_ids, 
-                                            
-                                            sponsored_products=sponsored_products,
-                                            sponsored_workshops=workshop_ids,
-                                            sponsored_organizations=sponsored_organizations,
-                                            
-                                            publication_date=publication_date,
-
-                                            search_term=search_term)
+            params = dict(offset=offset,
+                          limit=limit,
+                          cursor=cursor,
+                          page_size=page_size,
+                          sort_by_relevance=sort_by == "relevance",
+                          count_mode=count_mode,
+                          **filters)
+            # Anonymous catalog pages are served from the cache, they are evicted when an object they touch changes
+            products = cached_catalog_page("products", params,
+                                           compute=lambda: Product.get_products(**params),
+                                           tags_of=Product.get_products_cache_tags,
+                                           filter_tags=(tags_of_ids('organization', filters['organization_ids']) |
+                                                        tags_of_ids('workshop', filters['workshop_ids']) |
+                                                        tags_of_ids('category', filters['category_ids']) |
+                                                        tags_of_ids('theme', filters['theme_ids'])))
 
             # Return the response
             response = Response(products, status=status.HTTP_200_OK)
@@ -246,6 +237,27 @@ class ProductViewSet(viewsets.ViewSet):
         except Exception as e:
             logging.error(f"get_products_light action method error :{e.args} ")
             return Response({"error": "UNKNOWN_ERROR"}, status=400)
+
+    ##### GET CATALOG FACETS #####
+    @action(detail=False, methods=['POST'], url_path='catalog/facets', permission_classes=[permissions.AllowAny])
+    def get_products_facets(self, request):
+        """
+        This method returns the number of products per category, department, brand, model, option value, organization and price bucket
+        for the products matching the filters, it accepts the same filters as the catalog
+        """
+        self.permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+        self.authentication_classes = []
+
+        filters = self.get_catalog_filters(request.data)
+        if filters is None:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+
+        try:
+            facets = ProductCatalogRow.get_facets(**filters)
+            return Response(facets, status=status.HTTP_200_OK)
+        except Exception as e:
+            logging.error(f"get_products_facets action method error :{e.args} ")
+            return Response({"error": "UNKNOWN_ERROR"}, status=400)
     
     ##### GET SINGLE PRODUCT DETAILS #####
     @action(detail=False, methods=['GET'], url_path='(?P<product_id>[^/.]+)/details', permission_classes=[permissions.IsAuthenticatedOrReadOnly])
@@ -263,27 +275,61 @@ class ProductViewSet(viewsets.ViewSet):
             if not is_all_valid_uuid4([product_id]):
                 return Response({"error": "BAD_REQUEST"}, status=400)
             
-            # First check if the product exists and that it's not self made or not to be published
-            product: Product = Product.objects.filter(id=product_id, self_made=False, to_be_published=True).first()
-            if not product:
-                return Response({"error": "NOT_FOUND"}, status=404)
-            
-            # Get the full details  of the product
+            # Get the full details of the product, None if it doesn't exist, is self made or not to be published
             product_details: dict = Product.get_full_product_details(product_id)
+            if not product_details:
+                return Response({"error": "NOT_FOUND"}, status=404)
+
             response = Response(product_details, status=status.HTTP_200_OK)
             return response
         except Exception as e:
             logging.error(f"get_product_detail action method error :{e.args} ")
             return Response({"error": "UNKNOWN_INTERNAL_ERROR"}, status=400)
     
+    ##### GET MULTIPLE PRODUCTS DETAILS #####
+    @action(detail=False, methods=['POST'], url_path='details/batch', permission_classes=[permissions.IsAuthenticatedOrReadOnly])
+    def get_products_details(self, request):
+        """
+        This method is used to get the details of several products at once, with the same payload as the single product details :
+        - product_ids : list or comma separated uuids, at most MAX_BATCH_PRODUCT_DETAILS
+        The products are returned in the order of the ids, the ids of the products not found are returned in not_found
+        """
+        self.permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+        self.authentication_classes = []
+
+        product_ids = request.data.get('product_ids', None)
+        if isinstance(product_ids, str):
+            product_ids = product_ids.replace(" ", "").split(",")
+        if not product_ids or not isinstance(product_ids, list) or len(product_ids) > MAX_BATCH_PRODUCT_DETAILS:
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        if not all(isinstance(product_id, str) for product_id in product_ids) or not is_all_valid_uuid4(product_ids):
+            return Response({"error": "BAD_REQUEST"}, status=400)
+        product_ids = list(dict.fromkeys(product_id.strip().lower() for product_id in product_ids))
+
+        try:
+            products_details: dict = Product.get_full_products_details(product_ids)
+            response = Response({
+                "products": [products_details[product_id] for product_id in product_ids if product_id in products_details],
+                "not_found": [product_id for product_id in product_ids if product_id not in products_details],
+            }, status=status.HTTP_200_OK)
+            return response
+        except Exception as e:
+            logging.error(f"get_products_details action method error :{e.args} ")
+            return Response({"error": "UNKNOWN_INTERNAL_ERROR"}, status=400)
+
     ###### GET SINGLE PRODUCT REVIEWS #####
     @action(detail=False, methods=['GET'], url_path='(?P<product_id>[^/.]+)/reviews', permission_classes=[permissions.IsAuthenticatedOrReadOnly])
     def get_product_reviews(self, request, product_id=None):
         """
-        This method is used to get the reviews of a product
+        This method is used to get a page of the reviews of a product and its rating histogram :
+        - sort_by : "recent" (default), "highest_rating" or "lowest_rating"
+        - cursor : the next_cursor returned with the previous page, empty for the first page
+        - page_size
         """
         self.permission_classes = [permissions.IsAuthenticatedOrReadOnly]
         self.authentication_classes = []
+
+        sort_by = request.query_params.get('sort_by', None) or 'recent'
         try:
             # Get the product id
             if not product_id:
@@ -291,16 +337,25 @@ class ProductViewSet(viewsets.ViewSet):
             # Check if the id is a valid uuid
             if not is_all_valid_uuid4([product_id]):
                 return Response({"error": "BAD_REQUEST"}, status=400)
-            
-            # First check if the product exists and that it's not self made or not to be published
-            product: Product = Product.objects.filter(id=product_id, self_made=False, to_be_published=True).first()
-            if not product:
+
+            # The reviews are always paginated with the cursor
+            if sort_by not in Product.REVIEWS_ORDERINGS:
+                return Response({"error": "BAD_REQUEST"}, status=400)
+            try:
+                cursor, page_size = parse_cursor_pagination({**request.query_params.dict(), 'pagination': 'cursor'})
+            except ValueError:
+                return Response({"error": "BAD_REQUEST"}, status=400)
+
+            # Get the reviews of the product, None if it doesn't exist, is self made or not to be published
+            try:
+                reviews: dict = Product.get_product_reviews(product_id, sort_by=sort_by, cursor=cursor, page_size=page_size)
+            except ValueError:
+                return Response({"error": "BAD_REQUEST"}, status=400)
+            if reviews is None:
                 return Response({"error": "NOT_FOUND"}, status=404)
-            
-            # Get the reviews of the product
-            reviews: dict = Product.get_product_reviews(product_id)
+
             response = Response(reviews, status=status.HTTP_200_OK)
             return response
         except Exception as e:
             logging.error(f"get_product_reviews action method error :{e.args} ")
-            return Response({"error": "UNKNOWN_INTERNAL_ERROR"}, status=400)
\ No newline at end of file
+            return Response({"error": "UNKNOWN_INTERNAL_ERROR"}, status=400)
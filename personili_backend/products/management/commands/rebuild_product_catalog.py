@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.models import ProductCatalogRow
+from utils.catalog_cache import invalidate_tags, tag
+
+class Command(BaseCommand):
+    help = 'Rebuild the product catalog projection (product_catalog_rows) from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of products refreshed per batch')
+
+    def handle(self, *args, **kwargs):
+        nb_products = ProductCatalogRow.rebuild_all(batch_size=kwargs['batch_size'])
+        invalidate_tags([tag('products')])
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the catalog rows of {nb_products} products'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.models import ProductVariant, ProductCatalogRow
+
+class Command(BaseCommand):
+    help = 'Recompute the sales, reviews, rating and rating histogram counters of the products and product variants from scratch'
+
+    def handle(self, *args, **kwargs):
+        ProductVariant.rebuild_counters()
+        # The catalog rows hold a copy of the counters
+        nb_products = ProductCatalogRow.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the counters, {nb_products} catalog rows refreshed'))
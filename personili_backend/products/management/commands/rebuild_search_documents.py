@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from designs.models import Design
+from personalizables.models import Personalizable
+from products.models import ProductCatalogRow
+from utils.search import build_search_vector
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search documents of the designs, the personalizables and the product catalog rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of designs or personalizables refreshed per batch')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+
+        design_ids = list(Design.objects.values_list('id', flat=True))
+        for start in range(0, len(design_ids), batch_size):
+            Design.refresh_search_documents(design_ids[start:start + batch_size])
+
+        personalizable_ids = list(Personalizable.objects.values_list('id', flat=True))
+        for start in range(0, len(personalizable_ids), batch_size):
+            Personalizable.refresh_search_documents(personalizable_ids[start:start + batch_size])
+
+        # The search text of the catalog rows is already up to date, only the document has to be computed
+        nb_rows = ProductCatalogRow.objects.update(search_document=build_search_vector(ProductCatalogRow.SEARCH_WEIGHTS))
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the search documents of {len(design_ids)} designs, '
+                                             f'{len(personalizable_ids)} personalizables and {nb_rows} catalog rows'))
@@ -0,0 +1,100 @@
+# Generated by Django 5.0 on 2026-10-17 18:40
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0009_alter_product_self_made_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCatalogRow",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="catalog_row",
+                        serialize=False,
+                        to="products.product",
+                    ),
+                ),
+                ("title", models.CharField(max_length=255)),
+                ("description", models.TextField(max_length=1000)),
+                ("tags", models.TextField(blank=True, max_length=1000, null=True)),
+                ("is_sponsored", models.BooleanField(db_index=True, default=False)),
+                ("latest_publication_date", models.DateTimeField(blank=True, db_index=True, null=True)),
+                ("personalization_method_id", models.UUIDField(blank=True, null=True)),
+                ("category_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("category_name", models.CharField(blank=True, max_length=255, null=True)),
+                ("department_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("department_name", models.CharField(blank=True, max_length=255, null=True)),
+                ("organization_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("organization_name", models.CharField(blank=True, max_length=100, null=True)),
+                ("organization_sponsored", models.BooleanField(default=False)),
+                ("workshop_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("workshop_name", models.CharField(blank=True, max_length=100, null=True)),
+                ("workshop_sponsored", models.BooleanField(default=False)),
+                ("min_variant_price", models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ("max_variant_price", models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                (
+                    "option_value_ids",
+                    django.contrib.postgres.fields.ArrayField(base_field=models.UUIDField(), blank=True, default=list, size=None),
+                ),
+                (
+                    "personalizable_brands",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=255), blank=True, default=list, size=None
+                    ),
+                ),
+                (
+                    "personalizable_models",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=255), blank=True, default=list, size=None
+                    ),
+                ),
+                (
+                    "design_ids",
+                    django.contrib.postgres.fields.ArrayField(base_field=models.UUIDField(), blank=True, default=list, size=None),
+                ),
+                (
+                    "theme_ids",
+                    django.contrib.postgres.fields.ArrayField(base_field=models.UUIDField(), blank=True, default=list, size=None),
+                ),
+                (
+                    "preview_paths",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=255), blank=True, default=list, size=None
+                    ),
+                ),
+                (
+                    "variants",
+                    models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder),
+                ),
+                ("search_text", models.TextField(blank=True, default="")),
+                ("num_sales", models.IntegerField(default=0)),
+                ("num_reviews", models.IntegerField(default=0)),
+                ("avg_rating", models.FloatField(default=0.0)),
+            ],
+            options={
+                "db_table": "product_catalog_rows",
+                "indexes": [
+                    models.Index(
+                        fields=["-num_sales", "-num_reviews", "-avg_rating", "product"], name="catalog_rows_popularity_idx"
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(fields=["option_value_ids"], name="catalog_rows_options_gin"),
+                    django.contrib.postgres.indexes.GinIndex(fields=["design_ids"], name="catalog_rows_designs_gin"),
+                    django.contrib.postgres.indexes.GinIndex(fields=["theme_ids"], name="catalog_rows_themes_gin"),
+                ],
+            },
+        ),
+    ]
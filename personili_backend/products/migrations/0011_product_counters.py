@@ -0,0 +1,90 @@
+# Generated by Django 5.0 on 2026-10-17 19:05
+
+from django.db import migrations, models
+from django.db.models import Case, Count, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Compute the counters of the existing product variants and products from the confirmed orders and the reviews
+    (same computation as ProductVariant.rebuild_counters)
+    """
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+    ProductVariantReview = apps.get_model("products", "ProductVariantReview")
+    OrderItem = apps.get_model("orders", "OrderItem")
+
+    sales = (OrderItem.objects.filter(product_variant=OuterRef("pk"), order__order_status="Confirmed")
+             .values("product_variant").annotate(total=Count("id")).values("total"))
+    reviews = (ProductVariantReview.objects.filter(product_variant=OuterRef("pk"))
+               .values("product_variant").annotate(total=Count("id")).values("total"))
+    ratings = (ProductVariantReview.objects.filter(product_variant=OuterRef("pk"))
+               .values("product_variant").annotate(total=Sum("rating")).values("total"))
+    ProductVariant.objects.update(num_sales=Coalesce(Subquery(sales), 0),
+                                  num_reviews=Coalesce(Subquery(reviews), 0),
+                                  rating_sum=Coalesce(Subquery(ratings), 0))
+
+    variant_totals = ProductVariant.objects.filter(product=OuterRef("pk")).values("product")
+    Product.objects.update(**{field: Coalesce(Subquery(variant_totals.annotate(total=Sum(field)).values("total")), 0)
+                              for field in ("num_sales", "num_reviews", "rating_sum")})
+    for model in (ProductVariant, Product):
+        model.objects.update(avg_rating=Case(
+            When(num_reviews__gt=0, then=Cast("rating_sum", FloatField()) / Cast("num_reviews", FloatField())),
+            default=Value(0.0),
+            output_field=FloatField()))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0003_remove_cart_open_cart_status"),
+        ("products", "0010_productcatalogrow"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="num_sales",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="num_reviews",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="avg_rating",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="num_sales",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="num_reviews",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="rating_sum",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="avg_rating",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["-num_sales", "-num_reviews", "-avg_rating"], name="products_popularity_idx"),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
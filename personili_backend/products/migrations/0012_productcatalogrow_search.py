@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-17 19:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("designs", "0003_design_search"),
+        ("products", "0011_product_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productcatalogrow",
+            name="search_document",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="productcatalogrow",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_document"], name="catalog_rows_search_gin"),
+        ),
+        migrations.AddIndex(
+            model_name="productcatalogrow",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_text"], name="catalog_rows_search_trgm", opclasses=["gin_trgm_ops"]),
+        ),
+    ]
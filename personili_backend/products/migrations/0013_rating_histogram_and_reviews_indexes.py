@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-17 21:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_histograms(apps, schema_editor):
+    """
+    Compute the rating histograms of the existing product variants and products from their reviews
+    """
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+    ProductVariantReview = apps.get_model("products", "ProductVariantReview")
+
+    histogram_fields = [f"num_ratings_{stars}" for stars in range(1, 6)]
+    ProductVariant.objects.update(**{
+        f"num_ratings_{stars}": Coalesce(Subquery(ProductVariantReview.objects.filter(product_variant=OuterRef("pk"), rating=stars)
+                                                  .values("product_variant").annotate(total=Count("id")).values("total")), 0)
+        for stars in range(1, 6)
+    })
+    variant_totals = ProductVariant.objects.filter(product=OuterRef("pk")).values("product")
+    Product.objects.update(**{
+        field: Coalesce(Subquery(variant_totals.annotate(total=Sum(field)).values("total")), 0)
+        for field in histogram_fields
+    })
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0012_productcatalogrow_search"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f"num_ratings_{stars}",
+                field=models.IntegerField(default=0),
+            )
+            for model_name in ("product", "productvariant")
+            for stars in range(1, 6)
+        ],
+        migrations.AddIndex(
+            model_name="productvariantreview",
+            index=models.Index(fields=["product_variant", "-created_at", "-id"], name="reviews_variant_recent_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="productvariantreview",
+            index=models.Index(fields=["product_variant", "-rating", "-created_at", "-id"], name="reviews_variant_rating_idx"),
+        ),
+        migrations.RunPython(fill_rating_histograms, migrations.RunPython.noop),
+    ]
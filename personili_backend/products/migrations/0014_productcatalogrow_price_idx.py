@@ -0,0 +1,16 @@
+# Generated by Django 5.0 on 2026-10-17 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0013_rating_histogram_and_reviews_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productcatalogrow",
+            index=models.Index(fields=["min_variant_price", "max_variant_price"], name="catalog_rows_price_idx"),
+        ),
+    ]
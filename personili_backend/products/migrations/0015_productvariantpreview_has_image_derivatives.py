@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0014_productcatalogrow_price_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productvariantpreview",
+            name="has_image_derivatives",
+            field=models.BooleanField(default=False),
+        ),
+    ]
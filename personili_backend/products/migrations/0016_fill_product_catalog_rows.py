@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 10:20
+
+from django.db import migrations
+
+
+def fill_product_catalog_rows(apps, schema_editor):
+    """
+    Build the catalog rows of the existing products : the catalog only reads the projection and is empty until then.
+    The rows are built by the model code (ProductCatalogRow.rebuild_all), the historical models don't have it,
+    so it only runs on a database which already has products (it has the tables the current models expect at this point)
+    """
+    if not apps.get_model("products", "Product").objects.exists():
+        return
+    from products.models import ProductCatalogRow
+    ProductCatalogRow.rebuild_all()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0004_accountprofile_has_profile_picture_derivatives"),
+        ("designs", "0010_design_color_palette"),
+        ("organizations", "0001_initial"),
+        ("personalizables", "0008_category_path"),
+        ("products", "0015_productvariantpreview_has_image_derivatives"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_product_catalog_rows, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,29 @@
-from django.db import models
+from django.db import models, transaction
 from uuid import uuid4
-from django.db.models import Q, Avg
+from collections import Counter
+import hashlib
+import json
+from django.db.models import F, Sum, Case, When, Value, FloatField, OuterRef, Subquery, Prefetch
+from django.db.models.functions import Cast, Coalesce
+from django.apps import apps
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import cache
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 # Create your models here.
 from accounts.models import TimeStampedModel
 from accounts.models import AccountProfile
 from organizations.models import Organization, Workshop
 from personalizables.models import Personalizable, PersonalizableVariant, Category, Department, PersonalizationMethod, DesignedPersonalizableVariant
+from personalizables.models import PersonalizableVariantValue, DesignedZoneRelatedDesign, OptionValue
 from designs.models import Design
+from utils.pagination import paginate_by_cursor, paginate_catalog, COUNT_MODE_TOTAL
+from utils.search import build_search_vector, search_filter, search_rank
+from utils.catalog_cache import tags_of_ids
+from utils.images.derivatives import derivative_or_original
 
 from django.db.models import Count
 from django.forms.models import model_to_dict
@@ -53,9 +68,24 @@ class Product(TimeStampedModel):
     description = models.TextField(max_length=1000)
 
     tags = models.TextField(max_length=1000, null=True, blank=True)
+
+    # Sales and reviews counters, rolled up from the product variants counters
+    num_sales = models.IntegerField(default=0)
+    num_reviews = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0)
+    # Rating histogram, number of reviews per number of stars
+    num_ratings_1 = models.IntegerField(default=0)
+    num_ratings_2 = models.IntegerField(default=0)
+    num_ratings_3 = models.IntegerField(default=0)
+    num_ratings_4 = models.IntegerField(default=0)
+    num_ratings_5 = models.IntegerField(default=0)
     
     class Meta:
         db_table = 'products'
+        indexes = [
+            models.Index(fields=['-num_sales', '-num_reviews', '-avg_rating'], name='products_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.title + ' - ' + str(self.id)
@@ -90,7 +120,13 @@ class Product(TimeStampedModel):
                         sponsored_products=None,
                         search_term: str=None,
                         
-                        publication_date: str=None,):
+                        publication_date: str=None,
+
+                        cursor: str=None,
+                        page_size: int=None,
+
+                        sort_by_relevance: bool=False,
+                        count_mode: str=COUNT_MODE_TOTAL,):
         
         """
         This method returns a list of products ordered by the number of sales with the following infos :
@@ -108,139 +144,97 @@ class Product(TimeStampedModel):
         - personalization type
         - theme of the designs used
         - title and description of the product
+
+        When a page_size is given the products are paginated with the cursor (keyset pagination) instead of offset and limit,
+        and the cursor of the next page is returned in the response.
+        When sort_by_relevance is set the products matching the search term are ordered by relevance first.
+        The number of matching products is counted in the query of the page (see paginate_catalog), the has_more count_mode
+        only tells whether there are products after the page.
         """
-        # Start with the base query (only non self made products) and their previews
-        products = cls.objects.filter(self_made=False, to_be_published=True)
-        count = products.count()
-        
-        # Filter the price, if at least one variant's price meets the criteria the product and its variants are returned
-        if max_price and min_price:
-            products =  products.filter(
-                    Q(productvariants__price__lte=max_price) &
-                    Q(productvariants__price__gte=min_price)
-                )
-            
-        # Category and department filters
-        if category_ids:
-            # First get the leaf categories
-            leaf_categories = Category.get_leaf_categories_from_list(category_ids)
-            products = products.filter(category_id__in=leaf_categories)
-        if department_ids:
-            products = products.filter(department_id__in=department_ids)
+        # The catalog is served from the flat projection, no join is needed to filter or order the products
+        rows = ProductCatalogRow.filter_rows(
+                                    max_price=max_price,
+                                    min_price=min_price,
+                                    option_value_ids=option_value_ids,
+                                    brands=brands,
+                                    models=models,
+                                    category_ids=category_ids,
+                                    department_ids=department_ids,
+                                    organization_ids=organization_ids,
+                                    workshop_ids=workshop_ids,
+                                    personalization_method_ids=personalization_method_ids,
+                                    design_ids=design_ids,
+                                    theme_ids=theme_ids,
+                                    sponsored_organizations=sponsored_organizations,
+                                    sponsored_workshops=sponsored_workshops,
+                                    sponsored_products=sponsored_products,
+                                    search_term=search_term,
+                                    publication_date=publication_date)
+        rows = rows.defer('search_text', 'search_document', 'preview_paths')
+        ordering = ProductCatalogRow.CATALOG_ORDERING
+        if search_term and sort_by_relevance:
+            rows = rows.annotate(search_rank=search_rank(search_term))
+            ordering = ['-search_rank'] + ordering
 
-        # Option value, brands, models filters
-        if option_value_ids:
-            products = products.filter(productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values__option_value_id__in=option_value_ids)
-        if brands:
-            products = products.filter(productvariants__designed_personalizable_variant__personalizable_variant__personalizable_brand__in=brands)
-        if models:
-            products = products.filter(productvariants__designed_personalizable_variant__personalizable_variant__personalizable_model__in=models)
-        
-        # Organization and workshop filters
-        if organization_ids:
-            products = (products.filter(workshop__organization_id__in=organization_ids))
-        if workshop_ids:
-            products = (products.filter(workshop_id__in=workshop_ids))
+        # In cursor mode the page starts right after the sort key of the previous page, so deep pages cost the same as the first one
+        rows, page_info = paginate_catalog(rows, ordering, offset, limit, cursor, page_size, count_mode)
 
-        # Personalization method, theme and design filters
-        #if personalization_method_ids:
-        #    products = (products.filter(personalization_method_id__in=personalization_method_ids)
-        #                .select_related('personalization_method'))
-        
-        if theme_ids:
-            products = (products.filter(productvariants__designed_personalizable_variant__designed_personalizable_variant_zone__related_designs__design__theme_id__in=theme_ids))
-        if design_ids:
-            products = (products.filter(productvariants__designed_personalizable_variant__designed_personalizable_variant_zone__related_designs__design_id__in=design_ids))
-        
-        # Sponsored organizations filter
-        if sponsored_organizations:
-            products = (products.filter(workshop__organization__orgprofile__is_sponsored=True))
-        # Sponsored workshops filter
-        if sponsored_workshops:
-            products = (products.filter(workshop__is_sponsored=True))
-        # Sponsored products filter
-        if sponsored_products:
-            products = products.filter(is_sponsored=True)
-
-        if publication_date:
-            products = products.filter(latest_publication_date__gte=publication_date)
-        
-        # Search term filter : search in the product title and description, the product variant title and description, the organization name
-        if search_term:
-            products = products.filter(
-                Q(title__icontains=search_term) |
-                Q(description__icontains=search_term) |
-                Q(productvariants__name__icontains=search_term) |
-                Q(productvariants__description__icontains=search_term) |
-                Q(workshop__organization__business_name__icontains=search_term) |
-                Q(tags__icontains=search_term) |
-                Q(productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values__option_value__option__name__icontains=search_term) |
-                Q(productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values__option_value__value__icontains=search_term) |
-                Q(productvariants__designed_personalizable_variant__personalizable_variant__personalizable__brand__icontains=search_term) |
-                Q(productvariants__designed_personalizable_variant__personalizable_variant__personalizable__model__icontains=search_term) 
-            )   
-        
-        # Now get the products, their variants and their reviews, the organization info, the category, the department, the personalization method, the designs and the themes
-        products = (products.select_related( 'workshop__organization', 'category', 'department')
-                    .prefetch_related('productvariants__productvariantpreviews', 'productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values__option_value__option')
-                    .annotate(num_reviews=Count('productvariants__productvariantreviews'))
-                    .annotate(avg_rating=Avg('productvariants__productvariantreviews__rating'))
-                    .annotate(num_sales=Count('productvariants__orderitem'))
-                    .order_by('-num_sales','-num_reviews', '-avg_rating')[offset:limit])
-        
-        
         # Now prepare the json response
         response = {"products_list": []}
-        for product in products:
+        for row in rows:
             product_data = {
-                "product_id": product.id,
-                "product_title": product.title,
-                "product_description": product.description,
-                "product_rating": product.avg_rating,
-                "product_nb_reviews": product.num_reviews,
-                "product_nb_sales": product.num_sales,
-                
-                "product_category_id": product.category.id,
-                "product_category_name": product.category.name,
-                "product_department_id": product.department.id,
-                "product_department_name": product.department.name,
+                "product_id": row.product_id,
+                "product_title": row.title,
+                "product_description": row.description,
+                "product_rating": row.avg_rating if row.num_reviews else None,
+                "product_nb_reviews": row.num_reviews,
+                "product_nb_sales": row.num_sales,
                 
-                "product_organization_id": product.workshop.organization.id,
-                "product_organization_name": product.workshop.organization.business_name,
-                "product_workshop_id": product.workshop.id if product.workshop else None,
-                "product_workshop_name": product.workshop.name if product.workshop else None,
+                "product_category_id": row.category_id,
+                "product_category_name": row.category_name,
+                "product_department_id": row.department_id,
+                "product_department_name": row.department_name,
                 
-                "product_variants": [{  "product_variant_id": variant.id,
-                                        "product_variant_name": variant.name,
-                                        "product_variant_price": variant.price,
-                                        "product_variant_quantity": variant.quantity,
-                                        "product_variant_sku": variant.sku,
-                                        "product_variant_values":[
-                                            {
-                                                "option_id": personalizable_variant_value.option_value.option.id,
-                                                "option_name": personalizable_variant_value.option_value.option.name,
-                                                "option_value_id": personalizable_variant_value.option_value.id,
-                                                "option_value": personalizable_variant_value.option_value.value
-                                            } for personalizable_variant_value in variant.designed_personalizable_variant.personalizable_variant.personalizable_variant_values.all()
-                                        ] ,
-                                        "product_variant_previews": [preview.image_path for preview in variant.productvariantpreviews.all()],
-                                        } for variant in product.productvariants.all()],
+                "product_organization_id": row.organization_id,
+                "product_organization_name": row.organization_name,
+                "product_workshop_id": row.workshop_id,
+                "product_workshop_name": row.workshop_name,
                 
+                "product_variants": row.variants,
                   }
             # Remove the null key values
             product_data = {k: v for k, v in product_data.items() if v is not None}
             
             response["products_list"].append(product_data)
         
-        # Add the count of the products
-        response["count"] = count
+        # Add the count of the products or the next page infos
+        response.update(page_info)
 
         return response
 
+    @staticmethod
+    def get_products_cache_tags(products: dict) -> set:
+        """
+        Cache tags of the products, organizations, workshops and categories displayed in a page of the catalog
+        """
+        items = products["products_list"]
+        return (tags_of_ids('product', [item.get('product_id') for item in items]) |
+                tags_of_ids('organization', [item.get('product_organization_id') for item in items]) |
+                tags_of_ids('workshop', [item.get('product_workshop_id') for item in items]) |
+                tags_of_ids('category', [item.get('product_category_id') for item in items]))
+
     @classmethod
     def get_full_product_details(cls, product_id: str):
         """
-        This method takes a product id and returns the full details of the product:
+        This method takes a product id and returns the full details of the product (see get_full_products_details),
+        or None if the product doesn't exist or is not published
+        """
+        return cls.get_full_products_details([product_id]).get(str(product_id))
+
+    @classmethod
+    def get_full_products_details(cls, product_ids: list[str]) -> dict:
+        """
+        This method takes a list of product ids and returns the full details of each published product, by product id :
         - Product id
         - Product title
         - Product description
@@ -250,96 +244,140 @@ class Product(TimeStampedModel):
         - Product previews ids and images
         - Product designs ids and images
         - Product themes
+        The number of queries doesn't depend on the number of products, variants or designs
         """
-        product_details = (cls.objects.filter(id=product_id, self_made=False, to_be_published=True)
+        variants_queryset = ProductVariant.objects.select_related('designed_personalizable_variant__personalizable_variant')
+        variant_values_queryset = PersonalizableVariantValue.objects.select_related('option_value__option')
+        related_designs_queryset = DesignedZoneRelatedDesign.objects.select_related('design__theme')
+        products = (cls.objects.filter(id__in=product_ids, self_made=False, to_be_published=True)
                                 .select_related('workshop__organization__orgprofile', 'category', 'department')
-                                .prefetch_related('productvariants__productvariantpreviews', 'productvariants__designed_personalizable_variant__designed_personalizable_variant_zones__related_designs__design')      
+                                .prefetch_related(
+                                    Prefetch('productvariants', queryset=variants_queryset),
+                                    'productvariants__productvariantpreviews',
+                                    Prefetch('productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values',
+                                             queryset=variant_values_queryset),
+                                    Prefetch('productvariants__designed_personalizable_variant__designed_personalizable_variant_zones__related_designs',
+                                             queryset=related_designs_queryset))
                                 .only(
                                     'id', 'title', 'description', 'category__id', 'category__name', 'department__id', 'department__name', 
-                                    'workshop__organization__id', 'workshop__organization__business_name', 'workshop__organization__orgprofile__logo_path', 'workshop__organization__orgprofile__is_sponsored', 'workshop__id', 'workshop__name'
-                                )
-                                .annotate(num_reviews=Count('productvariants__productvariantreviews'),
-                                          avg_rating=Avg('productvariants__productvariantreviews__rating'),
-                                          num_sales=Count('productvariants__orderitem'))
-                                .first())
-        
-        response = {
-            "product_id": product_details.id,
-            "product_title": product_details.title,
-            "product_description": product_details.description,
-            "product_category_id": product_details.category.id,
-            "product_category_name": product_details.category.name,
-            "product_department_id": product_details.department.id,
-            "product_department_name": product_details.department.name,
-            "product_organization_id": product_details.workshop.organization.id,
-            "product_organization_name": product_details.workshop.organization.business_name,
-            "product_organization_logo": product_details.workshop.organization.orgprofile.logo_path,
-            "product_organization_sponsored": product_details.workshop.organization.orgprofile.is_sponsored,
-            "product_workshop_id": product_details.workshop.id,
-            "product_workshop_name": product_details.workshop.name, 
-            "product_variants": [
-                {
-                    "product_variant_id": variant.id,
-                    "product_variant_name": variant.name,
-                    "product_variant_description": variant.description,
-                    "product_variant_price": variant.price,
-                    "product_variant_quantity": variant.quantity,
-                    "product_variant_sku": variant.sku,
-                    "product_variant_values": [
-                        {
-                            "option_id": variant_value.option_value.option.id,
-                            "option_name": variant_value.option_value.option.name,
-                            "option_value_id": variant_value.option_value.id,
-                            "option_value": variant_value.option_value.value
-                        } for variant_value in variant.designed_personalizable_variant.personalizable_variant.variant_values.all()
-                    ],
-                    "product_variant_previews": [preview.image_path for preview in variant.productvariantpreviews.all()],
-                } for variant in product_details.productvariants.all()
-            ],
-            "designs_used": [
-                {
-                    "design_id": related_design.design.id,
-                    "design_title": related_design.design.title,
-                    "design_image_path": related_design.design.image_path,
-                    "theme_id": related_design.design.theme.id,
-                    "theme_name": related_design.design.theme.name,
-                    "num_likes": related_design.design.design_likes.count()
-                } for product_variant in product_details.productvariants.all()
-                    for zone in product_variant.designed_personalizable_variant.designed_personalizable_variant_zones.all()
-                    for related_design in zone.related_designs.all()
-            ],
-            "product_num_reviews": product_details.num_reviews,
-            "product_avg_rating": product_details.avg_rating,
-            "product_num_sales": product_details.num_sales,    
+                                    'workshop__organization__id', 'workshop__organization__business_name', 'workshop__organization__orgprofile__logo_path', 'workshop__organization__orgprofile__is_sponsored', 'workshop__id', 'workshop__name',
+                                    'num_reviews', 'avg_rating', 'num_sales'
+                                ))
+        products = list(products)
+
+        related_designs_per_product = {
+            product.id: [related_design
+                         for product_variant in product.productvariants.all()
+                         for zone in product_variant.designed_personalizable_variant.designed_personalizable_variant_zones.all()
+                         for related_design in zone.related_designs.all()]
+            for product in products
         }
+
+        response = {}
+        for product_details in products:
+            response[str(product_details.id)] = {
+                "product_id": product_details.id,
+                "product_title": product_details.title,
+                "product_description": product_details.description,
+                "product_category_id": product_details.category.id,
+                "product_category_name": product_details.category.name,
+                "product_department_id": product_details.department.id,
+                "product_department_name": product_details.department.name,
+                "product_organization_id": product_details.workshop.organization.id,
+                "product_organization_name": product_details.workshop.organization.business_name,
+                "product_organization_logo": product_details.workshop.organization.orgprofile.logo_path,
+                "product_organization_sponsored": product_details.workshop.organization.orgprofile.is_sponsored,
+                "product_workshop_id": product_details.workshop.id,
+                "product_workshop_name": product_details.workshop.name, 
+                "product_variants": [
+                    {
+                        "product_variant_id": variant.id,
+                        "product_variant_name": variant.name,
+                        "product_variant_description": variant.description,
+                        "product_variant_price": variant.price,
+                        "product_variant_quantity": variant.quantity,
+                        "product_variant_sku": variant.sku,
+                        "product_variant_values": [
+                            {
+                                "option_id": variant_value.option_value.option.id,
+                                "option_name": variant_value.option_value.option.name,
+                                "option_value_id": variant_value.option_value.id,
+                                "option_value": variant_value.option_value.value
+                            } for variant_value in variant.designed_personalizable_variant.personalizable_variant.personalizable_variant_values.all()
+                        ],
+                        "product_variant_previews": [preview.image_path for preview in variant.productvariantpreviews.all()],
+                    } for variant in product_details.productvariants.all()
+                ],
+                "designs_used": [
+                    {
+                        "design_id": related_design.design.id,
+                        "design_title": related_design.design.title,
+                        "design_image_path": related_design.design.image_path,
+                        "theme_id": related_design.design.theme.id,
+                        "theme_name": related_design.design.theme.name,
+                        "num_likes": related_design.design.num_likes
+                    } for related_design in related_designs_per_product[product_details.id]
+                ],
+                "product_num_reviews": product_details.num_reviews,
+                "product_avg_rating": product_details.avg_rating if product_details.num_reviews else None,
+                "product_num_sales": product_details.num_sales,    
+            }
         
         return response
     
+    # Orderings of the product reviews, the id makes the sort key unique for the cursor pagination
+    REVIEWS_ORDERINGS = {
+        'recent': ['-created_at', '-id'],
+        'highest_rating': ['-rating', '-created_at', '-id'],
+        'lowest_rating': ['rating', '-created_at', '-id'],
+    }
+
+    def get_rating_histogram(self) -> dict:
+        """
+        Number of reviews per number of stars, from the stored counters
+        """
+        return {str(stars): getattr(self, f'num_ratings_{stars}') for stars in range(1, 6)}
+
     @classmethod
-    def get_product_reviews(cls, product_id: str):
+    def get_product_reviews(cls, product_id: str, sort_by: str = 'recent', cursor: str = None, page_size: int = 20):
         """
-        This method returns all the reviews of the products variants
+        This method returns a page of the reviews of the product variants, ordered by recency or by rating,
+        along with the rating histogram of the product.
+        The reviews are paginated with the cursor (keyset pagination), next_cursor is None on the last page.
+        Returns None if the product doesn't exist or is not published, raises a ValueError if the cursor is not valid
         """
-        # First use prefetch related to get all the reviews of the product variants
-        product_reviews = (cls.objects.filter(id=product_id, self_made=False, to_be_published=True)
-                            .prefetch_related('productvariants__productvariantreviews__account_profile')
-                            .first())
-        
-        response=[]
-        for variant in product_reviews.productvariants.all():
-            for review in variant.productvariantreviews.all():
-                review_data = {
-                    "product_variant_id": variant.id,
-                    "product_variant_name": variant.name,
-                    "product_variant_description": variant.description,
+        product = (cls.objects.filter(id=product_id, self_made=False, to_be_published=True)
+                   .only('id', 'num_reviews', 'avg_rating',
+                         'num_ratings_1', 'num_ratings_2', 'num_ratings_3', 'num_ratings_4', 'num_ratings_5')
+                   .first())
+        if not product:
+            return None
+
+        reviews = (ProductVariantReview.objects.filter(product_variant__product_id=product_id)
+                   .select_related('product_variant', 'account_profile')
+                   .only('id', 'rating', 'comment', 'created_at',
+                         'product_variant__id', 'product_variant__name', 'product_variant__description',
+                         'account_profile__username'))
+        reviews, next_cursor = paginate_by_cursor(reviews, cls.REVIEWS_ORDERINGS[sort_by], cursor, page_size)
+
+        return {
+            "reviews": [
+                {
+                    "product_variant_id": review.product_variant.id,
+                    "product_variant_name": review.product_variant.name,
+                    "product_variant_description": review.product_variant.description,
                     "review_id": review.id,
                     "review_rating": review.rating,
                     "review_comment": review.comment,
+                    "review_date": review.created_at,
                     "review_account_username": review.account_profile.username
-                }
-                response.append(review_data)
-        
-        return response
+                } for review in reviews
+            ],
+            "next_cursor": next_cursor,
+            "product_num_reviews": product.num_reviews,
+            "product_avg_rating": product.avg_rating if product.num_reviews else None,
+            "product_rating_histogram": product.get_rating_histogram(),
+        }
     
 class ProductVariant(TimeStampedModel):
     """
@@ -363,6 +401,17 @@ class ProductVariant(TimeStampedModel):
     # the workshop owner can set the quantity of the product variant
     # the workshop owner receives a notification when the quantity of the product variant is low, also provide tools for them to automate the process of restocking
     sku = models.CharField(max_length=255, null=True, blank=True)
+
+    # Sales and reviews counters, maintained incrementally (see products/signals.py)
+    num_sales = models.IntegerField(default=0)
+    num_reviews = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0)
+    num_ratings_1 = models.IntegerField(default=0)
+    num_ratings_2 = models.IntegerField(default=0)
+    num_ratings_3 = models.IntegerField(default=0)
+    num_ratings_4 = models.IntegerField(default=0)
+    num_ratings_5 = models.IntegerField(default=0)
     
     class Meta:
         db_table = 'product_variants'
@@ -370,6 +419,79 @@ class ProductVariant(TimeStampedModel):
 
     def __str__(self):
         return self.product.title + " " + self.name + " " + str(self.id)
+
+    @classmethod
+    def update_counters(cls, product_variant_id: str, sales: int = 0, reviews: int = 0, rating: int = 0,
+                        added_rating: int = None, removed_rating: int = None):
+        """
+        Atomically apply a delta to the sales, reviews and rating counters of a product variant and of its product.
+        The new average rating is computed in the same statement from the previous counters.
+        added_rating and removed_rating are the number of stars of the review added to and removed from the rating histogram.
+        """
+        expressions = counters_delta_expressions(sales=sales, reviews=reviews, rating=rating,
+                                                 added_rating=added_rating, removed_rating=removed_rating)
+        if not expressions:
+            return
+        with transaction.atomic():
+            cls.objects.filter(id=product_variant_id).update(**expressions)
+            Product.objects.filter(productvariants__id=product_variant_id).update(**expressions)
+
+    @classmethod
+    def rebuild_counters(cls):
+        """
+        Recompute the counters of every product variant and product from the orders and the reviews
+        """
+        Order = apps.get_model('orders', 'Order')
+        OrderItem = apps.get_model('orders', 'OrderItem')
+
+        sales = (OrderItem.objects.filter(product_variant=OuterRef('pk'), order__order_status=Order.CONFIRMED)
+                 .values('product_variant').annotate(total=Count('id')).values('total'))
+        reviews = (ProductVariantReview.objects.filter(product_variant=OuterRef('pk'))
+                   .values('product_variant').annotate(total=Count('id')).values('total'))
+        ratings = (ProductVariantReview.objects.filter(product_variant=OuterRef('pk'))
+                   .values('product_variant').annotate(total=Sum('rating')).values('total'))
+        histogram = {f'num_ratings_{stars}': Coalesce(Subquery(ProductVariantReview.objects.filter(product_variant=OuterRef('pk'), rating=stars)
+                                                               .values('product_variant').annotate(total=Count('id')).values('total')), 0)
+                     for stars in range(1, 6)}
+        variant_totals = cls.objects.filter(product=OuterRef('pk')).values('product')
+        totals_fields = ['num_sales', 'num_reviews', 'rating_sum'] + [f'num_ratings_{stars}' for stars in range(1, 6)]
+
+        with transaction.atomic():
+            cls.objects.update(num_sales=Coalesce(Subquery(sales), 0),
+                               num_reviews=Coalesce(Subquery(reviews), 0),
+                               rating_sum=Coalesce(Subquery(ratings), 0),
+                               **histogram)
+            Product.objects.update(**{field: Coalesce(Subquery(variant_totals.annotate(total=Sum(field)).values('total')), 0)
+                                      for field in totals_fields})
+            for model in (cls, Product):
+                model.objects.update(avg_rating=Case(
+                    When(num_reviews__gt=0, then=Cast('rating_sum', FloatField()) / Cast('num_reviews', FloatField())),
+                    default=Value(0.0),
+                    output_field=FloatField()))
+
+
+def counters_delta_expressions(sales: int = 0, reviews: int = 0, rating: int = 0,
+                               added_rating: int = None, removed_rating: int = None) -> dict:
+    """
+    Returns the update() expressions applying a delta to the num_sales, num_reviews, rating_sum, avg_rating
+    and num_ratings_<stars> counters
+    """
+    expressions = {}
+    if sales:
+        expressions['num_sales'] = F('num_sales') + sales
+    if reviews or rating:
+        expressions['num_reviews'] = F('num_reviews') + reviews
+        expressions['rating_sum'] = F('rating_sum') + rating
+        expressions['avg_rating'] = Case(
+            When(num_reviews__lte=-reviews, then=Value(0.0)),
+            default=Cast(F('rating_sum') + rating, FloatField()) / Cast(F('num_reviews') + reviews, FloatField()),
+            output_field=FloatField())
+    if added_rating != removed_rating:
+        if added_rating:
+            expressions[f'num_ratings_{added_rating}'] = F(f'num_ratings_{added_rating}') + 1
+        if removed_rating:
+            expressions[f'num_ratings_{removed_rating}'] = F(f'num_ratings_{removed_rating}') - 1
+    return expressions
     
 class ProductVariantPreview(TimeStampedModel):
     """
@@ -378,6 +500,8 @@ class ProductVariantPreview(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='productvariantpreviews')
     image_path = models.CharField(max_length=255)
+    # The thumbnails and WebP variants of the preview were generated (see utils/images/pipeline.py)
+    has_image_derivatives = models.BooleanField(default=False)
 
     class Meta:
         db_table = 'product_variant_previews'
@@ -403,11 +527,416 @@ class ProductVariantReview(TimeStampedModel):
 
     class Meta:
         db_table = 'product_reviews'
+        indexes = [
+            # Keyset pagination of the reviews by recency and by rating
+            models.Index(fields=['product_variant', '-created_at', '-id'], name='reviews_variant_recent_idx'),
+            models.Index(fields=['product_variant', '-rating', '-created_at', '-id'], name='reviews_variant_rating_idx'),
+        ]
 
     def __str__(self):
         return self.product.title + " " + self.account.email + " " + str(self.rating) + " " + str(self.id)
     
 
+#########################################
+#        Product catalog projection     #
+#########################################
+class ProductCatalogRow(TimeStampedModel):
+    """
+    Flat projection of the product catalog, one row per published (and not self made) product.
+    Everything the catalog needs to filter, order and render a product is copied here when the
+    product or one of its related rows changes (see products/signals.py), so that the catalog
+    endpoint never has to join the variants, designs and option values at read time.
+    Rows are filled by the migration 0016 and can be rebuilt from scratch with the rebuild_product_catalog management command.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='catalog_row')
+
+    title = models.CharField(max_length=255)
+    description = models.TextField(max_length=1000)
+    tags = models.TextField(max_length=1000, null=True, blank=True)
+    is_sponsored = models.BooleanField(default=False, db_index=True)
+    latest_publication_date = models.DateTimeField(null=True, blank=True, db_index=True)
+    personalization_method_id = models.UUIDField(null=True, blank=True)
+
+    # Pre joined taxonomy and owner infos
+    category_id = models.UUIDField(null=True, blank=True, db_index=True)
+    category_name = models.CharField(max_length=255, null=True, blank=True)
+    department_id = models.UUIDField(null=True, blank=True, db_index=True)
+    department_name = models.CharField(max_length=255, null=True, blank=True)
+    organization_id = models.UUIDField(null=True, blank=True, db_index=True)
+    organization_name = models.CharField(max_length=100, null=True, blank=True)
+    organization_sponsored = models.BooleanField(default=False)
+    workshop_id = models.UUIDField(null=True, blank=True, db_index=True)
+    workshop_name = models.CharField(max_length=100, null=True, blank=True)
+    workshop_sponsored = models.BooleanField(default=False)
+
+    # Variants infos
+    min_variant_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_variant_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    option_value_ids = ArrayField(models.UUIDField(), default=list, blank=True)
+    personalizable_brands = ArrayField(models.CharField(max_length=255), default=list, blank=True)
+    personalizable_models = ArrayField(models.CharField(max_length=255), default=list, blank=True)
+    design_ids = ArrayField(models.UUIDField(), default=list, blank=True)
+    theme_ids = ArrayField(models.UUIDField(), default=list, blank=True)
+    preview_paths = ArrayField(models.CharField(max_length=255), default=list, blank=True)
+    # Rendered variants, exactly as they are returned by the catalog
+    variants = models.JSONField(encoder=DjangoJSONEncoder, default=list, blank=True)
+
+    # Lower cased concatenation of every searchable text of the product
+    search_text = models.TextField(default="", blank=True)
+    # Weighted full text search document, computed from the columns above by the database
+    search_document = SearchVectorField(null=True, blank=True)
+
+    # Sales and reviews counters, copied from the product
+    num_sales = models.IntegerField(default=0)
+    num_reviews = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0)
+
+    # Columns only displayed by the catalog, the other ones filter or order it
+    DISPLAY_FIELDS = ('variants', 'preview_paths')
+
+    # Catalog order, the product id makes the sort key unique for the keyset pagination
+    CATALOG_ORDERING = ['-num_sales', '-num_reviews', '-avg_rating', 'product_id']
+
+    # Price buckets of the catalog facets (lower bound included, upper bound excluded), the last one has no upper bound
+    FACETS_PRICE_BUCKETS = [(0, 20), (20, 50), (50, 100), (100, 200), (200, None)]
+    FACETS_CACHE_TIMEOUT = 60
+    OPTION_VALUES_CACHE_TIMEOUT = 60 * 60
+
+    class Meta:
+        db_table = 'product_catalog_rows'
+        indexes = [
+            models.Index(fields=['-num_sales', '-num_reviews', '-avg_rating', 'product'], name='catalog_rows_popularity_idx'),
+            models.Index(fields=['min_variant_price', 'max_variant_price'], name='catalog_rows_price_idx'),
+            GinIndex(fields=['option_value_ids'], name='catalog_rows_options_gin'),
+            GinIndex(fields=['design_ids'], name='catalog_rows_designs_gin'),
+            GinIndex(fields=['theme_ids'], name='catalog_rows_themes_gin'),
+            GinIndex(fields=['search_document'], name='catalog_rows_search_gin'),
+            GinIndex(fields=['search_text'], name='catalog_rows_search_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    # Weights of the columns in the search document
+    SEARCH_WEIGHTS = {
+        'title': 'A',
+        'tags': 'B',
+        'category_name': 'B',
+        'organization_name': 'B',
+        'workshop_name': 'B',
+        'department_name': 'C',
+        'description': 'C',
+        'search_text': 'D',
+    }
+
+    def __str__(self):
+        return self.title + ' - ' + str(self.product_id)
+
+    @classmethod
+    def filter_rows(cls,
+                    max_price: float=None,
+                    min_price: float=None,
+                    option_value_ids: list[str]=None,
+                    brands: list[str]=None,
+                    models: list[str]=None,
+                    category_ids: list[str]=None,
+                    department_ids: list[str]=None,
+                    organization_ids: list[str]=None,
+                    workshop_ids: list[str]=None,
+                    personalization_method_ids: list[str]=None,
+                    design_ids: list[str]=None,
+                    theme_ids: list[str]=None,
+                    sponsored_organizations=None,
+                    sponsored_workshops=None,
+                    sponsored_products=None,
+                    search_term: str=None,
+                    publication_date: str=None):
+        """
+        Returns the catalog rows matching the catalog filters, every filter is applied on the row itself
+        """
+        rows = cls.objects.all()
+
+        # A product matches the price filter if the price range of its variants overlaps the requested range,
+        # each bound is optional and no price condition is added without any bound
+        if max_price is not None:
+            rows = rows.filter(min_variant_price__lte=max_price)
+        if min_price is not None:
+            rows = rows.filter(max_variant_price__gte=min_price)
+
+        # Category and department filters
+        if category_ids:
+            rows = rows.filter(category_id__in=Category.get_leaf_categories_from_list(category_ids))
+        if department_ids:
+            rows = rows.filter(department_id__in=department_ids)
+
+        # Option value, brands, models filters
+        if option_value_ids:
+            rows = rows.filter(option_value_ids__overlap=option_value_ids)
+        if brands:
+            rows = rows.filter(personalizable_brands__overlap=brands)
+        if models:
+            rows = rows.filter(personalizable_models__overlap=models)
+
+        # Organization and workshop filters
+        if organization_ids:
+            rows = rows.filter(organization_id__in=organization_ids)
+        if workshop_ids:
+            rows = rows.filter(workshop_id__in=workshop_ids)
+
+        if personalization_method_ids:
+            rows = rows.filter(personalization_method_id__in=personalization_method_ids)
+
+        # Theme and design filters
+        if theme_ids:
+            rows = rows.filter(theme_ids__overlap=theme_ids)
+        if design_ids:
+            rows = rows.filter(design_ids__overlap=design_ids)
+
+        # Sponsored organizations, workshops and products filters
+        if sponsored_organizations:
+            rows = rows.filter(organization_sponsored=True)
+        if sponsored_workshops:
+            rows = rows.filter(workshop_sponsored=True)
+        if sponsored_products:
+            rows = rows.filter(is_sponsored=True)
+
+        if publication_date:
+            rows = rows.filter(latest_publication_date__gte=publication_date)
+
+        if search_term:
+            rows = rows.filter(search_filter(search_term))
+
+        return rows
+
+    @classmethod
+    def refresh_products(cls, product_ids: list[str]) -> tuple[set, bool]:
+        """
+        Rebuild the catalog rows of the given products.
+        Products which are not published anymore (or are self made) lose their row.
+        Returns the ids of the products whose row changed, and whether the listing changed : a product entered or left
+        the catalog, or a column filtering or ordering it changed (every column but the DISPLAY_FIELDS)
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return set(), False
+        compared_fields = [field for field in cls._meta.concrete_fields if field.name not in ('product', 'created_at', 'updated_at', 'search_document')]
+        previous_rows = {row[0]: row[1:] for row in cls.objects.filter(product_id__in=product_ids)
+                         .values_list('product_id', *[field.attname for field in compared_fields])}
+
+        variant_values_queryset = PersonalizableVariantValue.objects.select_related('option_value__option')
+        products = (Product.objects.filter(id__in=product_ids, self_made=False, to_be_published=True)
+                    .select_related('workshop__organization__orgprofile', 'category', 'department')
+                    .prefetch_related(
+                        'productvariants__productvariantpreviews',
+                        'productvariants__designed_personalizable_variant__personalizable_variant__personalizable',
+                        Prefetch('productvariants__designed_personalizable_variant__personalizable_variant__personalizable_variant_values',
+                                 queryset=variant_values_queryset)))
+        products = list(products)
+        published_ids = [product.id for product in products]
+
+        # Designs and themes used by the variants of the products
+        used_designs = {}
+        for product_id, design_id, theme_id in (DesignedZoneRelatedDesign.objects
+                    .filter(designed_personalizable_zone__designed_personalizable_variant__productvariant__product_id__in=published_ids)
+                    .values_list('designed_personalizable_zone__designed_personalizable_variant__productvariant__product_id', 'design_id', 'design__theme_id')):
+            designs, themes = used_designs.setdefault(product_id, (set(), set()))
+            designs.add(design_id)
+            if theme_id:
+                themes.add(theme_id)
+
+        rows = [cls._build_row(product, used_designs.get(product.id, (set(), set()))) for product in products]
+
+        update_fields = [field.name for field in cls._meta.concrete_fields if field.name not in ('product', 'created_at', 'search_document')]
+        with transaction.atomic():
+            cls.objects.filter(product_id__in=product_ids).exclude(product_id__in=published_ids).delete()
+            if rows:
+                cls.objects.bulk_create(rows, update_conflicts=True, unique_fields=['product'], update_fields=update_fields)
+                # The search document is computed by the database from the freshly written columns
+                cls.objects.filter(product_id__in=published_ids).update(search_document=build_search_vector(cls.SEARCH_WEIGHTS))
+
+        # Compare the rows with the previous ones to tell the catalog cache what to invalidate
+        changed_ids = set(previous_rows) - set(published_ids)
+        listing_changed = bool(changed_ids)
+        for row in rows:
+            previous_row = previous_rows.get(row.product_id)
+            # The rendered variants are compared as they are stored
+            values = tuple(json.loads(json.dumps(getattr(row, field.attname), cls=DjangoJSONEncoder)) if field.name == 'variants'
+                           else getattr(row, field.attname) for field in compared_fields)
+            if previous_row == values:
+                continue
+            changed_ids.add(row.product_id)
+            if previous_row is None or any(previous_value != value for field, previous_value, value in zip(compared_fields, previous_row, values)
+                                           if field.name not in cls.DISPLAY_FIELDS):
+                listing_changed = True
+        return changed_ids, listing_changed
+
+    @classmethod
+    def _build_row(cls, product: Product, used_designs: tuple[set, set]):
+        """
+        Build the (unsaved) catalog row of a product from its prefetched relations
+        """
+        workshop = product.workshop
+        organization = workshop.organization if workshop else None
+        organization_profile = getattr(organization, 'orgprofile', None) if organization else None
+
+        variants = []
+        prices = []
+        option_value_ids = set()
+        brands = set()
+        models_ = set()
+        preview_paths = []
+        search_parts = [product.title, product.description, product.tags, organization.business_name if organization else None]
+        for variant in product.productvariants.all():
+            personalizable_variant = variant.designed_personalizable_variant.personalizable_variant
+            personalizable = personalizable_variant.personalizable
+            variant_values = personalizable_variant.personalizable_variant_values.all()
+            variant_previews = [preview.image_path for preview in variant.productvariantpreviews.all()]
+            # The catalog cards show the thumbnails of the previews once they're generated
+            variant_thumbnails = [derivative_or_original(preview.image_path, preview.has_image_derivatives)
+                                  for preview in variant.productvariantpreviews.all()]
+            variants.append({
+                "product_variant_id": variant.id,
+                "product_variant_name": variant.name,
+                "product_variant_price": variant.price,
+                "product_variant_quantity": variant.quantity,
+                "product_variant_sku": variant.sku,
+                "product_variant_values": [
+                    {
+                        "option_id": variant_value.option_value.option.id,
+                        "option_name": variant_value.option_value.option.name,
+                        "option_value_id": variant_value.option_value.id,
+                        "option_value": variant_value.option_value.value
+                    } for variant_value in variant_values
+                ],
+                "product_variant_previews": variant_thumbnails,
+            })
+            prices.append(variant.price)
+            preview_paths.extend(variant_previews)
+            option_value_ids.update(variant_value.option_value_id for variant_value in variant_values)
+            if personalizable.brand:
+                brands.add(personalizable.brand)
+            if personalizable.model:
+                models_.add(personalizable.model)
+            search_parts.extend([variant.name, variant.description, personalizable.brand, personalizable.model])
+            search_parts.extend(variant_value.option_value.option.name for variant_value in variant_values)
+            search_parts.extend(variant_value.option_value.value for variant_value in variant_values)
+
+        design_ids, theme_ids = used_designs
+        return cls(
+            product=product,
+            title=product.title,
+            description=product.description,
+            tags=product.tags,
+            is_sponsored=product.is_sponsored,
+            latest_publication_date=product.latest_publication_date,
+            personalization_method_id=product.personalization_method_id,
+            category_id=product.category_id,
+            category_name=product.category.name if product.category else None,
+            department_id=product.department_id,
+            department_name=product.department.name if product.department else None,
+            organization_id=organization.id if organization else None,
+            organization_name=organization.business_name if organization else None,
+            organization_sponsored=organization_profile.is_sponsored if organization_profile else False,
+            workshop_id=product.workshop_id,
+            workshop_name=workshop.name if workshop else None,
+            workshop_sponsored=workshop.is_sponsored if workshop else False,
+            min_variant_price=min(prices) if prices else None,
+            max_variant_price=max(prices) if prices else None,
+            option_value_ids=sorted(option_value_ids, key=str),
+            personalizable_brands=sorted(brands),
+            personalizable_models=sorted(models_),
+            design_ids=sorted(design_ids, key=str),
+            theme_ids=sorted(theme_ids, key=str),
+            preview_paths=preview_paths,
+            variants=variants,
+            search_text=" ".join(part for part in search_parts if part).lower(),
+            num_sales=product.num_sales,
+            num_reviews=product.num_reviews,
+            avg_rating=product.avg_rating,
+        )
+
+    @classmethod
+    def get_facets(cls, **filters) -> dict:
+        """
+        Returns the number of products per category, department, organization, brand, model, option value and price bucket
+        for the rows matching the catalog filters (same keyword arguments as filter_rows).
+        All the facets are counted in a single pass over the matching rows, the results are cached for a short time
+        per set of filters and the option value labels, which don't depend on the filters, are cached for longer.
+        """
+        canonical_filters = json.dumps({name: sorted(map(str, value)) if isinstance(value, (list, tuple, set)) else value
+                                        for name, value in filters.items()}, sort_keys=True, default=str)
+        cache_key = "catalog_facets:" + hashlib.sha1(canonical_filters.encode("utf-8")).hexdigest()
+        facets = cache.get(cache_key)
+        if facets is not None:
+            return facets
+
+        categories, departments, organizations = Counter(), Counter(), Counter()
+        brands, models_, option_values, price_buckets = Counter(), Counter(), Counter(), Counter()
+        names = {}
+        count = 0
+        rows = cls.filter_rows(**filters).values_list(
+            'category_id', 'category_name', 'department_id', 'department_name', 'organization_id', 'organization_name',
+            'personalizable_brands', 'personalizable_models', 'option_value_ids', 'min_variant_price', 'max_variant_price')
+        for (category_id, category_name, department_id, department_name, organization_id, organization_name,
+             row_brands, row_models, row_option_value_ids, min_variant_price, max_variant_price) in rows.iterator(chunk_size=2000):
+            count += 1
+            if category_id:
+                categories[category_id] += 1
+                names[category_id] = category_name
+            if department_id:
+                departments[department_id] += 1
+                names[department_id] = department_name
+            if organization_id:
+                organizations[organization_id] += 1
+                names[organization_id] = organization_name
+            brands.update(row_brands)
+            models_.update(row_models)
+            option_values.update(row_option_value_ids)
+            # A product is in a price bucket if one of its variants is, like for the price filter
+            if min_variant_price is not None:
+                for bucket in cls.FACETS_PRICE_BUCKETS:
+                    bucket_min, bucket_max = bucket
+                    if (bucket_max is None or min_variant_price < bucket_max) and max_variant_price >= bucket_min:
+                        price_buckets[bucket] += 1
+
+        option_value_labels = cls.get_option_value_labels()
+        facets = {
+            "count": count,
+            "categories": [{"category_id": str(id_), "category_name": names[id_], "count": nb} for id_, nb in categories.most_common()],
+            "departments": [{"department_id": str(id_), "department_name": names[id_], "count": nb} for id_, nb in departments.most_common()],
+            "organizations": [{"organization_id": str(id_), "organization_name": names[id_], "count": nb} for id_, nb in organizations.most_common()],
+            "brands": [{"brand": brand, "count": nb} for brand, nb in brands.most_common()],
+            "models": [{"model": model, "count": nb} for model, nb in models_.most_common()],
+            "option_values": [{"option_value_id": str(id_), **option_value_labels.get(str(id_), {}), "count": nb}
+                              for id_, nb in option_values.most_common()],
+            "price_buckets": [{"min_price": bucket_min, "max_price": bucket_max, "count": price_buckets[(bucket_min, bucket_max)]}
+                              for bucket_min, bucket_max in cls.FACETS_PRICE_BUCKETS],
+        }
+        cache.set(cache_key, facets, cls.FACETS_CACHE_TIMEOUT)
+        return facets
+
+    @classmethod
+    def get_option_value_labels(cls) -> dict:
+        """
+        Returns the option value and the option of every option value id, cached since they don't depend on the catalog filters
+        """
+        labels = cache.get("catalog_facets:option_values")
+        if labels is None:
+            labels = {str(option_value_id): {"option_value": value, "option_id": str(option_id), "option_name": option_name}
+                      for option_value_id, value, option_id, option_name in OptionValue.objects.values_list('id', 'value', 'option_id', 'option__name')}
+            cache.set("catalog_facets:option_values", labels, cls.OPTION_VALUES_CACHE_TIMEOUT)
+        return labels
+
+    @classmethod
+    def rebuild_all(cls, batch_size: int = 500) -> int:
+        """
+        Rebuild the whole projection by batches of products, returns the number of products processed
+        """
+        product_ids = list(Product.objects.filter(self_made=False, to_be_published=True).values_list('id', flat=True))
+        for start in range(0, len(product_ids), batch_size):
+            cls.refresh_products(product_ids[start:start + batch_size])
+        # Drop the rows of the products that left the catalog
+        cls.objects.exclude(product__self_made=False, product__to_be_published=True).delete()
+        return len(product_ids)
+
+
 #####################################################################################
 #                             Promotions and Events                                #
 #####################################################################################
@@ -0,0 +1,181 @@
+# Django
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+# Models
+from products.models import Product, ProductVariant, ProductVariantPreview, ProductVariantReview, ProductCatalogRow
+from orders.models import Order, OrderItem
+from organizations.models import Organization, OrganizationProfile, Workshop
+from personalizables.models import Category, Department, Personalizable
+
+# Utils
+from utils.catalog_cache import invalidate_tags, tag, tags_of_ids
+from utils.images.pipeline import track_image_derivatives
+
+
+#########################################
+#     Product catalog projection sync   #
+#########################################
+def schedule_catalog_refresh(product_ids):
+    """
+    Refresh the catalog rows of the given products once the current transaction is committed
+    """
+    product_ids = {product_id for product_id in product_ids if product_id}
+    if product_ids:
+        transaction.on_commit(lambda: refresh_catalog_rows(product_ids))
+
+
+def refresh_catalog_rows(product_ids):
+    changed_ids, listing_changed = ProductCatalogRow.refresh_products(product_ids)
+    # Only the pages showing the changed products are stale, unless a product entered, left or moved in the catalog
+    tags = tags_of_ids('product', changed_ids)
+    if listing_changed:
+        tags.add(tag('products'))
+    invalidate_tags(tags)
+
+
+def products_of_variants(variant_ids):
+    """
+    Returns the ids of the products owning the given product variants
+    """
+    return ProductVariant.objects.filter(id__in=variant_ids).values_list('product_id', flat=True)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_catalog_on_product_change(sender, instance, **kwargs):
+    schedule_catalog_refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def refresh_catalog_on_product_variant_change(sender, instance, **kwargs):
+    schedule_catalog_refresh([instance.product_id])
+
+
+# The reviews, the order items and the orders refresh the catalog once their counters are updated (see below) :
+# outside of a transaction the refresh runs right away and has to read the new counters
+@receiver([post_save, post_delete], sender=ProductVariantPreview)
+def refresh_catalog_on_variant_related_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(products_of_variants([instance.product_variant_id])))
+
+
+@receiver(post_save, sender=Workshop)
+def refresh_catalog_on_workshop_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(workshop_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Organization)
+def refresh_catalog_on_organization_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(workshop__organization_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=OrganizationProfile)
+def refresh_catalog_on_organization_profile_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(workshop__organization_id=instance.organization_id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Category)
+def refresh_catalog_on_category_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(category_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Department)
+def refresh_catalog_on_department_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(department_id=instance.id).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Personalizable)
+def refresh_catalog_on_personalizable_change(sender, instance, **kwargs):
+    schedule_catalog_refresh(list(Product.objects.filter(
+        productvariants__designed_personalizable_variant__personalizable_variant__personalizable_id=instance.id
+    ).values_list('id', flat=True).distinct()))
+
+
+#########################################
+#     Sales and reviews counters sync   #
+#########################################
+@receiver(pre_save, sender=ProductVariantReview)
+def remember_previous_review(sender, instance, **kwargs):
+    # Keep the rating and the variant of the review before the update to apply the right delta
+    instance._previous_review = None
+    if not instance._state.adding:
+        instance._previous_review = (ProductVariantReview.objects.filter(pk=instance.pk)
+                                     .values_list('product_variant_id', 'rating').first())
+
+
+@receiver(post_save, sender=ProductVariantReview)
+def update_counters_on_review_save(sender, instance, created, **kwargs):
+    previous_review = getattr(instance, '_previous_review', None)
+    if created or not previous_review:
+        ProductVariant.update_counters(instance.product_variant_id, reviews=1, rating=instance.rating, added_rating=instance.rating)
+    else:
+        previous_variant_id, previous_rating = previous_review
+        if previous_variant_id != instance.product_variant_id:
+            ProductVariant.update_counters(previous_variant_id, reviews=-1, rating=-previous_rating, removed_rating=previous_rating)
+            ProductVariant.update_counters(instance.product_variant_id, reviews=1, rating=instance.rating, added_rating=instance.rating)
+            schedule_catalog_refresh(list(products_of_variants([previous_variant_id])))
+        elif previous_rating != instance.rating:
+            ProductVariant.update_counters(instance.product_variant_id, rating=instance.rating - previous_rating,
+                                           added_rating=instance.rating, removed_rating=previous_rating)
+    schedule_catalog_refresh(list(products_of_variants([instance.product_variant_id])))
+
+
+@receiver(post_delete, sender=ProductVariantReview)
+def update_counters_on_review_delete(sender, instance, **kwargs):
+    ProductVariant.update_counters(instance.product_variant_id, reviews=-1, rating=-instance.rating, removed_rating=instance.rating)
+    schedule_catalog_refresh(list(products_of_variants([instance.product_variant_id])))
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_confirmation(sender, instance, update_fields=None, **kwargs):
+    # A confirmed order counts as a sale for each of its items, an order leaving the confirmed status removes them
+    is_confirmed = instance.order_status == Order.CONFIRMED
+    if instance._state.adding:
+        instance._sales_delta = int(is_confirmed)
+        return
+    if update_fields is not None and 'order_status' not in update_fields:
+        instance._sales_delta = 0
+        return
+    # The status is switched by a conditional update : when concurrent saves confirm (or unconfirm) the same order,
+    # the row lock lets only one of them change the row and apply the delta
+    orders = Order.objects.filter(pk=instance.pk)
+    if is_confirmed:
+        changed = orders.exclude(order_status=Order.CONFIRMED).update(order_status=Order.CONFIRMED)
+    else:
+        changed = orders.filter(order_status=Order.CONFIRMED).update(order_status=instance.order_status)
+    instance._sales_delta = (1 if is_confirmed else -1) if changed else 0
+
+
+@receiver(post_save, sender=Order)
+def update_counters_on_order_confirmation(sender, instance, **kwargs):
+    sales_delta = getattr(instance, '_sales_delta', 0)
+    if not sales_delta:
+        return
+    items_per_variant = (OrderItem.objects.filter(order_id=instance.id)
+                         .values('product_variant_id').annotate(nb_items=Count('id')))
+    for item in items_per_variant:
+        ProductVariant.update_counters(item['product_variant_id'], sales=sales_delta * item['nb_items'])
+    # Only the orders which got confirmed or unconfirmed change the catalog
+    schedule_catalog_refresh(list(products_of_variants([item['product_variant_id'] for item in items_per_variant])))
+
+
+@receiver(post_save, sender=OrderItem)
+def update_counters_on_order_item_save(sender, instance, created, **kwargs):
+    if created and Order.objects.filter(id=instance.order_id, order_status=Order.CONFIRMED).exists():
+        ProductVariant.update_counters(instance.product_variant_id, sales=1)
+    schedule_catalog_refresh(list(products_of_variants([instance.product_variant_id])))
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_counters_on_order_item_delete(sender, instance, **kwargs):
+    if Order.objects.filter(id=instance.order_id, order_status=Order.CONFIRMED).exists():
+        ProductVariant.update_counters(instance.product_variant_id, sales=-1)
+    schedule_catalog_refresh(list(products_of_variants([instance.product_variant_id])))
+
+
+#########################################
+#     Image derivatives generation      #
+#########################################
+# Saving the flag of a preview refreshes the catalog row of its product with the thumbnails
+track_image_derivatives(ProductVariantPreview, 'image_path', 'has_image_derivatives')
@@ -1,3 +1,184 @@
-from django.test import TestCase
+from django.apps import apps
+from django.test import TestCase, TransactionTestCase
 
-# Create your tests here.
+# Models
+from accounts.models import PaymentMethod
+from orders.models import Order, OrderItem
+from products.models import Product, ProductCatalogRow, ProductVariant
+
+# Factories
+from accounts.factories import AccountProfileFactory, DeliveryAddressFactory
+from products.factories import ProductVariantFactory, ProductVariantReviewFactory
+
+
+class SalesCountersTestCase(TestCase):
+    """
+    The sales counters follow the confirmation of the orders (see products/signals.py)
+    """
+    def setUp(self):
+        self.account_profile = AccountProfileFactory()
+        self.delivery_address = DeliveryAddressFactory(account_profile=self.account_profile)
+        self.payment_method = PaymentMethod.objects.create(account_profile=self.account_profile)
+        self.product_variant = ProductVariantFactory()
+        self.other_product_variant = ProductVariantFactory()
+
+    def create_order(self, order_status: str = Order.PENDING, product_variants: list = None) -> Order:
+        order = Order.objects.create(account_profile=self.account_profile,
+                                     delivery_address=self.delivery_address,
+                                     payment_method=self.payment_method,
+                                     total_amount=30,
+                                     order_status=order_status)
+        for product_variant in product_variants or []:
+            OrderItem.objects.create(order=order, product_variant=product_variant, sub_total=10)
+        return order
+
+    def assertSales(self, product_variant: ProductVariant, num_sales: int):
+        self.assertEqual(ProductVariant.objects.get(id=product_variant.id).num_sales, num_sales)
+        self.assertEqual(Product.objects.get(id=product_variant.product_id).num_sales, num_sales)
+
+    def test_pending_order_is_not_counted(self):
+        self.create_order(product_variants=[self.product_variant])
+
+        self.assertSales(self.product_variant, 0)
+
+    def test_confirmation_counts_each_item_once(self):
+        order = self.create_order(product_variants=[self.product_variant, self.product_variant, self.other_product_variant])
+
+        order.order_status = Order.CONFIRMED
+        order.save()
+        # Saving the confirmed order again doesn't count its items twice
+        order.save()
+
+        self.assertSales(self.product_variant, 2)
+        self.assertSales(self.other_product_variant, 1)
+
+    def test_leaving_the_confirmed_status_removes_the_sales(self):
+        order = self.create_order(product_variants=[self.product_variant, self.product_variant])
+        order.order_status = Order.CONFIRMED
+        order.save()
+
+        order.order_status = Order.CANCELLED
+        order.save()
+
+        self.assertSales(self.product_variant, 0)
+
+    def test_concurrent_confirmations_count_once(self):
+        order = self.create_order(product_variants=[self.product_variant])
+        # Two requests holding the pending order confirm it
+        first_instance, second_instance = Order.objects.get(id=order.id), Order.objects.get(id=order.id)
+        first_instance.order_status = second_instance.order_status = Order.CONFIRMED
+
+        first_instance.save()
+        second_instance.save()
+
+        self.assertSales(self.product_variant, 1)
+
+    def test_save_without_the_status_keeps_the_counters(self):
+        order = self.create_order(product_variants=[self.product_variant])
+
+        order.order_status = Order.CONFIRMED
+        order.save(update_fields=['total_amount'])
+
+        self.assertSales(self.product_variant, 0)
+
+    def test_items_of_a_confirmed_order(self):
+        order = self.create_order(order_status=Order.CONFIRMED)
+
+        order_item = OrderItem.objects.create(order=order, product_variant=self.product_variant, sub_total=10)
+        OrderItem.objects.create(order=order, product_variant=self.product_variant, sub_total=10)
+        self.assertSales(self.product_variant, 2)
+
+        order_item.delete()
+        self.assertSales(self.product_variant, 1)
+
+
+class ReviewsCountersTestCase(TestCase):
+    """
+    The reviews counters, the average rating and the rating histogram follow the reviews (see products/signals.py)
+    """
+    def setUp(self):
+        self.product_variant = ProductVariantFactory()
+        self.other_product_variant = ProductVariantFactory()
+
+    def assertReviews(self, product_variant: ProductVariant, num_reviews: int, rating_sum: int, avg_rating: float, histogram: dict):
+        product_variant = ProductVariant.objects.get(id=product_variant.id)
+        product = Product.objects.get(id=product_variant.product_id)
+        for counters in (product_variant, product):
+            self.assertEqual(counters.num_reviews, num_reviews)
+            self.assertEqual(counters.rating_sum, rating_sum)
+            self.assertAlmostEqual(counters.avg_rating, avg_rating)
+            self.assertEqual({stars: getattr(counters, f'num_ratings_{stars}') for stars in range(1, 6)},
+                             {stars: histogram.get(stars, 0) for stars in range(1, 6)})
+
+    def test_reviews_lifecycle(self):
+        review = ProductVariantReviewFactory(product_variant=self.product_variant, rating=4)
+        self.assertReviews(self.product_variant, 1, 4, 4.0, {4: 1})
+
+        ProductVariantReviewFactory(product_variant=self.product_variant, rating=2)
+        self.assertReviews(self.product_variant, 2, 6, 3.0, {2: 1, 4: 1})
+
+        review.rating = 5
+        review.save()
+        self.assertReviews(self.product_variant, 2, 7, 3.5, {2: 1, 5: 1})
+
+        review.delete()
+        self.assertReviews(self.product_variant, 1, 2, 2.0, {2: 1})
+
+    def test_review_moved_to_another_variant(self):
+        review = ProductVariantReviewFactory(product_variant=self.product_variant, rating=3)
+
+        review.product_variant = self.other_product_variant
+        review.rating = 1
+        review.save()
+
+        self.assertReviews(self.product_variant, 0, 0, 0.0, {})
+        self.assertReviews(self.other_product_variant, 1, 1, 1.0, {1: 1})
+
+    def test_counters_match_a_rebuild(self):
+        ProductVariantReviewFactory(product_variant=self.product_variant, rating=5)
+        ProductVariantReviewFactory(product_variant=self.product_variant, rating=3)
+
+        ProductVariant.rebuild_counters()
+
+        self.assertReviews(self.product_variant, 2, 8, 4.0, {3: 1, 5: 1})
+
+
+class CatalogRowCountersTestCase(TransactionTestCase):
+    """
+    Outside of a transaction the catalog rows are refreshed right away, they must read the updated counters
+    """
+    # The tables are flushed with TRUNCATE ... CASCADE when the available apps are set : the migrations left tables
+    # which are not in the models anymore (roles_permissions) and still reference the flushed ones
+    available_apps = [app_config.name for app_config in apps.get_app_configs()]
+
+    def setUp(self):
+        self.account_profile = AccountProfileFactory()
+        self.product_variant = ProductVariantFactory(product__self_made=False, product__to_be_published=True)
+
+    def get_catalog_row(self) -> ProductCatalogRow:
+        return ProductCatalogRow.objects.get(product_id=self.product_variant.product_id)
+
+    def test_review_refreshes_the_row_with_the_new_counters(self):
+        review = ProductVariantReviewFactory(product_variant=self.product_variant, rating=4)
+        catalog_row = self.get_catalog_row()
+        self.assertEqual((catalog_row.num_reviews, catalog_row.avg_rating), (1, 4.0))
+
+        review.delete()
+        catalog_row = self.get_catalog_row()
+        self.assertEqual((catalog_row.num_reviews, catalog_row.avg_rating), (0, 0.0))
+
+    def test_confirmation_refreshes_the_row_with_the_new_counters(self):
+        order = Order.objects.create(account_profile=self.account_profile,
+                                     delivery_address=DeliveryAddressFactory(account_profile=self.account_profile),
+                                     payment_method=PaymentMethod.objects.create(account_profile=self.account_profile),
+                                     total_amount=20)
+        OrderItem.objects.create(order=order, product_variant=self.product_variant, sub_total=10)
+        OrderItem.objects.create(order=order, product_variant=self.product_variant, sub_total=10)
+        self.assertEqual(self.get_catalog_row().num_sales, 0)
+
+        order.order_status = Order.CONFIRMED
+        order.save()
+        self.assertEqual(self.get_catalog_row().num_sales, 2)
+
+        OrderItem.objects.filter(order=order).first().delete()
+        self.assertEqual(self.get_catalog_row().num_sales, 1)
@@ -29,6 +29,15 @@ class JWTAuthentication(BaseAuthentication):
         # Separate the token from the prefix Bearer
         token = raw_token.split(' ')[1]
 
+        account = self.authenticate_token(token)
+        if not account:
+            return None
+        return (account, None)
+
+    def authenticate_token(self, token: str):
+        """
+        Returns the account of a valid access token, None otherwise (also used to authenticate the websockets)
+        """
         # Check if the token if the token is valid
         token_components: dict = verify_access_token(token)
 
@@ -72,7 +81,7 @@ class JWTAuthentication(BaseAuthentication):
         except Account.DoesNotExist:
             return None
         
-        return (account, None)
+        return account
 
     
 
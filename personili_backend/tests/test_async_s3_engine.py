@@ -0,0 +1,65 @@
+import pytest
+
+from utils.aws.storage.async_s3_engine import AsyncS3Engine
+
+
+class FakeS3Engine:
+    """
+    Records the calls of AsyncS3Engine to the S3 engine
+    """
+
+    def __init__(self, upload_error: Exception = None):
+        self.upload_error = upload_error
+        self.deleted_paths = []
+
+    def build_file_path(self, file, template_name, placeholder_values):
+        return f"images/{template_name}/new.png"
+
+    def upload_file_to_s3(self, file, template_name, placeholder_values, file_name=None):
+        if self.upload_error:
+            raise self.upload_error
+        return self.build_file_path(file, template_name, placeholder_values)
+
+    def delete_files_from_s3(self, s3_paths):
+        self.deleted_paths.extend(s3_paths)
+
+
+@pytest.mark.django_db
+def test_replace_sync_deletes_the_old_objects_once_committed(django_capture_on_commit_callbacks):
+    engine = FakeS3Engine()
+    async_s3_engine = AsyncS3Engine(engine, max_workers=1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        s3_path = async_s3_engine.replace_sync(["images/profile/old.png", "images/profile/new.png"], b"image", "profile", {})
+        assert engine.deleted_paths == []
+    async_s3_engine.executor.shutdown(wait=True)
+
+    assert s3_path == "images/profile/new.png"
+    # The new object overwrote the old one with the same path
+    assert engine.deleted_paths == ["images/profile/old.png"]
+
+
+@pytest.mark.django_db
+def test_replace_sync_keeps_the_old_objects_if_the_upload_fails(django_capture_on_commit_callbacks):
+    engine = FakeS3Engine(upload_error=ConnectionError("S3 unavailable"))
+    async_s3_engine = AsyncS3Engine(engine, max_workers=1)
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(ConnectionError):
+            async_s3_engine.replace_sync(["images/profile/old.png"], b"image", "profile", {})
+
+    assert callbacks == []
+    assert engine.deleted_paths == []
+
+
+@pytest.mark.django_db
+def test_replace_sync_waits_for_the_commit_to_delete_the_old_objects(django_capture_on_commit_callbacks):
+    engine = FakeS3Engine()
+    async_s3_engine = AsyncS3Engine(engine, max_workers=1)
+
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        async_s3_engine.replace_sync(["images/profile/old.png"], b"image", "profile", {})
+
+    # Nothing is deleted as long as the transaction isn't committed, a rollback drops the callback
+    assert len(callbacks) == 1
+    assert engine.deleted_paths == []
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import pytest
+
+from utils.catalog_cache import CATALOG_CACHE_PREFIX, build_cache_key, canonicalize_value, tag, tags_of_ids
+
+
+@pytest.mark.parametrize(
+    "params, equivalent_params",
+    [
+        # Id lists are sets
+        ({"themes": ["b", "a"]}, {"themes": ["a", "b", "a"]}),
+        ({"themes": ("a", "b")}, {"themes": {"b", "a"}}),
+        # The order of the parameters doesn't matter
+        ({"order": "newest", "offset": 0, "limit": 20}, {"limit": 20, "offset": 0, "order": "newest"}),
+        # Booleans as they come in the payloads
+        ({"sponsored": "true"}, {"sponsored": True}),
+        ({"sponsored": "False"}, {"sponsored": False}),
+        # Prices
+        ({"min_price": 10}, {"min_price": 10.0}),
+        ({"min_price": 10}, {"min_price": Decimal("10.00")}),
+        ({"max_price": Decimal("12.50")}, {"max_price": 12.5}),
+        # Empty filters are ignored
+        ({"order": "newest"}, {"order": "newest", "themes": [], "search": "", "category": None, "ids": ()}),
+    ],
+)
+def test_equivalent_params_give_the_same_key(params: dict, equivalent_params: dict):
+    assert build_cache_key("designs", params) == build_cache_key("designs", equivalent_params)
+
+
+@pytest.mark.parametrize(
+    "params, other_params",
+    [
+        ({"themes": ["a"]}, {"themes": ["a", "b"]}),
+        ({"sponsored": True}, {"sponsored": False}),
+        ({"min_price": 10}, {"min_price": 11}),
+        ({"offset": 0}, {"offset": 20}),
+        ({"order": "newest"}, {"ordering": "newest"}),
+        ({"search": "cat"}, {}),
+    ],
+)
+def test_different_params_give_different_keys(params: dict, other_params: dict):
+    assert build_cache_key("designs", params) != build_cache_key("designs", other_params)
+
+
+def test_namespace_is_part_of_the_key():
+    params = {"order": "newest"}
+
+    assert build_cache_key("designs", params) != build_cache_key("products", params)
+    assert build_cache_key("designs", params).startswith(f"{CATALOG_CACHE_PREFIX}:designs:")
+
+
+@pytest.mark.parametrize(
+    "value, canonical_value",
+    [
+        (["b", "a", "b"], ["a", "b"]),
+        ([2, 1], ["1", "2"]),
+        ("true", True),
+        ("True", True),
+        ("false", False),
+        (True, True),
+        (0, "0"),
+        (10.5, "10.5"),
+        (Decimal("10.50"), "10.5"),
+        (Decimal("0.50"), "0.5"),
+        ("newest", "newest"),
+    ],
+)
+def test_canonicalize_value(value, canonical_value):
+    assert canonicalize_value(value) == canonical_value
+
+
+def test_tags():
+    assert tag("products") == "products"
+    assert tag("workshop", "b1") == "workshop:b1"
+    assert tag("workshop", 0) == "workshop:0"
+    assert tags_of_ids("theme", ["a", None, "", "b", "a"]) == {"theme:a", "theme:b"}
+    assert tags_of_ids("theme", None) == set()
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+import requests
+
+from utils.http.client import HttpClient
+from utils.http.stub_server import StubResponse, StubServer
+
+
+@pytest.fixture
+def stub():
+    with StubServer() as stub_server:
+        yield stub_server
+
+
+def build_client(**kwargs) -> HttpClient:
+    # No backoff between the attempts, the tests don't wait
+    options = {"connect_timeout": 1, "read_timeout": 2, "max_retries": 2, "backoff_factor": 0}
+    options.update(kwargs)
+    return HttpClient(**options)
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_refused_calls_are_retried(stub: StubServer, status: int):
+    stub.add("/generate", StubResponse(status), StubResponse(200, {"image": "ok"}))
+
+    response = build_client().post(stub.url("/generate"), data={"prompt": "a cat"})
+
+    assert response.status_code == 200
+    assert response.json() == {"image": "ok"}
+    assert [request["method"] for request in stub.requests] == ["POST", "POST"]
+    # The body is sent again with the retry
+    assert stub.requests[1]["body"] == b"prompt=a+cat"
+
+
+def test_retries_are_bounded(stub: StubServer):
+    stub.add("/generate", StubResponse(503))
+
+    response = build_client(max_retries=2).post(stub.url("/generate"))
+
+    # The last response is returned once the retries are exhausted
+    assert response.status_code == 503
+    assert len(stub.requests) == 3
+
+
+def test_client_errors_are_not_retried(stub: StubServer):
+    stub.add("/generate", StubResponse(400, {"errors": ["invalid prompt"]}), StubResponse(200))
+
+    response = build_client().post(stub.url("/generate"))
+
+    assert response.status_code == 400
+    assert len(stub.requests) == 1
+
+
+def test_retry_after_is_respected(stub: StubServer):
+    stub.add("/generate", StubResponse(503, headers={"Retry-After": "1"}), StubResponse(200))
+
+    started_at = time.monotonic()
+    response = build_client().post(stub.url("/generate"))
+
+    assert response.status_code == 200
+    assert time.monotonic() - started_at >= 1
+
+
+def test_read_timeout(stub: StubServer):
+    stub.add("/generate", StubResponse(200, delay=1))
+    client = build_client(read_timeout=0.2)
+
+    with pytest.raises(requests.RequestException):
+        client.post(stub.url("/generate"))
+
+    # The request may have been processed by the API, it's not sent again
+    assert len(stub.requests) == 1
+    host_stats = client.get_latency_stats()[stub.url().split("//")[1]]
+    assert (host_stats["calls"], host_stats["errors"]) == (1, 1)
+
+
+def test_latency_stats(stub: StubServer):
+    stub.add("/health", StubResponse(200))
+    stub.add("/missing", StubResponse(404))
+    client = build_client()
+
+    for _ in range(3):
+        client.get(stub.url("/health"))
+    client.get(stub.url("/missing"))
+
+    host_stats = client.get_latency_stats()[stub.url().split("//")[1]]
+    assert (host_stats["calls"], host_stats["errors"]) == (4, 1)
+    assert 0 <= host_stats["p50"] <= host_stats["p95"]
+    assert host_stats["avg"] > 0
+
+
+def test_stream_request(stub: StubServer):
+    stub.add("/image", StubResponse(200, b"x" * 100000))
+    client = build_client()
+
+    with client.stream_request("GET", stub.url("/image")) as response:
+        content = b"".join(response.iter_content(chunk_size=8192))
+    client.get(stub.url("/image"))
+
+    assert content == b"x" * 100000
+    assert len(stub.requests) == 2
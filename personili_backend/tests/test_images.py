@@ -0,0 +1,112 @@
+from itertools import combinations
+
+import pytest
+from PIL import Image
+
+from utils.images.colors import LAB_AB_CELLS, hex_to_rgb, lab_cell, neighbour_lab_cells
+from utils.images.hashing import MAX_DUPLICATE_DISTANCE, dhash, dhash_bands, hamming_distance
+
+
+@pytest.mark.parametrize(
+    "value, bands",
+    [
+        (0, [0, 0, 0, 0]),
+        (-1, [0xFFFF, 0xFFFF, 0xFFFF, 0xFFFF]),
+        (0x0123456789ABCDEF, [0x0123, 0x4567, 0x89AB, 0xCDEF]),
+        (-(1 << 63), [0x8000, 0, 0, 0]),
+        ((1 << 63) - 1, [0x7FFF, 0xFFFF, 0xFFFF, 0xFFFF]),
+        (1, [0, 0, 0, 1]),
+    ],
+)
+def test_dhash_bands(value: int, bands: list):
+    assert dhash_bands(value) == bands
+
+
+@pytest.mark.parametrize(
+    "first, second, distance",
+    [
+        (0, 0, 0),
+        (0x0123456789ABCDEF, 0x0123456789ABCDEF, 0),
+        (0, -1, 64),
+        # The hashes are stored signed, -1 and 2 ** 64 - 1 are the same 64 bits
+        (-1, (1 << 64) - 1, 0),
+        (0, 1, 1),
+        (0, -(1 << 63), 1),
+        (0b1011, 0b0110, 3),
+    ],
+)
+def test_hamming_distance(first: int, second: int, distance: int):
+    assert hamming_distance(first, second) == distance
+    assert hamming_distance(second, first) == distance
+
+
+def test_near_duplicates_share_a_band():
+    value = 0x0123456789ABCDEF - (1 << 64)
+    for flipped_bits in combinations(range(0, 64, 5), MAX_DUPLICATE_DISTANCE):
+        near_duplicate = value
+        for bit in flipped_bits:
+            near_duplicate ^= 1 << bit
+
+        assert hamming_distance(value, near_duplicate) == MAX_DUPLICATE_DISTANCE
+        assert any(band == other_band for band, other_band in zip(dhash_bands(value), dhash_bands(near_duplicate)))
+
+
+def test_dhash_of_a_plain_image():
+    # No pixel is brighter than its right neighbour
+    assert dhash(Image.new("RGB", (32, 32), (200, 30, 30))) == 0
+
+
+@pytest.mark.parametrize(
+    "hex_color, rgb",
+    [
+        ("#ff8000", (255, 128, 0)),
+        ("FF8000", (255, 128, 0)),
+        (" #000000 ", (0, 0, 0)),
+    ],
+)
+def test_hex_to_rgb(hex_color: str, rgb: tuple):
+    assert hex_to_rgb(hex_color) == rgb
+
+
+@pytest.mark.parametrize("hex_color", ["", "#fff", "#ff80001", "#gg8000"])
+def test_hex_to_rgb_rejects_invalid_colors(hex_color: str):
+    with pytest.raises(ValueError):
+        hex_to_rgb(hex_color)
+
+
+def test_neighbour_lab_cells_around_a_middle_color():
+    lab = (55.0, 20.0, -20.0)
+    cells = neighbour_lab_cells(lab)
+
+    assert len(cells) == 27
+    assert lab_cell(lab) in cells
+    assert cells == sorted(set(cells))
+
+
+@pytest.mark.parametrize(
+    "lab, number_of_cells",
+    [
+        # Black and white are on the edges of the lightness axis
+        ((0.0, 0.0, 0.0), 18),
+        ((100.0, 0.0, 0.0), 18),
+        ((50.0, -128.0, 0.0), 18),
+        ((50.0, 127.0, 127.0), 12),
+        ((0.0, -128.0, -128.0), 8),
+    ],
+)
+def test_neighbour_lab_cells_on_the_edges(lab: tuple, number_of_cells: int):
+    cells = neighbour_lab_cells(lab)
+
+    assert len(cells) == number_of_cells
+    assert lab_cell(lab) in cells
+    assert cells == sorted(set(cells))
+    assert all(0 <= cell < 11 * LAB_AB_CELLS * LAB_AB_CELLS for cell in cells)
+
+
+def test_neighbour_lab_cells_contain_the_close_colors():
+    lab = (49.9, 15.9, -0.1)
+    cells = neighbour_lab_cells(lab)
+
+    for close_lab in [(50.1, 16.1, 0.1), (45.0, 10.0, -5.0), (40.0, 0.0, -16.0)]:
+        assert lab_cell(close_lab) in cells
+    assert lab_cell((70.0, 16.0, 0.0)) not in cells
@@ -0,0 +1,93 @@
+import base64
+from uuid import UUID
+
+import pytest
+from django.db.models import Q
+
+from utils.pagination import decode_cursor, encode_cursor, keyset_filter, parse_cursor_pagination
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [12, "c9bf9e57-1685-4c89-bafb-ff5af830be8a"],
+        [0, 0, 0.0, "b"],
+        [None, "a"],
+        ["été", "ü/+?"],
+    ],
+)
+def test_cursor_round_trip(values: list):
+    cursor = encode_cursor(values)
+
+    assert decode_cursor(cursor) == values
+    # The cursor is used as is in the URLs
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+def test_encode_cursor_serializes_uuids_as_strings():
+    design_id = UUID("c9bf9e57-1685-4c89-bafb-ff5af830be8a")
+
+    assert decode_cursor(encode_cursor([3, design_id])) == [3, str(design_id)]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        None,
+        "",
+        12,
+        "!!!",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(b'{"num_likes": 3}').decode(),
+        base64.urlsafe_b64encode(b'"a string"').decode(),
+        base64.urlsafe_b64encode(b"\xff\xff\xff").decode(),
+    ],
+)
+def test_decode_cursor_rejects_invalid_cursors(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def test_keyset_filter_single_field():
+    assert keyset_filter(["id"], ["b"]) == Q(id__gt="b")
+
+
+def test_keyset_filter_descending_then_ascending():
+    assert keyset_filter(["-num_likes", "id"], [3, "b"]) == (Q(num_likes__lt=3) |
+                                                            (Q(id__gt="b") & Q(num_likes=3)))
+
+
+def test_keyset_filter_ties_on_every_previous_field():
+    expected = (Q(num_sales__lt=10) |
+                (Q(num_reviews__lt=4) & Q(num_sales=10)) |
+                (Q(product_id__gt="b") & Q(num_sales=10) & Q(num_reviews=4)))
+
+    assert keyset_filter(["-num_sales", "-num_reviews", "product_id"], [10, 4, "b"]) == expected
+
+
+def test_parse_cursor_pagination_offset_mode():
+    assert parse_cursor_pagination({}) == (None, None)
+    assert parse_cursor_pagination({"pagination": "offset", "cursor": "ignored"}) == (None, None)
+
+
+def test_parse_cursor_pagination_cursor_mode():
+    cursor = encode_cursor([3, "b"])
+
+    assert parse_cursor_pagination({"pagination": "cursor"}) == (None, 20)
+    assert parse_cursor_pagination({"pagination": "cursor", "cursor": cursor, "page_size": "10"}) == (cursor, 10)
+    assert parse_cursor_pagination({"pagination": "cursor", "page_size": ""}, default_page_size=5) == (None, 5)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"pagination": "pages"},
+        {"pagination": "cursor", "cursor": "!!!"},
+        {"pagination": "cursor", "page_size": "0"},
+        {"pagination": "cursor", "page_size": "51"},
+        {"pagination": "cursor", "page_size": "-1"},
+        {"pagination": "cursor", "page_size": "ten"},
+    ],
+)
+def test_parse_cursor_pagination_rejects_invalid_parameters(data: dict):
+    with pytest.raises(ValueError):
+        parse_cursor_pagination(data)
@@ -0,0 +1,65 @@
+import pytest
+
+from utils.aws.storage.s3_engine import S3Engine
+
+
+@pytest.fixture
+def s3_engine_factory(settings, monkeypatch):
+    # The clients are built without calling STS, the role is only assumed on their first request
+    monkeypatch.setenv("STS_SESSION_VALIDITY_DURATION", "3600")
+
+    def build(public_base_url):
+        settings.AWS_S3_PUBLIC_BASE_URL = public_base_url
+        return S3Engine()
+
+    return build
+
+
+@pytest.mark.parametrize(
+    "s3_path",
+    [
+        "images/platform/events/3-summer-sale/banner.jpg",
+        "images/platform/categories/1-t-shirts/cover.png",
+        "images/platform/departments/2-men/cover.png",
+        "images/platform/themes/4-space/cover.png",
+        "images/organizations/5-acme/organization_profile/logo.png",
+        "images/organizations/5-acme/workshops/6-paris/designs/7-cat/previews/front.webp",
+        "images/organizations/5-acme/workshops/6-paris/products/8-mug/previews/front.webp",
+    ],
+)
+def test_public_templates_paths_are_public(s3_engine_factory, s3_path: str):
+    assert s3_engine_factory("https://cdn.personili.com").is_public_path(s3_path)
+
+
+@pytest.mark.parametrize(
+    "s3_path",
+    [
+        "images/regular_users/1-user@personili.com/profile/avatar.png",
+        "images/regular_users/1-user@personili.com/designs/2-cat/original.png",
+        "images/organizations/5-acme/workshops/6-paris/designs/7-cat/original.png",
+        "images/organizations/5-acme/workshops/6-paris/workshop_profile/logo.png",
+        "images/ai_generations/0f1e2d3c.png",
+        # Outside of the folder of a public template
+        "images/platform/events.png",
+        "images/platform/events/3-summer-sale",
+        "images/platform/events/../regular_users/1-user@personili.com/profile/avatar.png",
+        "prefix/images/platform/events/3-summer-sale/banner.jpg",
+    ],
+)
+def test_other_paths_are_private(s3_engine_factory, s3_path: str):
+    assert not s3_engine_factory("https://cdn.personili.com").is_public_path(s3_path)
+
+
+@pytest.mark.parametrize("public_base_url", [None, "", "/"])
+def test_every_path_is_private_without_public_base_url(s3_engine_factory, public_base_url):
+    s3_engine = s3_engine_factory(public_base_url)
+
+    assert s3_engine.public_base_url is None
+    assert not s3_engine.is_public_path("images/platform/events/3-summer-sale/banner.jpg")
+
+
+def test_public_url(s3_engine_factory):
+    s3_engine = s3_engine_factory("https://cdn.personili.com/")
+
+    assert s3_engine.public_url("images/platform/events/3-summer sale/bannière.jpg") == \
+        "https://cdn.personili.com/images/platform/events/3-summer%20sale/banni%C3%A8re.jpg"
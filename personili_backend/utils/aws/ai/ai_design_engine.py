@@ -1,11 +1,15 @@
 # Standard imports
-import requests
+import logging
+from contextlib import ExitStack
 
 #
 
 # settings
 from django.conf import settings
 
+# Http client
+from utils.http.client import http_client
+
 class AiDesignEngine:
     def __init__(self) -> None:
         self._stabilit_api_key = settings.STABILITY_API_KEY
@@ -25,25 +29,26 @@ class AiDesignEngine:
             "Authorization": f"Bearer {self._stabilit_api_key}"
         }
 
-        # Encode parameters
-        files = {}
+        # Encode parameters, the opened files are closed once the request is sent
         image = params.pop("image", None)
         mask = params.pop("mask", None)
-        if image is not None and image != '':
-            files["image"] = open(image, 'rb')
-        if mask is not None and mask != '':
-            files["mask"] = open(mask, 'rb')
-        if len(files)==0:
-            files["none"] = ''
+        with ExitStack() as stack:
+            files = {}
+            if image is not None and image != '':
+                files["image"] = stack.enter_context(open(image, 'rb'))
+            if mask is not None and mask != '':
+                files["mask"] = stack.enter_context(open(mask, 'rb'))
+            if len(files)==0:
+                files["none"] = ''
 
-        # Send request
-        print(f"Sending REST request to {host}...")
-        response = requests.post(
-            host,
-            headers=headers,
-            files=files,
-            data=params
-        )
+            # Send request through the pooled client (keep-alive connections, timeouts and retries)
+            logging.info(f"Sending REST request to {host}...")
+            response = http_client.post(
+                host,
+                headers=headers,
+                files=files,
+                data=params
+            )
         if not response.ok:
             raise Exception(f"HTTP {response.status_code}: {response.text}")
 
@@ -1,22 +1,166 @@
 import boto3
+import botocore.session
+from botocore.credentials import DeferredRefreshableCredentials
+import logging
 import os
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+# Import the settings
+from django.conf import settings
+
+
+class _ProviderCredentials(DeferredRefreshableCredentials):
+    """
+    botocore credentials reading the credentials of a StsCredentialsProvider, they switch to the credentials refreshed
+    by the provider on their next use (instead of keeping the previous ones until the end of their own refresh window)
+    """
+
+    def __init__(self, provider: "StsCredentialsProvider"):
+        self._provider = provider
+        self._provider_version: Optional[int] = None
+        super().__init__(refresh_using=self._fetch_provider_credentials, method="sts-assume-role")
+        # botocore refreshes in the last part of the margin only : the provider has already refreshed the credentials by then
+        self._advisory_refresh_timeout = max(provider.refresh_margin // 2, 1)
+        self._mandatory_refresh_timeout = max(provider.refresh_margin // 4, 1)
+
+    def _fetch_provider_credentials(self) -> dict:
+        self._provider_version, credentials = self._provider.fetch_versioned_credentials()
+        return credentials
+
+    def refresh_needed(self, refresh_in=None):
+        # The expiry check after a refresh (refresh_in=0) ignores the version, the provider may have refreshed meanwhile
+        if refresh_in and self._provider_version != self._provider.version:
+            return True
+        return super().refresh_needed(refresh_in)
+
+
+class StsCredentialsProvider:
+    """
+    Temporary credentials of an assumed IAM role, cached in memory and shared by all the threads of the process.
+    A background timer refreshes them refresh_margin seconds before they expire, so the requests never wait for STS.
+    The boto3 sessions returned by get_session read them through botocore refreshable credentials :
+    their clients pick up the new credentials by themselves and only wait for STS if the background refresh failed
+    """
+    # Delay (in seconds) before retrying a failed background refresh
+    RETRY_DELAY = 30
+
+    def __init__(self, assume_role: Callable[[], dict], duration: int, refresh_margin: int):
+        # assume_role returns the credentials of an AssumeRole response (see IamEngine.assume_iam_role)
+        self.assume_role = assume_role
+        self.duration = duration
+        # The credentials must still be valid for a while once refreshed
+        self.refresh_margin = min(refresh_margin, duration // 2)
+        self._credentials: Optional[dict] = None
+        self._expiration: Optional[datetime] = None
+        # Incremented on each refresh, the botocore credentials of the sessions compare it to the version they hold
+        self.version = 0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        # The timer thread isn't inherited by the forked web workers, it's started again in each process
+        self._timer_pid: Optional[int] = None
+
+    def _remaining_seconds(self) -> float:
+        return (self._expiration - datetime.now(timezone.utc)).total_seconds()
+
+    def _fetch(self) -> tuple[dict, datetime]:
+        credentials = self.assume_role()
+        expiration: datetime = credentials.get("Expiration")
+        return {
+            "access_key": credentials.get("AccessKeyId"),
+            "secret_key": credentials.get("SecretAccessKey"),
+            "token": credentials.get("SessionToken"),
+            "expiry_time": expiration.isoformat(),
+        }, expiration
+
+    def _schedule_refresh(self, delay: float = None):
+        """
+        Start the timer of the next background refresh, must be called with the lock held
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        if delay is None:
+            delay = max(self._remaining_seconds() - self.refresh_margin, self.RETRY_DELAY)
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+        self._timer_pid = os.getpid()
+
+    def _refresh_in_background(self):
+        # STS is called without the lock, the current credentials stay readable meanwhile
+        try:
+            credentials, expiration = self._fetch()
+        except Exception as e:
+            logging.error(f"StsCredentialsProvider refresh error :{e.args} ")
+            with self._lock:
+                self._schedule_refresh(self.RETRY_DELAY)
+            return
+        with self._lock:
+            self._set_credentials(credentials, expiration)
+
+    def _set_credentials(self, credentials: dict, expiration: datetime):
+        """
+        Replace the current credentials, must be called with the lock held
+        """
+        self._credentials, self._expiration = credentials, expiration
+        self.version += 1
+        self._schedule_refresh()
+
+    def _ensure_credentials(self):
+        """
+        Assume the role if the credentials are missing or the background refresh is late, must be called with the lock held
+        """
+        if self._credentials is None or self._remaining_seconds() <= self.refresh_margin:
+            self._set_credentials(*self._fetch())
+        elif self._timer_pid != os.getpid():
+            self._schedule_refresh()
+
+    def fetch_versioned_credentials(self) -> tuple[int, dict]:
+        """
+        Version and metadata of the current credentials, as read by botocore (access_key, secret_key, token, expiry_time).
+        The cached credentials are returned unless they're missing or the background refresh is late, then STS is called
+        """
+        with self._lock:
+            self._ensure_credentials()
+            return self.version, dict(self._credentials)
+
+    def get_remaining_lifetime(self) -> int:
+        """
+        Number of seconds before the current credentials expire. The clients of the sessions sign with these credentials
+        (or with newer ones) from now on, what they sign (presigned URLs) stays valid at least that long
+        """
+        with self._lock:
+            self._ensure_credentials()
+            return max(int(self._remaining_seconds()), 0)
+
+    def get_session(self, region_name: str = None) -> boto3.Session:
+        """
+        boto3 session using the credentials of the provider, the role is assumed on the first call of its clients
+        """
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = _ProviderCredentials(self)
+        return boto3.Session(botocore_session=botocore_session, region_name=region_name)
+
 
 class IamEngine:
     """
     Class to handle IAM roles and users configuration
     """
+    # Credentials providers of the process, by role ARN and session name
+    _providers: dict[tuple[str, str], StsCredentialsProvider] = {}
+    _providers_lock = threading.Lock()
 
-    def __init__(self, environment: str = "dev", 
-                       session_name: str = "LocalSession", 
+    def __init__(self, environment: str = "dev",
+                       session_name: str = "LocalSession",
                        role_name: str="AWS_DEV_BACK_ROLE_ARN") -> None:
-        
+
         self.session_name = session_name
         self.environment = environment
         self.sts_session_validity_duration = int(os.environ.get("STS_SESSION_VALIDITY_DURATION"))
         self.role_name = role_name
         self.role_arn = os.environ.get(role_name)
-        
+
 
     def get_iam_user_client(self):
         """
@@ -25,7 +169,7 @@ class IamEngine:
         return boto3.client(
             "sts",
             aws_access_key_id = os.environ.get("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY"), 
+            aws_secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY"),
         )
 
     def assume_iam_role(self) -> dict:
@@ -39,38 +183,22 @@ class IamEngine:
             DurationSeconds = self.sts_session_validity_duration
         )
         # Get the credentials
-        credentials = response.get("Credentials")
+        return response.get("Credentials")
 
-        # Update the temporary credentials env variables
-        os.environ["TEMP_AWS_ACCESS_KEY_ID"] = credentials.get("AccessKeyId")
-        os.environ["TEMP_AWS_SECRET"] = credentials.get("SecretAccessKey")
-        os.environ["TEMP_AWS_SESSION_TOKEN"] = credentials.get("SessionToken")
-        os.environ["STS_SESSION_EXPIRATION_TIME"] = datetime.strftime(datetime.now() + timedelta(seconds=self.sts_session_validity_duration), "%Y-%m-%d %H:%M:%S.%f")
+    def get_credentials_provider(self) -> StsCredentialsProvider:
+        """
+        This method returns the credentials provider of the role, shared by the whole process
+        """
+        key = (self.role_arn, self.session_name)
+        with self._providers_lock:
+            if key not in self._providers:
+                self._providers[key] = StsCredentialsProvider(self.assume_iam_role,
+                                                              self.sts_session_validity_duration,
+                                                              getattr(settings, "AWS_STS_REFRESH_MARGIN", 5 * 60))
+            return self._providers[key]
 
-        return credentials
-    
-    def get_sts_session(self) -> boto3.Session:
-        """
-        This method is used to get an STS session
-        """
-        # First check if the temporary credentials already exists
-        if os.environ.get("TEMP_AWS_ACCESS_KEY_ID") == "empty" or os.environ.get("TEMP_AWS_SECRET_ACCESS_KEY") == "empty" or os.environ.get("TEMP_AWS_SESSION_TOKEN") == "empty":
-            credentials: dict = self.assume_iam_role()
-        else:
-            # Check if the temporary credentials haven't expired
-            expiration_time = os.environ.get("TEMP_AWS_EXPIRATION_TIME")
-            expiration_time = datetime.strptime(expiration_time, "%Y-%m-%d %H:%M:%S.%f")
-            if expiration_time < datetime.now():
-                credentials: dict = self.assume_iam_role()
-            else:
-                credentials = {
-                    "AccessKeyId": os.environ.get("TEMP_AWS_ACCESS_KEY_ID"),
-                    "SecretAccessKey": os.environ.get("TEMP_AWS_SECRET"),
-                    "SessionToken": os.environ.get("TEMP_AWS_SESSION_TOKEN")
-                }
-        # Generate the sts session using the temporary credentials
-        return boto3.Session(
-            aws_access_key_id = credentials.get('AccessKeyId'),
-            aws_secret_access_key = credentials.get('SecretAccessKey'),
-            aws_session_token = credentials.get('SessionToken')
-        )
\ No newline at end of file
+    def get_sts_session(self, region_name: str = None) -> boto3.Session:
+        """
+        This method is used to get an STS session, its credentials are refreshed in memory before they expire
+        """
+        return self.get_credentials_provider().get_session(region_name=region_name)
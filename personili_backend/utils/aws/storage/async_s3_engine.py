@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from utils.aws.storage.s3_engine import S3Engine, s3_engine
+
+
+class AsyncS3Engine:
+    """
+    Async facade of the S3 engine for the async views and consumers of the ASGI workers.
+    boto3 is synchronous : the calls run on a dedicated bounded pool of threads, so they never block the event loop
+    and a burst of S3 calls can't take all the threads of the default executor (used by sync_to_async)
+    """
+
+    def __init__(self, engine: S3Engine, max_workers: int = None):
+        self.engine = engine
+        self.max_workers = max_workers or getattr(settings, "AWS_S3_ASYNC_WORKERS", 16)
+        self._executor: ThreadPoolExecutor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s3-async")
+        return self._executor
+
+    async def _run(self, function: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    async def upload(self, file: Union[File, bytes], template_name: str, placeholder_values: dict[str, Any], file_name: str = None) -> str:
+        """
+        Upload a file under the path of a template and return its S3 path (see S3Engine.upload_file_to_s3)
+        """
+        return await self._run(self.engine.upload_file_to_s3, file, template_name, placeholder_values, file_name)
+
+    async def put_many(self, files: Iterable[Tuple[Union[File, bytes], str, dict[str, Any]]]) -> List[str]:
+        """
+        Upload a batch of files concurrently and return their S3 paths in the same order (see S3Engine.put_many)
+        """
+        return await self._run(self.engine.put_many, list(files))
+
+    async def delete(self, s3_path: str):
+        await self._run(self.engine.delete_file_from_s3, s3_path)
+
+    async def delete_many(self, s3_paths: Iterable[str]):
+        await self._run(self.engine.delete_files_from_s3, list(s3_paths))
+
+    async def sign(self, s3_path: str) -> Optional[str]:
+        return await self._run(self.engine.sign, s3_path)
+
+    async def url_for(self, s3_path: str) -> Optional[str]:
+        return await self._run(self.engine.url_for, s3_path)
+
+    async def urls_for(self, s3_paths: Iterable[str]) -> dict[str, str]:
+        return await self._run(self.engine.urls_for, list(s3_paths))
+
+    def _paths_to_delete(self, old_s3_paths: Iterable[str], file: Union[File, bytes], template_name: str, placeholder_values: dict[str, Any]) -> list[str]:
+        # The new file can have the same path as an old one, it's overwritten by the upload and mustn't be deleted meanwhile
+        new_s3_path = self.engine.build_file_path(file, template_name, placeholder_values)
+        return [s3_path for s3_path in old_s3_paths if s3_path and s3_path != new_s3_path]
+
+    async def replace(self, old_s3_paths: Iterable[str], file: Union[File, bytes], template_name: str, placeholder_values: dict[str, Any]) -> str:
+        """
+        Upload a file then delete the objects it replaces, returns the S3 path of the new file.
+        The old objects are kept if the upload failed, its error is raised
+        """
+        old_s3_paths = self._paths_to_delete(old_s3_paths, file, template_name, placeholder_values)
+        s3_path = await self.upload(file, template_name, placeholder_values)
+        if old_s3_paths:
+            await self.delete_many(old_s3_paths)
+        return s3_path
+
+    def replace_sync(self, old_s3_paths: Iterable[str], file: Union[File, bytes], template_name: str, placeholder_values: dict[str, Any]) -> str:
+        """
+        Same as replace for the sync code : the file is uploaded by the calling thread, the old objects are deleted on the pool
+        once the current transaction is committed, while the request goes on. A failed upload or a rolled back transaction
+        keeps them, the rows still pointing at them stay valid
+        """
+        old_s3_paths = self._paths_to_delete(old_s3_paths, file, template_name, placeholder_values)
+        s3_path = self.engine.upload_file_to_s3(file, template_name, placeholder_values)
+        if old_s3_paths:
+            transaction.on_commit(lambda: self.executor.submit(self._delete_in_background, old_s3_paths))
+        return s3_path
+
+    def _delete_in_background(self, s3_paths: list[str]):
+        try:
+            self.engine.delete_files_from_s3(s3_paths)
+        except Exception as e:
+            logging.error(f"AsyncS3Engine background deletion error :{e.args} ")
+
+
+# Instantiate the class
+async_s3_engine = AsyncS3Engine(s3_engine)
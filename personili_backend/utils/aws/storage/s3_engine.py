@@ -1,10 +1,19 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from utils.aws.iam.iam_engine import IamEngine
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.core.cache import cache
 from django.core.files import File
-from django.core.files.base import ContentFile
+import hashlib
+import io
+import logging
 import os
+import re
+import threading
+import time
 from typing import Union
+from urllib.parse import quote
 
 # Import the settings
 from django.conf import settings
@@ -33,6 +42,8 @@ class S3Engine:
     platform_categories_path_template = base_platform_path + '/categories/{category_id}-{category_name}'
     # departments
     platform_departments_path_template = base_platform_path + '/departments/{department_id}-{department_name}'
+    # themes
+    platform_themes_path_template = base_platform_path + '/themes/{theme_id}-{theme_name}'
 
 
     # Regular user S3 paths
@@ -65,11 +76,22 @@ class S3Engine:
     workshop_events_path_template = base_organizations_path + '/{organization_id}-{organization_name}/workshops/{workshop_id}-{workshop_title}/events/{event_id}-{event_title}'
     # workshop designs
     workshop_designs_path_template = base_organizations_path + '/{organization_id}-{organization_name}/workshops/{workshop_id}-{workshop_title}/designs/{design_id}-{design_title}'
+    # workshop designs previews
+    workshop_design_previews_path_template = workshop_designs_path_template + '/previews'
+    # workshop products previews
+    workshop_product_previews_path_template = base_organizations_path + '/{organization_id}-{organization_name}/workshops/{workshop_id}-{workshop_title}/products/{product_id}-{product_title}/previews'
     # workshop personalizables
     workshop_personalizables_path_template = base_organizations_path + '/{organization_id}-{organization_name}/workshops/{workshop_id}-{workshop_title}/personalizables/{personalizable_id}-{personalizable_name}'
 
+    # AI generations cache S3 paths (content addressed, shared by all the accounts, expired by the bucket lifecycle)
+    ai_generations_path_template = base_path + '/ai_generations/{cache_key}'
+
     # ALL templates organized
     TEMPLATES: dict = {
+        'platform_events': platform_events_path_template,
+        'platform_categories': platform_categories_path_template,
+        'platform_departments': platform_departments_path_template,
+        'platform_themes': platform_themes_path_template,
         'regular_user_profile': regular_user_profile_path_template,
         'regular_user_designs': regular_user_designs_path_template,
         'store_profile': store_profile_path_template,
@@ -79,46 +101,218 @@ class S3Engine:
         'workshop_profile': workshop_profile_path_template,
         'workshop_events': workshop_events_path_template,
         'workshop_designs': workshop_designs_path_template,
-        'workshop_personalizables': workshop_personalizables_path_template
+        'workshop_design_previews': workshop_design_previews_path_template,
+        'workshop_product_previews': workshop_product_previews_path_template,
+        'workshop_personalizables': workshop_personalizables_path_template,
+        'ai_generations': ai_generations_path_template
     }
 
+    # Templates of the public marketing assets, they are served with plain CDN URLs instead of presigned URLs.
+    # Everything else (user uploads, designs originals, registration certificates...) stays private and signed.
+    PUBLIC_TEMPLATES: tuple = (
+        'platform_events',
+        'platform_categories',
+        'platform_departments',
+        'platform_themes',
+        'organization_profile',
+        'workshop_design_previews',
+        'workshop_product_previews',
+    )
+    # The public objects never change once uploaded (a new upload gets a new path)
+    PUBLIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+    # S3 refuses the parts smaller than 5MB, except the last one of an upload
+    MIN_PART_SIZE = 5 * 1024 * 1024
+    # Name of the files uploaded as bytes
+    DEFAULT_FILE_NAME = "random_name.jpeg"
+
+    # Prefix of the presigned URLs shared by all the processes in the cache
+    SIGNED_URLS_CACHE_PREFIX = "s3_signed_url_v2"
+
     def __init__(self, environment: str= "dev"):
         self.environment = environment
-        self.s3_client_session = IamEngine(environment=self.environment).get_sts_session().client('s3')
+        # The client is built once : its credentials are refreshed in memory by the STS credentials provider (see IamEngine)
+        self.credentials_provider = IamEngine(environment=self.environment).get_credentials_provider()
+        self.s3_client_session = self.credentials_provider.get_session(region_name=os.environ.get("AWS_S3_REGION_NAME")).client('s3')
         self.bucket_name = os.environ.get("AWS_S3_BUCKET_NAME")
+        # Base URL of the CDN (or of the bucket) serving the public objects, all the objects are signed if it's not set
+        self.public_base_url: Optional[str] = (getattr(settings, "AWS_S3_PUBLIC_BASE_URL", None) or "").rstrip("/") or None
+        # An object path is public if it's located under the folder of a public template
+        self.public_path_patterns = [
+            re.compile('^' + '[^/]+'.join(re.escape(part) for part in re.split(r'\{\w+\}', self.TEMPLATES[template_name])) + '/')
+            for template_name in self.PUBLIC_TEMPLATES
+        ]
 
-    def refresh_sts_session(self):
-        """
-        Refresh the STS session
-        """
-        self.s3_client_session = IamEngine(environment=self.environment).get_sts_session().client('s3', region_name=os.environ.get("AWS_S3_REGION_NAME"))
-    
-    def upload_file_to_s3(self, file : Union[File,bytes], template_name: str, placeholder_values:dict[str, Any]) -> str:
+        # Presigned URLs of the current time bucket, by S3 path
+        self.signed_urls_bucket_duration: int = getattr(settings, "AWS_S3_SIGNED_URL_BUCKET_DURATION", 60 * 60)
+        # A presigned URL dies with the STS session signing it, a bucket can't be longer than a session
+        if self.signed_urls_bucket_duration > self.credentials_provider.duration:
+            logging.warning(f"AWS_S3_SIGNED_URL_BUCKET_DURATION ({self.signed_urls_bucket_duration}s) is longer than the STS sessions, "
+                            f"clamped to {self.credentials_provider.duration}s")
+            self.signed_urls_bucket_duration = self.credentials_provider.duration
+        # URL and time (timestamp) until which it can be served, by S3 path
+        self._signed_urls: dict[str, Tuple[str, int]] = {}
+        self._signed_urls_bucket: int = None
+        self._signed_urls_lock = threading.Lock()
+
+        # Uploads : the files bigger than the threshold are sent by parts, several parts at the same time
+        self.multipart_chunksize: int = max(getattr(settings, "AWS_S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024), self.MIN_PART_SIZE)
+        self.max_concurrency: int = getattr(settings, "AWS_S3_MAX_CONCURRENCY", 4)
+        self.transfer_config = TransferConfig(multipart_threshold=getattr(settings, "AWS_S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024),
+                                              multipart_chunksize=self.multipart_chunksize,
+                                              max_concurrency=self.max_concurrency)
+        # Workers of put_many, created on the first use
+        self._uploads_executor: ThreadPoolExecutor = None
+        self._uploads_executor_lock = threading.Lock()
+
+    def upload_file_to_s3(self, file : Union[File,bytes], template_name: str, placeholder_values:dict[str, Any], file_name: str = None) -> str:
         """
-        Upload a list of files to the S3 bucket, for each file return the presigned
+        Upload a file to the S3 bucket under the path of a template and return its S3 path.
+        The file is read by chunks, the big ones are sent with a multipart upload (see transfer_config) :
+        the uploaded files spooled on disk by django are never loaded in memory and bytes are sent without being copied
         """
         # First construct the path
-        s3_path: str = self.build_s3_path(template_name, placeholder_values)
+        s3_path: str = self.build_file_path(file, template_name, placeholder_values, file_name)
 
         if isinstance(file, bytes):
-            # If the file is bytes, convert it to a file with a random name
-           django_file = File(ContentFile(file), name="random_name.jpeg")
-                
+            fileobj = io.BytesIO(file)
         else:
-            django_file = file
-            file_name = file.name
-
-        # add the file name to the path
-        s3_path = s3_path + '/' + django_file.name
+            # Django files wrap the actual file object (temporary file, in memory buffer...)
+            fileobj = getattr(file, 'file', None) or file
+            if hasattr(fileobj, 'seek'):
+                fileobj.seek(0)
 
         try:
             # Upload the file
-            self.s3_client_session.upload_fileobj(django_file, self.bucket_name, s3_path)
-            # Return the presigned URL
+            self.s3_client_session.upload_fileobj(fileobj, self.bucket_name, s3_path,
+                                                  ExtraArgs=self._upload_extra_args(template_name), Config=self.transfer_config)
             return s3_path
         except Exception as e:
             raise Exception(f"Error uploading file to S3: {e}")
-    
+
+    def build_file_path(self, file: Union[File, bytes], template_name: str, placeholder_values: dict[str, Any], file_name: str = None) -> str:
+        """
+        S3 path where upload_file_to_s3 stores a file : the path of the template followed by the file name
+        """
+        if not file_name:
+            file_name = self.DEFAULT_FILE_NAME if isinstance(file, bytes) else os.path.basename(file.name)
+        return self.build_s3_path(template_name, placeholder_values) + '/' + file_name
+
+    def put_many(self, files: Iterable[Tuple[Union[File, bytes], str, dict[str, Any]]]) -> List[str]:
+        """
+        Upload a batch of (file, template name, placeholder values) in parallel on the bounded uploads pool
+        and return their S3 paths in the same order. Raises an Exception if any of the uploads failed
+        """
+        executor = self._get_uploads_executor()
+        futures = [executor.submit(self.upload_file_to_s3, file, template_name, placeholder_values)
+                   for file, template_name, placeholder_values in files]
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise Exception(f"Error uploading {len(errors)} of {len(futures)} files to S3: {errors[0]}")
+        return [future.result() for future in futures]
+
+    def _upload_extra_args(self, template_name: str) -> Optional[dict]:
+        # The public objects are cached by the browsers and the CDN
+        return {'CacheControl': self.PUBLIC_CACHE_CONTROL} if template_name in self.PUBLIC_TEMPLATES else None
+
+    def _get_uploads_executor(self) -> ThreadPoolExecutor:
+        if self._uploads_executor is None:
+            with self._uploads_executor_lock:
+                if self._uploads_executor is None:
+                    self._uploads_executor = ThreadPoolExecutor(max_workers=getattr(settings, "AWS_S3_PUT_MANY_WORKERS", 8),
+                                                                thread_name_prefix="s3-uploads")
+        return self._uploads_executor
+
+    def copy_file_in_s3(self, source_s3_path: str, template_name: str, placeholder_values: dict[str, Any]) -> str:
+        """
+        Copy an object of the bucket under the path of a template, the copy is done by S3 without downloading the object.
+        The file name of the source is kept, returns the S3 path of the copy
+        """
+        s3_path: str = self.build_s3_path(template_name, placeholder_values) + '/' + source_s3_path.rsplit('/', 1)[-1]
+        extra_args = {'CacheControl': self.PUBLIC_CACHE_CONTROL, 'MetadataDirective': 'REPLACE'} if template_name in self.PUBLIC_TEMPLATES else None
+        try:
+            self.s3_client_session.copy({'Bucket': self.bucket_name, 'Key': source_s3_path}, self.bucket_name, s3_path,
+                                        ExtraArgs=extra_args, Config=self.transfer_config)
+            return s3_path
+        except Exception as e:
+            raise Exception(f"Error copying file in S3: {e}")
+
+    def template_prefix(self, template_name: str) -> str:
+        """
+        Static prefix of the paths of a template, the folder shared by all its objects
+        """
+        template = self.TEMPLATES.get(template_name)
+        if not template:
+            raise ValueError("Template name is invalid")
+        return re.split(r'\{\w+\}', template, maxsplit=1)[0]
+
+    def put_expiration_rule(self, template_name: str, days: int):
+        """
+        Make the bucket lifecycle expire the objects of a template after a number of days.
+        The rule is identified by the template name, the other rules of the bucket are kept
+        """
+        rule_id = f"expire-{template_name}"
+        try:
+            rules = self.s3_client_session.get_bucket_lifecycle_configuration(Bucket=self.bucket_name).get('Rules', [])
+        except self.s3_client_session.exceptions.ClientError as e:
+            # The bucket doesn't have a lifecycle configuration yet
+            if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+                raise Exception(f"Error reading the S3 lifecycle configuration: {e}")
+            rules = []
+        rules = [rule for rule in rules if rule.get('ID') != rule_id]
+        rules.append({
+            'ID': rule_id,
+            'Filter': {'Prefix': self.template_prefix(template_name)},
+            'Status': 'Enabled',
+            'Expiration': {'Days': days},
+        })
+        try:
+            self.s3_client_session.put_bucket_lifecycle_configuration(Bucket=self.bucket_name,
+                                                                      LifecycleConfiguration={'Rules': rules})
+        except Exception as e:
+            raise Exception(f"Error updating the S3 lifecycle configuration: {e}")
+
+    def get_file_from_s3(self, s3_path: str) -> bytes:
+        """
+        Download the content of an object of the bucket
+        """
+        try:
+            return self.s3_client_session.get_object(Bucket=self.bucket_name, Key=s3_path)['Body'].read()
+        except Exception as e:
+            raise Exception(f"Error downloading file from S3: {e}")
+
+    def put_objects(self, objects: dict[str, Tuple[bytes, str]]) -> List[str]:
+        """
+        Upload a batch of small objects, given as {s3 path: (content, content type)}, in parallel on the bounded uploads pool
+        and return their S3 paths. The objects under a public folder get the cache headers of the public assets
+        """
+        def put_object(s3_path: str, content: bytes, content_type: str) -> str:
+            extra_args = {'CacheControl': self.PUBLIC_CACHE_CONTROL} if any(pattern.match(s3_path) for pattern in self.public_path_patterns) else {}
+            self.s3_client_session.put_object(Bucket=self.bucket_name, Key=s3_path, Body=content, ContentType=content_type, **extra_args)
+            return s3_path
+
+        executor = self._get_uploads_executor()
+        futures = [executor.submit(put_object, s3_path, content, content_type) for s3_path, (content, content_type) in objects.items()]
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise Exception(f"Error uploading {len(errors)} of {len(futures)} files to S3: {errors[0]}")
+        return [future.result() for future in futures]
+
+    def delete_files_from_s3(self, s3_paths: Iterable[str]):
+        """
+        Delete a batch of files from S3, by requests of 1000 keys
+        """
+        s3_paths = [s3_path for s3_path in s3_paths if s3_path]
+        try:
+            for start in range(0, len(s3_paths), 1000):
+                self.s3_client_session.delete_objects(Bucket=self.bucket_name,
+                                                      Delete={'Objects': [{'Key': s3_path} for s3_path in s3_paths[start:start + 1000]],
+                                                              'Quiet': True})
+        except Exception as e:
+            raise Exception(f"Error deleting files from S3: {e}")
+
     def delete_file_from_s3(self, s3_path: str):
         """
         Delete a file from S3
@@ -151,7 +345,97 @@ class S3Engine:
         try:
             return self.s3_client_session.generate_presigned_url('get_object', Params={'Bucket': self.bucket_name, 'Key': s3_path}, ExpiresIn=expiration)
         except Exception as e:
-            raise e(f"Error generating presigned URL: {e}")    
+            raise Exception(f"Error generating presigned URL: {e}")
+
+    def _signed_url_cache_key(self, s3_path: str, time_bucket: int) -> str:
+        path_hash = hashlib.sha1(f"{self.bucket_name}/{s3_path}".encode("utf-8")).hexdigest()
+        return f"{self.SIGNED_URLS_CACHE_PREFIX}:{time_bucket}:{path_hash}"
+
+    def sign(self, s3_path: str) -> Optional[str]:
+        """
+        Returns the presigned URL of a single S3 path (see sign_many), None if the path is empty
+        """
+        return self.sign_many([s3_path]).get(s3_path)
+
+    def sign_many(self, s3_paths: Iterable[str]) -> dict[str, str]:
+        """
+        Returns the presigned URLs of the given S3 paths, by path (the empty paths are skipped).
+        The time is cut into aligned buckets, a path is signed once per bucket and its URL is memoized in the process
+        and in the shared cache : every request gets the same URL until the bucket rolls over, so the browsers and the CDN
+        can cache the images. The URLs stay valid for a whole bucket after the end of the bucket they were signed in,
+        unless the STS credentials signing them expire before : the URLs are then served for half of the remaining lifetime
+        of the credentials at most, and signed again with the refreshed credentials after that.
+        """
+        s3_paths = {s3_path for s3_path in s3_paths if s3_path}
+        if not s3_paths:
+            return {}
+
+        bucket_duration = self.signed_urls_bucket_duration
+        now = int(time.time())
+        time_bucket = now // bucket_duration
+        remaining_time = (time_bucket + 1) * bucket_duration - now
+
+        # First look in the URLs memoized by the process, they are dropped when the bucket rolls over or when they can't be served anymore
+        with self._signed_urls_lock:
+            if self._signed_urls_bucket != time_bucket:
+                self._signed_urls = {}
+                self._signed_urls_bucket = time_bucket
+            signed_urls = {s3_path: self._signed_urls[s3_path][0] for s3_path in s3_paths
+                           if s3_path in self._signed_urls and self._signed_urls[s3_path][1] > now}
+
+        missing_paths = s3_paths - signed_urls.keys()
+        if not missing_paths:
+            return signed_urls
+
+        # Then in the shared cache, and sign the paths nobody signed yet in this bucket
+        cache_keys = {self._signed_url_cache_key(s3_path, time_bucket): s3_path for s3_path in missing_paths}
+        cached_urls = cache.get_many(list(cache_keys))
+        # Read before signing : the client signs with these credentials or with newer ones
+        credentials_lifetime = self.credentials_provider.get_remaining_lifetime()
+        expiration = min(remaining_time + bucket_duration, credentials_lifetime)
+        cache_timeout = min(remaining_time, credentials_lifetime // 2)
+        memoized_urls = {}
+        for cache_key, s3_path in cache_keys.items():
+            cached_url = cached_urls.get(cache_key)
+            if cached_url is None or cached_url[1] <= now:
+                cached_url = (self.generate_presigned_s3_url(s3_path, expiration=expiration), now + cache_timeout)
+                # Another process may have signed the same path meanwhile, keep the first URL so that all of them agree
+                if cache_timeout > 0 and not cache.add(cache_key, cached_url, timeout=cache_timeout):
+                    first_url = cache.get(cache_key)
+                    if first_url is not None and first_url[1] > now:
+                        cached_url = first_url
+            signed_urls[s3_path] = cached_url[0]
+            memoized_urls[s3_path] = cached_url
+
+        with self._signed_urls_lock:
+            if self._signed_urls_bucket == time_bucket:
+                self._signed_urls.update(memoized_urls)
+        return signed_urls
+
+    def is_public_path(self, s3_path: str) -> bool:
+        """
+        Whether the object is a public asset served without signature (see PUBLIC_TEMPLATES)
+        """
+        return bool(self.public_base_url) and any(pattern.match(s3_path) for pattern in self.public_path_patterns)
+
+    def public_url(self, s3_path: str) -> str:
+        return f"{self.public_base_url}/{quote(s3_path, safe='/')}"
+
+    def url_for(self, s3_path: str) -> Optional[str]:
+        """
+        Returns the URL of a single S3 path (see urls_for), None if the path is empty
+        """
+        return self.urls_for([s3_path]).get(s3_path)
+
+    def urls_for(self, s3_paths: Iterable[str]) -> dict[str, str]:
+        """
+        Returns the URLs of the given S3 paths, by path (the empty paths are skipped) :
+        plain CDN URLs for the public objects and presigned URLs for the private ones
+        """
+        s3_paths = {s3_path for s3_path in s3_paths if s3_path}
+        urls = {s3_path: self.public_url(s3_path) for s3_path in s3_paths if self.is_public_path(s3_path)}
+        urls.update(self.sign_many(s3_paths - urls.keys()))
+        return urls
 
 
 # Instantiate the class
@@ -0,0 +1,192 @@
+# Standard imports
+import hashlib
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Iterable
+
+# Django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+
+
+###############################################################
+################ Catalog responses cache ######################
+# Every cached page records the version of the tags it touches (organization, workshop, category, theme...),
+# bumping the version of a tag makes all the pages which recorded the previous version stale at once.
+CATALOG_CACHE_PREFIX = "catalog_page"
+CATALOG_TAG_PREFIX = "catalog_tag"
+
+# A worker recomputing a page holds a lock so that the other workers wait for its result instead of hitting the database
+CATALOG_LOCK_TIMEOUT = 10
+CATALOG_LOCK_WAIT = 5
+CATALOG_LOCK_POLL_INTERVAL = 0.05
+
+# Boolean values as they come in the catalog payloads
+TRUE_VALUES = ("true", "True")
+FALSE_VALUES = ("false", "False")
+
+
+def canonicalize_value(value: Any) -> Any:
+    """
+    Normalize a parsed filter value so that equivalent filters give the same cache key :
+    id lists are deduplicated and sorted, booleans and prices get a single representation
+    """
+    if isinstance(value, (list, tuple, set)):
+        return sorted({str(item) for item in value})
+    if isinstance(value, bool):
+        return value
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    if isinstance(value, (int, float, Decimal)):
+        try:
+            return str(Decimal(str(value)).normalize())
+        except InvalidOperation:
+            return str(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def build_cache_key(namespace: str, params: dict) -> str:
+    """
+    Stable cache key of a catalog page : the namespace and the hash of the canonicalized, non empty parameters
+    """
+    canonical_params = {name: canonicalize_value(value) for name, value in params.items() if value not in (None, "", [], ())}
+    raw_key = json.dumps(canonical_params, sort_keys=True, separators=(",", ":"))
+    return f"{CATALOG_CACHE_PREFIX}:{namespace}:{hashlib.sha1(raw_key.encode('utf-8')).hexdigest()}"
+
+
+def tag(kind: str, object_id: Any = None) -> str:
+    """
+    Name of the tag of an object (e.g. organization:<uuid>), or of a whole kind of objects if no id is given
+    """
+    return f"{kind}:{object_id}" if object_id is not None else kind
+
+
+def tags_of_ids(kind: str, ids: Iterable) -> set[str]:
+    return {tag(kind, object_id) for object_id in ids or [] if object_id}
+
+
+def get_tag_versions(tags: Iterable[str]) -> dict[str, int]:
+    """
+    Current version of each tag, a tag which was never invalidated is at version 0
+    """
+    tags = list(tags)
+    versions = cache.get_many([f"{CATALOG_TAG_PREFIX}:{name}" for name in tags])
+    return {name: versions.get(f"{CATALOG_TAG_PREFIX}:{name}", 0) for name in tags}
+
+
+def invalidate_tags(tags: Iterable[str]):
+    """
+    Bump the version of the given tags, every cached page touching one of them becomes stale
+    """
+    for name in set(tags):
+        key = f"{CATALOG_TAG_PREFIX}:{name}"
+        # The tag versions never expire, otherwise a page could see its old version again
+        if cache.add(key, 1, timeout=None):
+            continue
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The version got evicted between the add and the incr
+            cache.set(key, 1, timeout=None)
+
+
+def get_fresh_entry(cache_key: str):
+    """
+    Returns the cached page if none of its tags was invalidated since it was stored, None otherwise
+    """
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None
+    if get_tag_versions(entry["tags"]) != entry["tags"]:
+        return None
+    return entry["data"]
+
+
+def invalidate_tags_on_commit(tags: Iterable[str]):
+    """
+    Bump the version of the given tags once the current transaction is committed
+    """
+    tags = set(tags)
+    if tags:
+        transaction.on_commit(lambda: invalidate_tags(tags))
+
+
+def cached_catalog_page(namespace: str,
+                        params: dict,
+                        compute: Callable[[], dict],
+                        tags_of: Callable[[dict], Iterable[str]],
+                        filter_tags: Iterable[str] = ()) -> dict:
+    """
+    Returns the catalog page computed by compute() for the given parameters, from the cache when it is fresh.
+    The page is tagged with the namespace (any change in the catalog items), the tags of the objects used as filters
+    and the tags returned by tags_of(page) for the objects displayed in the page.
+    Only one worker recomputes a missing page, the others wait for it to be stored.
+    """
+    cache_key = build_cache_key(namespace, params)
+    data = get_fresh_entry(cache_key)
+    if data is not None:
+        return data
+
+    lock_key = f"{cache_key}:lock"
+    has_lock = cache.add(lock_key, 1, timeout=CATALOG_LOCK_TIMEOUT)
+    if not has_lock:
+        # Another worker is computing the page, wait for its result and compute it ourselves if it takes too long
+        deadline = time.monotonic() + CATALOG_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(CATALOG_LOCK_POLL_INTERVAL)
+            data = get_fresh_entry(cache_key)
+            if data is not None:
+                return data
+
+    try:
+        # The versions are read before computing the page, an invalidation happening meanwhile makes it stale right away
+        tags = {tag(namespace)} | set(filter_tags)
+        tag_versions_before = get_tag_versions(tags)
+        data = compute()
+        tags |= set(tags_of(data))
+        tag_versions = {**get_tag_versions(tags), **tag_versions_before}
+        cache.set(cache_key, {"tags": tag_versions, "data": data}, getattr(settings, "CATALOG_CACHE_TIMEOUT", 120))
+        return data
+    finally:
+        if has_lock:
+            cache.delete(lock_key)
+
+
+def track_catalog_changes(model, namespace: str, kind: str, listing_fields: Iterable[str]):
+    """
+    Connect the signals invalidating the cached pages of a catalog when an instance of model is saved or deleted.
+    The pages displaying an instance are tagged with tag(kind, <id>) : a save only bumps this tag, unless the instance enters
+    or leaves the catalog (creation, deletion) or one of its listing_fields changes (the fields filtering or ordering the catalog),
+    then the namespace tag is bumped too since the instance can enter, leave or move in any page.
+    The saves with update_fields not touching listing_fields (e.g. the flags written by the images pipeline) never bump the namespace
+    """
+    listing_fields = [model._meta.get_field(name) for name in listing_fields]
+    listing_names = {name for field in listing_fields for name in (field.name, field.attname)}
+
+    def remember_listing_values(sender, instance, update_fields=None, **kwargs):
+        instance._previous_listing_values = None
+        if instance._state.adding or (update_fields is not None and not listing_names & set(update_fields)):
+            return
+        instance._previous_listing_values = (model.objects.filter(pk=instance.pk)
+                                             .values_list(*[field.attname for field in listing_fields]).first())
+
+    def invalidate_on_save(sender, instance, created=False, **kwargs):
+        tags = [tag(kind, instance.pk)]
+        previous_values = getattr(instance, '_previous_listing_values', None)
+        if created or (previous_values is not None and
+                       previous_values != tuple(getattr(instance, field.attname) for field in listing_fields)):
+            tags.append(tag(namespace))
+        invalidate_tags_on_commit(tags)
+
+    def invalidate_on_delete(sender, instance, **kwargs):
+        invalidate_tags_on_commit([tag(kind, instance.pk), tag(namespace)])
+
+    uid = f"catalog_cache_{model._meta.label_lower}"
+    pre_save.connect(remember_listing_values, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(invalidate_on_save, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(invalidate_on_delete, sender=model, weak=False, dispatch_uid=uid)
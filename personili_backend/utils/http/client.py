@@ -0,0 +1,143 @@
+# Standard imports
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from urllib.parse import urlsplit
+
+# Third party
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# settings
+from django.conf import settings
+
+
+###############################################################
+################ Outbound HTTP client #########################
+# Statuses retried with a jittered exponential backoff, the Retry-After header of the 429 and 503 responses is respected
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Number of latencies kept per host for the metrics
+LATENCY_WINDOW = 500
+
+
+class HttpClient:
+    """
+    Shared client of the outbound APIs (Stability...).
+    A single requests session keeps a pool of keep-alive connections per host, so the TCP and TLS handshakes are only paid
+    by the first calls. Every call has a connect and a read timeout, the failed calls are retried a bounded number of times
+    and the latency of each call is recorded per host.
+    """
+
+    def __init__(self,
+                 connect_timeout: float = None,
+                 read_timeout: float = None,
+                 max_retries: int = None,
+                 backoff_factor: float = None,
+                 pool_maxsize: int = None):
+        self.connect_timeout = connect_timeout if connect_timeout is not None else getattr(settings, "HTTP_CLIENT_CONNECT_TIMEOUT", 5)
+        self.read_timeout = read_timeout if read_timeout is not None else getattr(settings, "HTTP_CLIENT_READ_TIMEOUT", 60)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, "HTTP_CLIENT_MAX_RETRIES", 2)
+        self.backoff_factor = backoff_factor if backoff_factor is not None else getattr(settings, "HTTP_CLIENT_BACKOFF_FACTOR", 0.5)
+        self.pool_maxsize = pool_maxsize if pool_maxsize is not None else getattr(settings, "HTTP_CLIENT_POOL_MAXSIZE", 10)
+
+        self._local = threading.local()
+        self._latencies: dict[str, deque] = {}
+        self._errors: dict[str, int] = {}
+        self._metrics_lock = threading.Lock()
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(total=self.max_retries,
+                      connect=self.max_retries,
+                      read=0,
+                      status=self.max_retries,
+                      status_forcelist=RETRY_STATUSES,
+                      # The generation requests are POSTs, they are only retried when the API refused or failed them
+                      allowed_methods=None,
+                      backoff_factor=self.backoff_factor,
+                      backoff_jitter=self.backoff_factor,
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        # requests sessions are not thread safe, each thread gets its own session and connection pools
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._build_session()
+        return session
+
+    def request(self, method: str, url: str, timeout: Optional[tuple] = None, stream: bool = False, **kwargs: Any) -> requests.Response:
+        """
+        Send a request through the pooled session and record its latency.
+        With stream=True the body isn't downloaded, the caller reads it with iter_content and has to close the response
+        (see stream_request)
+        """
+        host = urlsplit(url).netloc
+        started_at = time.monotonic()
+        try:
+            response = self.session.request(method, url, timeout=timeout or (self.connect_timeout, self.read_timeout),
+                                            stream=stream, **kwargs)
+        except requests.RequestException:
+            self._record(host, time.monotonic() - started_at, failed=True)
+            raise
+        self._record(host, time.monotonic() - started_at, failed=not response.ok)
+        logging.debug(f"{method} {url} : HTTP {response.status_code} in {time.monotonic() - started_at:.3f}s")
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    @contextmanager
+    def stream_request(self, method: str, url: str, **kwargs: Any) -> Iterator[requests.Response]:
+        """
+        Context manager sending a request with a streamed body, the connection goes back to the pool when the block exits
+        """
+        response = self.request(method, url, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+
+    #########################################
+    #     Latency metrics                   #
+    #########################################
+    def _record(self, host: str, latency: float, failed: bool = False):
+        with self._metrics_lock:
+            self._latencies.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(latency)
+            if failed:
+                self._errors[host] = self._errors.get(host, 0) + 1
+
+    def get_latency_stats(self) -> dict:
+        """
+        Latency of the recent calls per host : number of calls, errors, average, median and 95th percentile (in seconds)
+        """
+        with self._metrics_lock:
+            latencies = {host: sorted(values) for host, values in self._latencies.items()}
+            errors = dict(self._errors)
+        return {
+            host: {
+                "calls": len(values),
+                "errors": errors.get(host, 0),
+                "avg": sum(values) / len(values),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+            for host, values in latencies.items() if values
+        }
+
+
+# Instantiate the client shared by the whole process
+http_client = HttpClient()
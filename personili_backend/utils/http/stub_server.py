@@ -0,0 +1,94 @@
+# Standard imports
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+###############################################################
+################ Local stub of the outbound APIs ##############
+class StubResponse:
+    """
+    Response returned by the stub server for a path
+    """
+
+    def __init__(self, status: int = 200, body: bytes = b"", headers: Optional[dict] = None, delay: float = 0):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.headers = headers or {}
+        self.delay = delay
+
+
+class StubServer:
+    """
+    Local HTTP server answering the outbound calls in the tests instead of the real APIs (e.g. Stability).
+    The responses are queued per path, the last one of a path is repeated once the queue is empty,
+    the received requests are kept in requests.
+
+        with StubServer() as stub:
+            stub.add("/v2beta/stable-image/generate/core", StubResponse(503), StubResponse(200, b"image", {"finish-reason": "SUCCESS"}))
+            response = http_client.post(stub.url("/v2beta/stable-image/generate/core"), data={...})
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.responses: dict[str, list[StubResponse]] = {}
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._build_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _build_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                response = stub._next_response(self.command, self.path, dict(self.headers), body)
+                if response.delay:
+                    threading.Event().wait(response.delay)
+                self.send_response(response.status)
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                self.wfile.write(response.body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _next_response(self, method: str, path: str, headers: dict, body: bytes) -> StubResponse:
+        with self._lock:
+            self.requests.append({"method": method, "path": path, "headers": headers, "body": body})
+            queue = self.responses.get(path.split("?")[0])
+            if not queue:
+                return StubResponse(404)
+            return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    def add(self, path: str, *responses: StubResponse):
+        with self._lock:
+            self.responses.setdefault(path, []).extend(responses)
+
+    def url(self, path: str = "") -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
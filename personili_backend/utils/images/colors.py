@@ -0,0 +1,113 @@
+# Third party
+from PIL import Image
+
+
+###############################################################
+################ Dominant colors ##############################
+# This module only depends on Pillow, the palettes are extracted in the worker processes of the pipeline (see utils/images/pipeline.py).
+# The colors are compared in the CIELAB space, where the euclidean distance follows the perceived difference.
+# Each palette color is indexed by its cell in a grid of the Lab space : a color searched by the shoppers matches the designs
+# having a palette color in its cell or in the neighbouring ones, with an overlap lookup on the indexed cells
+
+# Number of colors of a palette, and minimum share of the pixels of a color to be indexed
+PALETTE_SIZE = 5
+MIN_INDEXED_WEIGHT = 0.05
+# Size of the Lab grid cells : lightness (0 to 100) and a / b (-128 to 127)
+LAB_L_STEP = 10
+LAB_AB_STEP = 16
+LAB_AB_CELLS = 256 // LAB_AB_STEP
+
+# The image is reduced before the quantization, the palette doesn't need more pixels
+PALETTE_SAMPLE_SIZE = 64
+
+
+def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
+    """
+    RGB of a #rrggbb (or rrggbb) color, raises a ValueError if it's not valid
+    """
+    hex_color = hex_color.strip().lstrip('#')
+    if len(hex_color) != 6:
+        raise ValueError("Invalid hex color")
+    return int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+
+
+def rgb_to_lab(red: int, green: int, blue: int) -> tuple[float, float, float]:
+    """
+    CIELAB coordinates of a sRGB color (D65 white point)
+    """
+    def linear(channel):
+        channel = channel / 255
+        return channel / 12.92 if channel <= 0.04045 else ((channel + 0.055) / 1.055) ** 2.4
+
+    r, g, b = linear(red), linear(green), linear(blue)
+    x = (r * 0.4124564 + g * 0.3575761 + b * 0.1804375) / 0.95047
+    y = (r * 0.2126729 + g * 0.7151522 + b * 0.0721750)
+    z = (r * 0.0193339 + g * 0.1191920 + b * 0.9503041) / 1.08883
+
+    def f(t):
+        return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def lab_cell(lab: tuple[float, float, float]) -> int:
+    """
+    Index of the cell of the Lab grid holding a color
+    """
+    l_index, a_index, b_index = _lab_cell_indexes(lab)
+    return (l_index * LAB_AB_CELLS + a_index) * LAB_AB_CELLS + b_index
+
+
+def neighbour_lab_cells(lab: tuple[float, float, float]) -> list[int]:
+    """
+    Indexes of the cell of a color and of the cells around it, the colors close to it are in one of them
+    """
+    l_index, a_index, b_index = _lab_cell_indexes(lab)
+    return sorted((l * LAB_AB_CELLS + a) * LAB_AB_CELLS + b
+                  for l in range(max(l_index - 1, 0), min(l_index + 1, 100 // LAB_L_STEP) + 1)
+                  for a in range(max(a_index - 1, 0), min(a_index + 1, LAB_AB_CELLS - 1) + 1)
+                  for b in range(max(b_index - 1, 0), min(b_index + 1, LAB_AB_CELLS - 1) + 1))
+
+
+def _lab_cell_indexes(lab: tuple[float, float, float]) -> tuple[int, int, int]:
+    lightness, a, b = lab
+    return (min(max(int(lightness // LAB_L_STEP), 0), 100 // LAB_L_STEP),
+            min(max(int((a + 128) // LAB_AB_STEP), 0), LAB_AB_CELLS - 1),
+            min(max(int((b + 128) // LAB_AB_STEP), 0), LAB_AB_CELLS - 1))
+
+
+def extract_palette(image: Image.Image, size: int = PALETTE_SIZE) -> list[dict]:
+    """
+    Dominant colors of an image, the most present first : hex color, Lab coordinates (rounded) and share of the pixels.
+    The image is reduced to PALETTE_SAMPLE_SIZE pixels and quantized with median cut, the transparent pixels are ignored
+    """
+    sample = image.copy()
+    sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+    if sample.mode != "RGBA":
+        sample = sample.convert("RGBA")
+    opaque_pixels = [pixel[:3] for pixel in sample.getdata() if pixel[3] >= 128]
+    if not opaque_pixels:
+        return []
+
+    pixels = Image.new("RGB", (len(opaque_pixels), 1))
+    pixels.putdata(opaque_pixels)
+    quantized = pixels.quantize(colors=size, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+
+    colors = []
+    for count, index in sorted(quantized.getcolors(), reverse=True):
+        red, green, blue = palette[index * 3:index * 3 + 3]
+        colors.append({
+            "hex": f"#{red:02x}{green:02x}{blue:02x}",
+            "lab": [round(value, 1) for value in rgb_to_lab(red, green, blue)],
+            "weight": round(count / len(opaque_pixels), 3),
+        })
+    return colors
+
+
+def palette_cells(palette: list[dict]) -> list[int]:
+    """
+    Lab cells of the colors of a palette which are present enough to be searched
+    """
+    return sorted({lab_cell(color["lab"]) for color in palette if color["weight"] >= MIN_INDEXED_WEIGHT})
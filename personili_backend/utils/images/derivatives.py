@@ -0,0 +1,96 @@
+# Standard imports
+import io
+from typing import Optional
+
+# Third party
+from PIL import Image, ImageOps
+
+# Utils
+from utils.images.colors import PALETTE_SAMPLE_SIZE, extract_palette
+from utils.images.hashing import dhash
+
+
+###############################################################
+################ Image derivatives ############################
+# This module only depends on Pillow : build_derivatives runs in the worker processes of the pipeline (see utils/images/pipeline.py)
+
+# Longest side (in pixels) of the derivatives of an image, the images are never upscaled
+DERIVATIVE_SIZES = (256, 512, 1024)
+# Encodings of the derivatives : Pillow format, content type and save options
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Derivative served by the catalog cards
+CATALOG_SIZE = 512
+PROFILE_PICTURE_SIZE = 256
+
+
+def derivative_path(s3_path: str, size: int, image_format: str = "webp") -> str:
+    """
+    S3 path of a derivative of an image : derivatives/<file name>-<size>.<format> next to the original
+    """
+    folder, _, file_name = s3_path.rpartition('/')
+    stem = file_name.rsplit('.', 1)[0] if '.' in file_name else file_name
+    return f"{folder}/derivatives/{stem}-{size}.{image_format}"
+
+
+def derivative_paths(s3_path: str) -> list[str]:
+    """
+    S3 paths of all the derivatives of an image
+    """
+    return [derivative_path(s3_path, size, image_format) for size in DERIVATIVE_SIZES for image_format in DERIVATIVE_FORMATS]
+
+
+def derivative_or_original(s3_path: Optional[str], has_derivatives: bool, size: int = CATALOG_SIZE, image_format: str = "webp") -> Optional[str]:
+    """
+    S3 path of the derivative of an image if they were generated, otherwise of the original image
+    """
+    if not s3_path or not has_derivatives:
+        return s3_path
+    return derivative_path(s3_path, size, image_format)
+
+
+def build_derivatives(data: bytes, with_dhash: bool = False, with_palette: bool = False) -> tuple[dict[tuple[int, str], bytes], Optional[int], Optional[list]]:
+    """
+    Decode an image once and encode its derivatives, by (size, format), with the dHash of the image if with_dhash is set
+    and its dominant colors if with_palette is set.
+    The orientation of the EXIF data is applied to the pixels and no metadata (EXIF, ICC profile, comments) is kept.
+    The sizes are resized from the biggest to the smallest, each from the previous one
+    """
+    derivatives = {}
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG images are decoded directly at a reduced scale when they are much bigger than the biggest derivative
+        image.draft(image.mode, (max(DERIVATIVE_SIZES), max(DERIVATIVE_SIZES)))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        current = image.convert("RGBA" if has_alpha else "RGB")
+        current.info = {}
+        image_dhash = dhash(current) if with_dhash else None
+        palette = extract_palette(current) if with_palette else None
+
+        for size in sorted(DERIVATIVE_SIZES, reverse=True):
+            resized = current.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            current = resized
+            for image_format, (pil_format, _, options) in DERIVATIVE_FORMATS.items():
+                output = resized
+                if pil_format == "JPEG" and has_alpha:
+                    # JPEG has no transparency, the transparent pixels become white
+                    output = Image.new("RGB", resized.size, (255, 255, 255))
+                    output.paste(resized, mask=resized.getchannel("A"))
+                buffer = io.BytesIO()
+                output.save(buffer, pil_format, **options)
+                derivatives[(size, image_format)] = buffer.getvalue()
+    return derivatives, image_dhash, palette
+
+
+def analyze_image(data: bytes, with_dhash: bool = False, with_palette: bool = False) -> tuple[Optional[int], Optional[list]]:
+    """
+    dHash and dominant colors of an image whose derivatives already exist, the JPEG images are decoded at a reduced scale
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft(image.mode, (PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "PA", "P") else "RGB")
+        return dhash(image) if with_dhash else None, extract_palette(image) if with_palette else None
@@ -0,0 +1,52 @@
+# Standard imports
+import io
+
+# Third party
+from PIL import Image, ImageOps
+
+
+###############################################################
+################ Perceptual hashes ############################
+# This module only depends on Pillow, the hashes are computed in the worker processes of the pipeline (see utils/images/pipeline.py).
+# The 64 bits dHash of an image is cut in 4 bands of 16 bits : two hashes within a Hamming distance of 3 have at least one
+# identical band, so the near duplicates are found with exact lookups on the indexed bands (multi-index hashing)
+DHASH_BANDS = 4
+DHASH_BAND_BITS = 16
+# Maximum Hamming distance of the near duplicates, it can't exceed DHASH_BANDS - 1 without missing candidates
+MAX_DUPLICATE_DISTANCE = DHASH_BANDS - 1
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Difference hash of an image : the image is reduced to 9x8 grey pixels and each bit tells whether a pixel is brighter
+    than its right neighbour. Resizing, re-encoding and small color changes keep the hash (almost) identical.
+    Returned as a signed 64 bits integer, to be stored in a bigint column
+    """
+    pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def dhash_of_bytes(data: bytes) -> int:
+    """
+    Difference hash of an encoded image, the JPEG images are decoded at a reduced scale
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft(image.mode, (64, 64))
+        return dhash(ImageOps.exif_transpose(image))
+
+
+def dhash_bands(value: int) -> list[int]:
+    """
+    The 16 bits bands of a dHash, from the most significant one
+    """
+    unsigned = value & ((1 << 64) - 1)
+    mask = (1 << DHASH_BAND_BITS) - 1
+    return [(unsigned >> (DHASH_BAND_BITS * (DHASH_BANDS - 1 - band))) & mask for band in range(DHASH_BANDS)]
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin((first ^ second) & ((1 << 64) - 1)).count("1")
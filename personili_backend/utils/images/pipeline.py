@@ -0,0 +1,155 @@
+# Standard imports
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import pre_save, post_save
+
+# Utils
+from utils.aws.storage.s3_engine import s3_engine
+from utils.images.colors import palette_cells
+from utils.images.derivatives import DERIVATIVE_FORMATS, analyze_image, build_derivatives, derivative_path, derivative_paths
+from utils.images.hashing import DHASH_BANDS, dhash_bands
+
+
+###############################################################
+################ Image derivatives pipeline ###################
+# The images are decoded and encoded in a pool of processes, so the CPU work doesn't hold the GIL of the web workers.
+# The S3 transfers and the database updates are done by a few threads of the web process driving the pool.
+_processes_pool: ProcessPoolExecutor = None
+_drivers_pool: ThreadPoolExecutor = None
+_pools_lock = threading.Lock()
+
+
+def get_derivatives_pools() -> tuple[ProcessPoolExecutor, ThreadPoolExecutor]:
+    global _processes_pool, _drivers_pool
+    if _processes_pool is None:
+        with _pools_lock:
+            if _processes_pool is None:
+                processes = getattr(settings, "IMAGE_DERIVATIVES_PROCESSES", 2)
+                # The worker processes are spawned, they don't inherit the database connections and threads of the web worker
+                _drivers_pool = ThreadPoolExecutor(max_workers=processes * 2, thread_name_prefix="image-derivatives")
+                _processes_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    return _processes_pool, _drivers_pool
+
+
+def feature_values(dhash_field: str = None, image_dhash: int = None, palette_field: str = None, palette: list = None) -> dict:
+    """
+    Values of the image features columns of a model :
+    - the dHash column and its bands columns (<dhash_field>_band_<i>, see utils/images/hashing.py)
+    - the palette column and its Lab cells column (<palette_field>_cells, see utils/images/colors.py)
+    """
+    values = {}
+    if dhash_field:
+        bands = dhash_bands(image_dhash) if image_dhash is not None else [None] * DHASH_BANDS
+        values.update({dhash_field: image_dhash, **{f"{dhash_field}_band_{band}": bands[band] for band in range(DHASH_BANDS)}})
+    if palette_field:
+        values.update({palette_field: palette, f"{palette_field}_cells": palette_cells(palette) if palette is not None else []})
+    return values
+
+
+def schedule_image_derivatives(model, pk, path_field: str, flag_field: str, dhash_field: str = None, palette_field: str = None):
+    """
+    Generate the derivatives of the image of a model instance in the background once the current transaction is committed
+    """
+    transaction.on_commit(lambda: get_derivatives_pools()[1].submit(generate_image_derivatives, model, pk, path_field, flag_field,
+                                                                     dhash_field, palette_field))
+
+
+def generate_image_derivatives(model, pk, path_field: str, flag_field: str, dhash_field: str = None, palette_field: str = None) -> bool:
+    """
+    Generate and upload the derivatives of the image of a model instance, then set its derivatives flag
+    (and its dHash and palette columns when dhash_field / palette_field are given, from the same decoding of the image).
+    Returns False if the instance has no image, if the image was replaced meanwhile or if the generation failed
+    """
+    # The drivers threads have their own database connections
+    close_old_connections()
+    try:
+        s3_path = model.objects.filter(pk=pk).values_list(path_field, flat=True).first()
+        if not s3_path:
+            return False
+
+        data = s3_engine.get_file_from_s3(s3_path)
+        derivatives, image_dhash, palette = get_derivatives_pools()[0].submit(build_derivatives, data,
+                                                                              bool(dhash_field), bool(palette_field)).result()
+        s3_engine.put_objects({derivative_path(s3_path, size, image_format): (content, DERIVATIVE_FORMATS[image_format][1])
+                               for (size, image_format), content in derivatives.items()})
+
+        # Saving the flag (instead of an update) lets the signals of the model refresh what's built from its images
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None or getattr(instance, path_field) != s3_path:
+            return False
+        fields = {flag_field: True, **feature_values(dhash_field, image_dhash, palette_field, palette)}
+        for field, value in fields.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*fields, 'updated_at'])
+        return True
+    except Exception as e:
+        logging.error(f"generate_image_derivatives error for {model.__name__} {pk} :{e.args} ")
+        return False
+    finally:
+        close_old_connections()
+
+
+def generate_image_features(model, pk, path_field: str, dhash_field: str = None, palette_field: str = None) -> bool:
+    """
+    Compute the dHash and / or the palette of the image of a model instance whose derivatives already exist (backfills)
+    """
+    close_old_connections()
+    try:
+        s3_path = model.objects.filter(pk=pk).values_list(path_field, flat=True).first()
+        if not s3_path:
+            return False
+        image_dhash, palette = get_derivatives_pools()[0].submit(analyze_image, s3_engine.get_file_from_s3(s3_path),
+                                                                 bool(dhash_field), bool(palette_field)).result()
+        return bool(model.objects.filter(pk=pk, **{path_field: s3_path})
+                    .update(**feature_values(dhash_field, image_dhash, palette_field, palette)))
+    except Exception as e:
+        logging.error(f"generate_image_features error for {model.__name__} {pk} :{e.args} ")
+        return False
+    finally:
+        close_old_connections()
+
+
+def delete_image_derivatives(s3_path: str):
+    """
+    Delete the derivatives of an image, the missing ones are ignored
+    """
+    if s3_path:
+        s3_engine.delete_files_from_s3(derivative_paths(s3_path))
+
+
+def track_image_derivatives(model, path_field: str, flag_field: str, dhash_field: str = None, palette_field: str = None):
+    """
+    Connect the signals generating the derivatives of the image stored in path_field of a model when it's set or replaced.
+    flag_field tells whether the derivatives of the current image exist, the serializers fall back to the original image until then.
+    The dHash and the dominant colors of the image are stored in dhash_field and palette_field if given (see feature_values),
+    they're cleared with the flag
+    """
+    def reset_flag_on_image_change(sender, instance, update_fields=None, **kwargs):
+        if not getattr(instance, flag_field) or instance._state.adding:
+            return
+        if update_fields is not None and path_field not in update_fields:
+            return
+        previous_path = model.objects.filter(pk=instance.pk).values_list(path_field, flat=True).first()
+        if previous_path != getattr(instance, path_field):
+            reset_fields = {flag_field: False, **feature_values(dhash_field, None, palette_field, None)}
+            for field, value in reset_fields.items():
+                setattr(instance, field, value)
+            if update_fields is not None and flag_field not in update_fields:
+                # The flag isn't part of the saved fields
+                model.objects.filter(pk=instance.pk).update(**reset_fields)
+
+    def schedule_on_image_change(sender, instance, created=False, update_fields=None, **kwargs):
+        if not (created or update_fields is None or path_field in update_fields):
+            return
+        if getattr(instance, path_field) and not getattr(instance, flag_field):
+            schedule_image_derivatives(model, instance.pk, path_field, flag_field, dhash_field, palette_field)
+
+    uid = f"image_derivatives_{model._meta.label_lower}_{path_field}"
+    pre_save.connect(reset_flag_on_image_change, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(schedule_on_image_change, sender=model, weak=False, dispatch_uid=uid)
@@ -0,0 +1,166 @@
+# Standard imports
+import base64
+import binascii
+import json
+from typing import Any, Optional
+
+# Django
+from django.db.models import Count, Q, QuerySet, Window
+
+
+###############################################################
+################ Keyset (cursor) pagination ###################
+def encode_cursor(values: list[Any]) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque cursor
+    """
+    raw_cursor: str = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw_cursor.encode("utf-8")).decode("utf-8").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[list[Any]]:
+    """
+    Decode an opaque cursor back to the sort key it encodes, returns None if the cursor is not valid
+    """
+    if not isinstance(cursor, str) or not cursor:
+        return None
+    try:
+        raw_cursor = base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode("utf-8"))
+        values = json.loads(raw_cursor)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def keyset_filter(ordering: list[str], values: list[Any]) -> Q:
+    """
+    Build the filter selecting the rows located strictly after the sort key for the given ordering,
+    e.g. for ['-num_likes', 'id'] : num_likes < v1 OR (num_likes = v1 AND id > v2)
+    """
+    q_objects = Q()
+    for position, field in enumerate(ordering):
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition = Q(**{f"{field.lstrip('-')}__{lookup}": values[position]})
+        for previous_field, previous_value in zip(ordering[:position], values[:position]):
+            condition &= Q(**{previous_field.lstrip("-"): previous_value})
+        q_objects |= condition
+    return q_objects
+
+
+def paginate_by_cursor(queryset: QuerySet, ordering: list[str], cursor: Optional[str], page_size: int) -> tuple[list, Optional[str]]:
+    """
+    Returns the page of rows following the cursor (the first page if the cursor is empty) and the cursor of the next page.
+    The last field of the ordering has to be unique (usually the primary key) so that the sort key identifies a single row.
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        if values is None or len(values) != len(ordering):
+            raise ValueError("Invalid cursor")
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    # Fetch one more row to know if there is a next page
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last_row = rows[-1]
+    next_cursor = encode_cursor([getattr(last_row, field.lstrip("-")) for field in ordering])
+    return rows, next_cursor
+
+
+def parse_cursor_pagination(data, default_page_size: int = 20, max_page_size: int = 50) -> tuple[Optional[str], Optional[int]]:
+    """
+    Read the pagination parameters of a catalog request :
+    - pagination : "offset" (default) or "cursor"
+    - cursor : the cursor returned with the previous page, empty for the first page
+    - page_size : number of items per page in cursor mode
+    Returns (None, None) in offset mode and (cursor, page_size) in cursor mode, raises a ValueError if the parameters are not valid
+    """
+    pagination = data.get('pagination', None) or "offset"
+    if pagination == "offset":
+        return None, None
+    if pagination != "cursor":
+        raise ValueError("Unknown pagination mode")
+
+    cursor = data.get('cursor', None) or None
+    if cursor is not None and decode_cursor(cursor) is None:
+        raise ValueError("Invalid cursor")
+
+    page_size = data.get('page_size', None)
+    if page_size in (None, ""):
+        return cursor, default_page_size
+    if not str(page_size).isdigit() or not 0 < int(page_size) <= max_page_size:
+        raise ValueError("Invalid page size")
+    return cursor, int(page_size)
+
+
+###############################################################
+################ Page totals ##################################
+# Count modes of the catalog pages : the exact number of matching rows, or only whether there are rows after the page
+COUNT_MODE_TOTAL = "total"
+COUNT_MODE_HAS_MORE = "has_more"
+COUNT_MODES = (COUNT_MODE_TOTAL, COUNT_MODE_HAS_MORE)
+
+WINDOW_TOTAL_FIELD = "window_total_count"
+
+
+def with_window_total(queryset: QuerySet) -> QuerySet:
+    """
+    Annotate every row with the number of rows matching the queryset, computed with COUNT(*) OVER () in the query of the page
+    """
+    return queryset.annotate(**{WINDOW_TOTAL_FIELD: Window(expression=Count("*"))})
+
+
+def get_window_total(rows: list) -> int:
+    return getattr(rows[0], WINDOW_TOTAL_FIELD) if rows else 0
+
+
+def paginate_by_offset(queryset: QuerySet, ordering: list[str], offset: int, limit: int,
+                       count_mode: str = COUNT_MODE_TOTAL) -> tuple[list, Optional[int], bool]:
+    """
+    Returns the rows from offset to limit (excluded), the number of rows matching the queryset and whether there are rows after the page.
+    In total mode the number of rows comes with the page, in has_more mode it's not counted (None) and one more row is fetched instead.
+    """
+    page_size = max(limit - offset, 0)
+    if count_mode == COUNT_MODE_HAS_MORE:
+        rows = list(queryset.order_by(*ordering)[offset:limit + 1])
+        return rows[:page_size], None, len(rows) > page_size
+
+    rows = list(with_window_total(queryset).order_by(*ordering)[offset:limit])
+    if rows or not offset:
+        total = get_window_total(rows)
+    else:
+        # The page is after the last row, there's no row to read the window count from
+        total = queryset.count()
+    return rows, total, offset + len(rows) < total
+
+
+def paginate_catalog(queryset: QuerySet, ordering: list[str], offset: int, limit: int, cursor: Optional[str] = None,
+                     page_size: Optional[int] = None, count_mode: str = COUNT_MODE_TOTAL) -> tuple[list, dict]:
+    """
+    Returns the page of a catalog and the pagination infos to add to the response, with a single query for the page :
+    - offset mode (no page_size) : count in total mode, has_more in has_more mode
+    - cursor mode : next_cursor, and count on the first page in total mode (the following pages are located by the cursor)
+    Raises a ValueError if the cursor is not valid
+    """
+    if page_size:
+        count_total = count_mode == COUNT_MODE_TOTAL and not cursor
+        rows, next_cursor = paginate_by_cursor(with_window_total(queryset) if count_total else queryset, ordering, cursor, page_size)
+        page_info = {"next_cursor": next_cursor}
+        if count_total:
+            page_info["count"] = get_window_total(rows)
+        return rows, page_info
+
+    rows, total, has_more = paginate_by_offset(queryset, ordering, offset, limit, count_mode)
+    return rows, {"count": total} if count_mode == COUNT_MODE_TOTAL else {"has_more": has_more}
+
+
+def parse_count_mode(data) -> str:
+    """
+    Read the count_mode parameter of a catalog request : "total" (default) or "has_more", raises a ValueError if it's not valid
+    """
+    count_mode = data.get('count_mode', None) or COUNT_MODE_TOTAL
+    if count_mode not in COUNT_MODES:
+        raise ValueError("Unknown count mode")
+    return count_mode
@@ -0,0 +1,60 @@
+# Standard imports
+import re
+
+# Django
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Q
+
+
+###############################################################
+################ Full text search helpers #####################
+# The 'simple' configuration doesn't stem the words, the catalog mixes french, english and brand names
+SEARCH_CONFIG = "simple"
+
+# Only the letters and digits of the search term are kept to build the text search query
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_search_vector(weighted_fields: dict[str, str]) -> SearchVector:
+    """
+    Build the weighted search document from a mapping of field name to weight (A, B, C or D)
+    """
+    vector = None
+    for field_name, weight in weighted_fields.items():
+        field_vector = SearchVector(field_name, weight=weight, config=SEARCH_CONFIG)
+        vector = field_vector if vector is None else vector + field_vector
+    return vector
+
+
+def build_search_query(search_term: str):
+    """
+    Build the text search query of a search term, every word of the term has to match as a prefix
+    so that "t-shi" matches "t-shirt" while the user is still typing.
+    Returns None when the search term doesn't contain any word.
+    """
+    tokens = SEARCH_TOKEN_PATTERN.findall(search_term.lower())
+    if not tokens:
+        return None
+    return SearchQuery(" & ".join(f"{token}:*" for token in tokens), search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_filter(search_term: str, document_field: str = "search_document", text_field: str = "search_text") -> Q:
+    """
+    Filter matching either the indexed search document (whole and prefix words) or, for partial words,
+    the lower cased search text through its trigram index
+    """
+    text_filter = Q(**{f"{text_field}__contains": search_term.lower()})
+    search_query = build_search_query(search_term)
+    if search_query is None:
+        return text_filter
+    return Q(**{document_field: search_query}) | text_filter
+
+
+def search_rank(search_term: str, document_field: str = "search_document"):
+    """
+    Relevance of the search document for the search term, to be used as an annotation
+    """
+    search_query = build_search_query(search_term)
+    if search_query is None:
+        search_query = SearchQuery(search_term, config=SEARCH_CONFIG)
+    return SearchRank(F(document_field), search_query)